@@ -0,0 +1,213 @@
+import argparse
+import glob
+import io
+import os
+import sys
+from multiprocessing import Pool
+
+from lexical_analyzer.lexer import Lexer
+from syntax_analyzer.ottoc import compiled_path, write_ottoc
+from syntax_analyzer.parser import Parser
+from utils.cache import CACHE_DIR, ParseCache
+from utils.intern_pool import InternPool
+from utils.symbol_table import PrettyWriter, SymbolRows
+
+# Lexes and parses many .otto files on a process pool, e.g.
+#   python batch.py scripts/ "tests/**/*.otto" extra.otto
+# Diagnostics are printed and symbol tables written in path order, so the
+# report does not depend on which worker handled which file
+
+# Files at least this large (in bytes) are memory-mapped instead of read
+MMAP_THRESHOLD = 1 << 20
+
+# Files are handed to workers in chunks, about this many per worker: fewer
+# means less inter-process traffic, more evens out files of mixed sizes
+CHUNKS_PER_WORKER = 4
+
+OUTPUT_FILE = "symbol_table.txt"
+
+
+def parse_file(path, cache=None, pool=None, compile=False):
+    # Tokens and printed errors of one file, and whether the parser stopped
+    # at its error limit, read from cache if it has them. Lexemes are
+    # interned in pool, when given. compile also saves files without errors
+    # as compiled scripts (syntax_analyzer/ottoc.py)
+    file_name = f"<{path}>"
+
+    if cache is not None:
+        cache_key = cache.file_key(path, file_name)
+        cached = cache.get(cache_key, tree=compile)
+        if cached is not None:
+            if compile and not cached.errors:
+                write_ottoc(compiled_path(path), cached.tokens, cached.statements)
+            return cached.tokens, cached.messages, cached.stopped
+
+    if os.path.getsize(path) >= MMAP_THRESHOLD:
+        lexer = Lexer.from_mapped_file(path, file_name, pool=pool)
+    else:
+        with open(path, "r", encoding="utf-8") as file:
+            lexer = Lexer(file_name, file.read(), pool=pool)
+
+    tokens = lexer.tokenize()
+    parser = Parser(tokens)
+    statements = parser.otto_progstmt()
+
+    # UNCOMMENT WHEN DEBUGGING (delete the cache directory to reparse)
+    # for statement in statements:
+    #     print(statement)
+
+    if cache is not None:
+        cache.put(cache_key, tokens, statements, parser.errors, parser.stopped)
+
+    if compile and not parser.errors:
+        write_ottoc(compiled_path(path), tokens, statements)
+
+    return tokens, [str(error) for error in parser.errors], parser.stopped
+
+
+def symbol_table(tokens):
+    # The symbol table as main.py writes it
+    buffer = io.StringIO()
+    PrettyWriter().write(buffer, SymbolRows(tokens))
+    return buffer.getvalue()
+
+
+def error_summary(messages, stopped=False):
+    # stopped is Parser.stopped: the file has more errors than messages
+    if not messages:
+        return "Parsing completed with no errors"
+    if stopped:
+        return f"Parsing stopped after {len(messages)} errors"
+    return f"Parsing completed with {len(messages)} error(s)"
+
+
+def expand_paths(patterns):
+    # Sorted .otto files named by patterns: files, directories (searched
+    # recursively) and globs ("**" included). Raises ValueError for a
+    # pattern that names nothing
+    paths = set()
+
+    for pattern in patterns:
+        if os.path.isfile(pattern):
+            if not pattern.endswith(".otto"):
+                raise ValueError(f"File '{pattern}' is not a valid .otto file")
+            matches = [pattern]
+        else:
+            matches = glob.glob(pattern, recursive=True)
+            if not matches:
+                raise ValueError(f"File '{pattern}' does not exist")
+
+        for match in matches:
+            if os.path.isdir(match):
+                for root, _, files in os.walk(match):
+                    paths.update(os.path.join(root, name) for name in files if name.endswith(".otto"))
+            elif match.endswith(".otto"):
+                paths.add(match)
+
+    return sorted(os.path.normpath(path) for path in paths)
+
+
+class FileReport:
+    # What a worker sends back for one file. table is the rendered symbol
+    # table, None when the file could not be read or processed
+    def __init__(self, path, table, messages, cached=False, stopped=False):
+        self.path = path
+        self.table = table
+        self.messages = messages
+        self.cached = cached
+        self.stopped = stopped
+
+
+# Set once per worker process (see init_worker), so the cache's code
+# version is hashed once per worker instead of once per file, and the files
+# of a worker share one copy of each lexeme and type name
+worker_cache = None
+worker_pool = None
+worker_compile = False
+
+
+def init_worker(cache_dir, compile=False):
+    global worker_cache, worker_pool, worker_compile
+    worker_cache = ParseCache(cache_dir) if cache_dir is not None else None
+    worker_pool = InternPool()
+    worker_compile = compile
+
+
+def report_file(path):
+    hits = worker_cache.hits if worker_cache is not None else 0
+
+    try:
+        tokens, messages, stopped = parse_file(path, worker_cache, worker_pool, worker_compile)
+        table = symbol_table(tokens)
+    except (OSError, UnicodeDecodeError) as exc:
+        return FileReport(path, None, [f"ERROR: Cannot read '{path}': {exc}"])
+    except Exception as exc:
+        # A bug hit by one file is reported with that file instead of
+        # raising through the pool and stopping the whole run
+        return FileReport(path, None, [f"ERROR: Cannot process '{path}': {type(exc).__name__}: {exc}"])
+
+    cached = worker_cache is not None and worker_cache.hits > hits
+    return FileReport(path, table, messages, cached, stopped)
+
+
+def report_files(paths, jobs, cache_dir=CACHE_DIR, compile=False):
+    # FileReports in the order of paths
+    jobs = max(1, min(jobs, len(paths)))
+
+    if jobs == 1:
+        init_worker(cache_dir, compile)
+        yield from map(report_file, paths)
+        return
+
+    chunksize = max(1, len(paths) // (jobs * CHUNKS_PER_WORKER))
+    with Pool(jobs, initializer=init_worker, initargs=(cache_dir, compile)) as pool:
+        yield from pool.imap(report_file, paths, chunksize)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Lex and parse .otto files in parallel")
+    arg_parser.add_argument("paths", nargs="+", help=".otto files, directories or glob patterns")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                            help="worker processes (default: one per CPU)")
+    arg_parser.add_argument("-o", "--output", default=OUTPUT_FILE,
+                            help=f"symbol table file (default: {OUTPUT_FILE})")
+    arg_parser.add_argument("--no-cache", action="store_true",
+                            help=f"do not read or write the {CACHE_DIR} cache")
+    arg_parser.add_argument("--compile", action="store_true",
+                            help="save each file without errors as a compiled .ottoc script next to it")
+    args = arg_parser.parse_args(argv)
+
+    try:
+        paths = expand_paths(args.paths)
+    except ValueError as exc:
+        sys.exit(f"ERROR: {exc}")
+
+    cache_dir = None if args.no_cache else CACHE_DIR
+    failed = 0
+    error_count = 0
+    cached = 0
+
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        for report in report_files(paths, args.jobs, cache_dir, args.compile):
+            for message in report.messages:
+                print(message)
+
+            if report.table is None:
+                failed += 1
+                continue
+
+            if report.messages:
+                failed += 1
+                error_count += len(report.messages)
+                print(f"{report.path}: {error_summary(report.messages, report.stopped)}")
+            cached += report.cached
+
+            output_file.write(f"{report.path}\n{report.table}\n\n")
+
+    print(f"{len(paths)} file(s), {failed} with errors, {error_count} error(s) "
+          f"({cached} from cache)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
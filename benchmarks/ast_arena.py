@@ -0,0 +1,103 @@
+import pickle
+
+from benchmarks.common import best_time, generate_program
+from lexical_analyzer.lexer import Lexer
+from syntax_analyzer.arena import FIRST_NODE_KIND, ArenaVisitor, AstArena
+from syntax_analyzer.nodes import IdentifierNode
+from syntax_analyzer.parser import Parser
+
+# Parse tree as node objects (before) against the same tree in an AstArena
+# (after): walking every node, finding the identifiers (with a scan of the
+# arena's columns, and with an ArenaVisitor for comparison), and pickling
+# the tree with its tokens. Run from the project root: python -m benchmarks.ast_arena
+
+REPEAT = 3000
+
+
+def count_nodes(statements):
+    count = 0
+    stack = list(statements)
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children())
+    return count
+
+
+def count_arena_nodes(arena):
+    return sum(kind >= FIRST_NODE_KIND for kind in arena.kinds)
+
+
+def node_identifiers(statements):
+    names = []
+    stack = list(statements)
+    while stack:
+        node = stack.pop()
+        if node.__class__ is IdentifierNode:
+            names.append(node.token.value)
+        stack.extend(node.children())
+    return names
+
+
+class IdentifierVisitor(ArenaVisitor):
+    def __init__(self):
+        self.names = []
+
+    def visit_IdentifierNode(self, arena, idx):
+        self.names.append(arena.tokens.value_at(arena.token_indices[idx]))
+
+
+def visitor_identifiers(arena):
+    # The same query through the arena's cursor API
+    visitor = IdentifierVisitor()
+    visitor.visit(arena)
+    return visitor.names
+
+
+def arena_identifiers(arena):
+    # A scan of the kinds column, the names read through token_indices
+    value_at = arena.tokens.value_at
+    token_indices = arena.token_indices
+    return [value_at(token_indices[idx]) for idx in arena.find(IdentifierNode)]
+
+
+def round_trip(value):
+    return pickle.loads(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def main():
+    code = generate_program(REPEAT)
+    tokens = Lexer("<benchmark>", code).tokenize()
+    parser = Parser(tokens)
+    statements = parser.otto_progstmt()
+    if parser.errors:
+        raise SystemExit(f"Benchmark source does not parse:\n{parser.errors[0]}")
+
+    arena = AstArena.from_nodes(statements, tokens)
+    if arena.to_nodes() != statements or count_arena_nodes(arena) != count_nodes(statements):
+        raise SystemExit("Arena does not match the parse tree")
+    if sorted(arena_identifiers(arena)) != sorted(node_identifiers(statements)):
+        raise SystemExit("Arena identifiers do not match the parse tree")
+
+    print(f"{count_nodes(statements)} nodes, {len(arena)} arena entries")
+    print(f"from_nodes: {best_time(AstArena.from_nodes, statements, tokens) * 1e3:7.1f} ms")
+    print(f"to_nodes:   {best_time(arena.to_nodes) * 1e3:7.1f} ms")
+
+    cases = [
+        ("count nodes", count_nodes, statements, count_arena_nodes, arena),
+        ("identifiers", node_identifiers, statements, arena_identifiers, arena),
+        ("  (visitor)", node_identifiers, statements, visitor_identifiers, arena),
+        ("pickle", round_trip, (tokens, statements), round_trip, arena),
+    ]
+    for name, before_function, before_arg, after_function, after_arg in cases:
+        before = best_time(before_function, before_arg)
+        after = best_time(after_function, after_arg)
+        print(f"{name:12} nodes: {before * 1e3:7.1f} ms  arena: {after * 1e3:7.1f} ms  ({before / after:.1f}x)")
+
+    before = len(pickle.dumps((tokens, statements), pickle.HIGHEST_PROTOCOL))
+    after = len(pickle.dumps(arena, pickle.HIGHEST_PROTOCOL))
+    print(f"pickled size nodes: {before / 1e6:.1f} MB  arena: {after / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import time
+
+# Generated programs and timing shared by the benchmarks
+
+# One of every kind of statement, formatted with the number i of each
+# repetition so names and literals differ between repetitions
+STATEMENTS = [
+    "x{i} = {i} + y * (z - {i}) / 2;",
+    "total += price{i} ** 2 % 7;",
+    'name{i} = input("Name: ");',
+    'utter("step " + {i});',
+    "if (x{i} > {i} and not done) {{ y = [1, 2, {i}]; }} elif (y) {{ z = - x{i}; }} else {{ z = 0; }}",
+    "while (count{i} < 10) {{ count{i} += 1; }}",
+    "for item in items{i} {{ utter(item); }}",
+    "def task{i}(a, b) {{ return a + b * {i}; }}",
+    "task{i}(x, y);",
+    'execute(["Daily", "Weekly"], task{i});',
+]
+
+# Default number of timed calls, best_time keeps the fastest
+RUNS = 5
+
+
+def generate_program(repeat, statements=STATEMENTS, first=0):
+    # Source of statements repeated repeat times, numbered from first
+    return "\n".join(
+        template.format(i=i) for i in range(first, first + repeat) for template in statements
+    )
+
+
+def best_time(function, *args, runs=RUNS):
+    # Seconds taken by the fastest of runs calls of function(*args)
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
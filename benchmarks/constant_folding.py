@@ -0,0 +1,52 @@
+from benchmarks.common import RUNS, best_time, generate_program
+from lexical_analyzer.lexer import Lexer
+from syntax_analyzer.folding import fold_constants
+from syntax_analyzer.parser import Parser
+from syntax_analyzer.visitor import walk
+
+# Folding the constants of settings-like code: the nodes left in the tree,
+# and the time fold_constants() takes next to lexing and parsing.
+# Run from the project root: python -m benchmarks.constant_folding
+
+STATEMENTS = [
+    "timeout{i} = 60 * 60 * 24 + {i};",
+    'path{i} = "/var/" + "otto/" + "jobs";',
+    "limit{i} = 2 ** 10 * (1 + 1) - -{i};",
+    "ready{i} = 3 > 2 and not false;",
+    "x{i} = y * (z - {i}) / 2;",
+    'if (true) {{ utter("step " + {i}); }} else {{ utter("skipped"); }}',
+    "if (false) {{ debug{i} = 1; }} elif (x{i} > {i}) {{ y = [1, 2, {i}]; }}",
+    "while (false) {{ count{i} += 1; }}",
+    "def task{i}(a, b) {{ return a + b * (4 / 2); }}",
+]
+REPEAT = 2000
+
+
+def parse(code):
+    return Parser(Lexer("<benchmark>", code).tokenize()).otto_progstmt()
+
+
+def main():
+    code = generate_program(REPEAT, STATEMENTS)
+    parser = Parser(Lexer("<benchmark>", code).tokenize())
+    statements = parser.otto_progstmt()
+    if parser.errors:
+        raise SystemExit(f"Benchmark source does not parse:\n{parser.errors[0]}")
+
+    print(f"{len(statements)} statements")
+    before = sum(1 for _ in walk(statements))
+    after = sum(1 for _ in walk(fold_constants(statements)))
+    print(f"nodes: {before} -> {after}  ({after / before:.0%})")
+
+    parse_time = best_time(parse, code)
+
+    # Folding changes a tree in place, so each run folds a tree of its
+    # own, parsed before the timing starts
+    trees = [parse(code) for _ in range(RUNS)]
+    fold_time = best_time(lambda: fold_constants(trees.pop()))
+    print(f"lex + parse: {parse_time * 1e3:7.1f} ms")
+    print(f"folding:     {fold_time * 1e3:7.1f} ms  (+{fold_time / parse_time:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import gc
+import os
+import tempfile
+import tracemalloc
+
+from benchmarks.common import generate_program
+from lexical_analyzer.lexer import Lexer
+from syntax_analyzer.parser import Parser
+from utils.intern_pool import InternPool
+
+# Memory held by the tokens and parse trees of several generated files,
+# each lexed and parsed on its own (before) against all of them sharing
+# one InternPool, each parsed with Parser(share_leaves=True) (after), for files read
+# into a str and memory-mapped. Run from the project root:
+# python -m benchmarks.intern_memory
+
+REPEAT = 500
+FILES = 8
+
+
+def held_bytes(sources, make_lexer, share):
+    # Bytes still allocated once every file is tokenized and parsed, with
+    # the tokens and trees of all files kept alive
+    pool = InternPool() if share else None
+    results = []
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    for source in sources:
+        tokens = make_lexer(source, pool).tokenize()
+        parser = Parser(tokens, share_leaves=share)
+        statements = parser.otto_progstmt()
+        if parser.errors:
+            raise SystemExit(f"Benchmark source does not parse:\n{parser.errors[0]}")
+
+        # Walking the tokens decodes the lexemes of memory-mapped files
+        for idx in range(len(tokens)):
+            tokens.value_at(idx)
+        results.append((tokens, statements))
+
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return held
+
+
+def main():
+    sources = [
+        generate_program(REPEAT, first=n * REPEAT)
+        for n in range(FILES)
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for n, source in enumerate(sources):
+            path = os.path.join(directory, f"file{n}.otto")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(source)
+            paths.append(path)
+
+        cases = [
+            ("str", sources, lambda source, pool: Lexer("<benchmark>", source, pool=pool)),
+            ("mmap", paths, lambda path, pool: Lexer.from_mapped_file(path, pool=pool)),
+        ]
+
+        print(f"{FILES} files of {len(sources[0])} characters")
+        for name, inputs, make_lexer in cases:
+            before = held_bytes(inputs, make_lexer, False)
+            after = held_bytes(inputs, make_lexer, True)
+            print(f"{name:5} own pools:   {before / 1e6:6.1f} MB")
+            print(f"{name:5} shared pool: {after / 1e6:6.1f} MB ({1 - after / before:.0%} less)")
+
+
+if __name__ == "__main__":
+    main()
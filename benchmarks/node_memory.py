@@ -0,0 +1,68 @@
+import tracemalloc
+
+from benchmarks.common import generate_program
+from lexical_analyzer.lexer import Lexer
+from syntax_analyzer.parser import Parser
+
+# Bytes per parse tree node: slotted node classes (after) against the same
+# classes with a per-instance __dict__ (before), for the nodes of one
+# generated program. Run from the project root: python -m benchmarks.node_memory
+
+REPEAT = 3000
+
+
+def tree_nodes(statements):
+    nodes = []
+    stack = list(statements)
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(node.children())
+    return nodes
+
+
+def dict_classes(nodes):
+    # Each node class as it was before: same __init__, but no __slots__
+    classes = {}
+    for node in nodes:
+        cls = node.__class__
+        if cls not in classes:
+            classes[cls] = type(cls.__name__, (), {"__init__": cls.__init__})
+    return classes
+
+
+def copy_bytes(nodes, make):
+    # Bytes allocated by one copy of every node, fields shared
+    fields = [[getattr(node, name) for name in node.__slots__] for node in nodes]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    copies = [make(node, values) for node, values in zip(nodes, fields)]
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    # The list holding the copies is not part of any node
+    return allocated - copies.__sizeof__()
+
+
+def main():
+    code = generate_program(REPEAT)
+    parser = Parser(Lexer("<benchmark>", code).tokenize())
+    statements = parser.otto_progstmt()
+    if parser.errors:
+        raise SystemExit(f"Benchmark source does not parse:\n{parser.errors[0]}")
+
+    nodes = tree_nodes(statements)
+    classes = dict_classes(nodes)
+
+    before = copy_bytes(nodes, lambda node, values: classes[node.__class__](*values))
+    after = copy_bytes(nodes, lambda node, values: node.__class__(*values))
+
+    print(f"{len(nodes)} nodes of {len(classes)} classes, {len(statements)} statements")
+    print(f"__dict__:  {before / len(nodes):.1f} bytes/node")
+    print(f"__slots__: {after / len(nodes):.1f} bytes/node")
+    print(f"saved:     {(before - after) / 1e6:.1f} MB ({1 - after / before:.0%})")
+
+
+if __name__ == "__main__":
+    main()
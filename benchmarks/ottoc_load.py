@@ -0,0 +1,68 @@
+import os
+import pickle
+import tempfile
+
+from benchmarks.common import STATEMENTS, best_time, generate_program
+from lexical_analyzer.lexer import Lexer
+from syntax_analyzer.ottoc import load_ottoc, write_ottoc
+from syntax_analyzer.parser import Parser
+
+# Getting the tokens and parse tree of a script: lexing and parsing it,
+# unpickling them (as utils/cache.py stores them), and loading a compiled
+# .ottoc script, with and without turning its arena back into nodes.
+# Run from the project root: python -m benchmarks.ottoc_load
+
+REPEAT = 2000
+
+
+def parse(code):
+    tokens = Lexer("<benchmark>", code).tokenize()
+    return tokens, Parser(tokens).otto_progstmt()
+
+
+def unpickle(path):
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
+def load_nodes(path):
+    tokens, arena = load_ottoc(path)
+    return tokens, arena.to_nodes()
+
+
+def main():
+    # With comments, which are kept as trivia
+    code = generate_program(REPEAT, STATEMENTS + ["# running total"])
+    tokens, statements = parse(code)
+
+    with tempfile.TemporaryDirectory() as directory:
+        pickle_path = os.path.join(directory, "script.pickle")
+        with open(pickle_path, "wb") as file:
+            pickle.dump((tokens, statements), file, pickle.HIGHEST_PROTOCOL)
+
+        ottoc_path = os.path.join(directory, "script.ottoc")
+        write_ottoc(ottoc_path, tokens, statements)
+
+        loaded_tokens, arena = load_ottoc(ottoc_path)
+        spans = [(token.type, token.value, token.start) for token in tokens]
+        loaded_spans = [(token.type, token.value, token.start) for token in loaded_tokens]
+        if arena.to_nodes() != statements or loaded_spans != spans:
+            raise SystemExit("Compiled script does not match the parse")
+
+        print(f"{len(code)} characters, {len(tokens)} tokens")
+        print(f"pickle: {os.path.getsize(pickle_path) / 1e6:.1f} MB  "
+              f".ottoc: {os.path.getsize(ottoc_path) / 1e6:.1f} MB")
+
+        parse_time = best_time(parse, code)
+        cases = [
+            ("lex + parse", parse_time),
+            ("unpickle", best_time(unpickle, pickle_path)),
+            ("load .ottoc", best_time(load_ottoc, ottoc_path)),
+            ("load + to_nodes", best_time(load_nodes, ottoc_path)),
+        ]
+        for name, seconds in cases:
+            print(f"{name:16} {seconds * 1e3:8.2f} ms  ({parse_time / seconds:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import copy
+
+from benchmarks.common import best_time, generate_program
+from lexical_analyzer.constants import COMPOUND_ASSIGN_OPS
+from lexical_analyzer.lexer import Lexer
+from syntax_analyzer.parser import Parser
+
+# Per-statement cost of picking the handler in Parser.stmt: dispatch tables
+# (after) against the if-chain they replaced (before). Only the selection
+# is timed, over parsers placed at the first token of every statement of
+# a generated program beforehand, not the parsing of the statements.
+# Run from the project root: python -m benchmarks.stmt_dispatch
+
+REPEAT = 2000
+ROUNDS = 15
+
+
+def chain_select(parser):
+    # Handler the if-chain before the dispatch tables picked
+    if parser.current_type == "INVALID_TOKEN":
+        return Parser.invalid_token
+
+    if parser.current_type == "UNCLOSED_STR":
+        return Parser.invalid_token
+
+    if parser.current_type == "IDENTIFIER":
+        if parser.next_token() == "ASSIGN_OP":
+            return Parser.assign_stmt
+
+        compound_assign_ops = ("ADD_ASSIGN_OP", "SUB_ASSIGN_OP", "MUL_ASSIGN_OP",
+                               "DIV_ASSIGN_OP", "FDIV_ASSIGN_OP", "MOD_ASSIGN_OP",
+                               "POW_ASSIGN_OP")
+
+        if parser.next_token() in compound_assign_ops:
+            return Parser.assign_stmt
+
+        if parser.next_token() == "LPAREN_DELIM":
+            return Parser.function_call
+
+    elif parser.matches("KEYWORD", "utter"):
+        return Parser.output_stmt
+    elif parser.matches("KEYWORD", "if"):
+        return Parser.conditional_stmt
+    elif parser.matches("KEYWORD", "for"):
+        return Parser.for_stmt
+    elif parser.matches("KEYWORD", "while"):
+        return Parser.while_stmt
+    elif parser.matches("KEYWORD", "def"):
+        return Parser.function_def
+    elif parser.matches("KEYWORD", "return"):
+        return Parser.return_stmt
+    elif (parser.current_type == "KEYWORD" and
+          parser.current_value in ("Ottomate", "step", "test", "execute")):
+        return parser.keyword_stmts[parser.current_value]
+
+    return Parser.expr_stmt
+
+
+def table_select(parser):
+    # Handler Parser.dispatch_stmt picks, with the next token test
+    # identifier_stmt makes before it reads the statement
+    handler = parser.type_stmts.get(parser.current_type)
+    if handler is None and parser.current_type == "KEYWORD":
+        handler = parser.keyword_stmts.get(parser.current_value)
+
+    if handler is None:
+        return Parser.expr_stmt
+
+    if handler is Parser.identifier_stmt:
+        next_type = parser.next_token()
+        if next_type == "ASSIGN_OP" or next_type in COMPOUND_ASSIGN_OPS:
+            return Parser.assign_stmt
+        if next_type == "LPAREN_DELIM":
+            return Parser.function_call
+        return Parser.expr_stmt
+
+    return handler
+
+
+class RecordingParser(Parser):
+    # Keeps the index of the first token of every statement, at any depth
+    def __init__(self, tokens):
+        self.starts = []
+        super().__init__(tokens)
+
+    def stmt(self):
+        self.starts.append(self.current_idx)
+        return super().stmt()
+
+
+def placed_parsers(tokens, starts):
+    # One parser at each start index, as Parser.stmt finds it
+    base = Parser(tokens)
+    parsers = []
+    for idx in starts:
+        parser = copy.copy(base)
+        parser.token_idx = parser.current_idx = idx
+        parser.current_type = tokens.type_at(idx)
+        parsers.append(parser)
+    return parsers
+
+
+def select_all(select, parsers):
+    for parser in parsers:
+        select(parser)
+
+
+def main():
+    tokens = Lexer("<benchmark>", generate_program(REPEAT)).tokenize()
+    recorder = RecordingParser(tokens)
+    recorder.otto_progstmt()
+    if recorder.errors:
+        raise SystemExit(f"Benchmark source does not parse:\n{recorder.errors[0]}")
+
+    parsers = placed_parsers(tokens, recorder.starts)
+    for parser in parsers:
+        if chain_select(parser) is not table_select(parser):
+            raise SystemExit("The if-chain and the dispatch tables pick different handlers")
+
+    before = best_time(select_all, chain_select, parsers, runs=ROUNDS)
+    after = best_time(select_all, table_select, parsers, runs=ROUNDS)
+    count = len(parsers)
+
+    print(f"{count} statements, best of {ROUNDS}")
+    print(f"if-chain:        {before / count * 1e9:.0f} ns/statement")
+    print(f"dispatch tables: {after / count * 1e9:.0f} ns/statement")
+    print(f"speedup:         {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
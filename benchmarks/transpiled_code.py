@@ -0,0 +1,92 @@
+import tempfile
+
+from benchmarks.common import best_time, generate_program
+from benchmarks.vm_loops import PROGRAMS, RUNS
+from lexical_analyzer.lexer import Lexer
+from syntax_analyzer.folding import fold_constants
+from syntax_analyzer.parser import Parser
+from utils.cache import CodeCache
+from virtual_machine.compiler import compile_program
+from virtual_machine.transpiler import load_program, run_python
+from virtual_machine.vm import VM
+
+# Running the loop-heavy programs of vm_loops.py on the virtual machine
+# against transpiled to Python code objects, then starting a large script
+# cold (lex, parse, fold, transpile, compile) against warm, loading its
+# code object from a CodeCache. Both engines must print the same for the
+# programs, and for OUTPUT_CHECKS, which are not timed.
+# Run from the project root: python -m benchmarks.transpiled_code
+
+OUTPUT_CHECKS = {
+    "functions in lists": """
+        def first(a, b) { return a; }
+        def nothing() { }
+        items = [first, [nothing, "s", null], true, 2.5];
+        utter(items);
+        utter(first);
+        utter([[]]);
+    """,
+}
+
+STATEMENTS = [
+    "x{i} = {i} + y * (z - {i}) / 2;",
+    "total += price{i} ** 2 % 7;",
+    'name{i} = input("Name: ");',
+    'utter("step " + {i});',
+    "if (x{i} > {i} and not done) {{ y = [1, 2, {i}]; }} elif (y) {{ z = - x{i}; }} else {{ z = 0; }}",
+    "while (count{i} < 10) {{ count{i} += 1; }}",
+    "for item in items{i} {{ utter(item); }}",
+    "def task{i}(a, b) {{ c = a + b * {i}; return c; }}",
+    "r{i} = task{i}(x, y);",
+]
+REPEAT = 1000
+
+
+def execute(code):
+    lines = []
+    VM(output=lines.append).run(code)
+    return lines
+
+
+def execute_python(code, source):
+    lines = []
+    run_python(code, source, output=lines.append)
+    return lines
+
+
+def compile_both(name, source):
+    # Code for the VM and code object of a program, which must print the same
+    parser = Parser(Lexer("<benchmark>", source).tokenize())
+    code = compile_program(fold_constants(parser.otto_progstmt()))
+    python_code, _ = load_program(source, "<benchmark>")
+    if execute(code) != execute_python(python_code, source):
+        raise SystemExit(f"{name}: the virtual machine and the transpiled code disagree")
+    return code, python_code
+
+
+def main():
+    for name, source in OUTPUT_CHECKS.items():
+        compile_both(name, source)
+
+    for name, source in PROGRAMS.items():
+        code, python_code = compile_both(name, source)
+
+        before = best_time(execute, code, runs=RUNS)
+        after = best_time(execute_python, python_code, source, runs=RUNS)
+        print(f"{name + ':':17} VM {before * 1e3:7.1f} ms  "
+              f"transpiled {after * 1e3:7.1f} ms  ({before / after:.1f}x)")
+
+    source = generate_program(REPEAT, STATEMENTS)
+    with tempfile.TemporaryDirectory() as directory:
+        cache = CodeCache(directory)
+        load_program(source, "<script>", cache)
+
+        cold = best_time(load_program, source, "<script>", runs=RUNS)
+        warm = best_time(load_program, source, "<script>", cache, runs=RUNS)
+
+    print(f"\n{len(source)} characters")
+    print(f"cold start {cold * 1e3:8.2f} ms  warm start {warm * 1e3:8.2f} ms  ({cold / warm:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+from benchmarks.common import best_time, generate_program
+from lexical_analyzer.lexer import Lexer
+from syntax_analyzer.nodes import FunctionCallNode, IdentifierNode, Node
+from syntax_analyzer.parser import Parser
+from syntax_analyzer.visitor import NodeVisitor
+
+# Counting the identifiers and function calls of a tree: a hand-written
+# isinstance chain over every field (before) against NodeVisitor, both
+# its recursive visit() and its iterative walk(), which look methods up
+# in per-class tables and only follow child_fields.
+# Run from the project root: python -m benchmarks.visitor_dispatch
+
+REPEAT = 3000
+
+
+def isinstance_counts(statements):
+    # How a consumer walks the tree without a visitor
+    counts = [0, 0]
+    stack = list(statements)
+    while stack:
+        value = stack.pop()
+
+        if isinstance(value, IdentifierNode):
+            counts[0] += 1
+        elif isinstance(value, FunctionCallNode):
+            counts[1] += 1
+
+        if isinstance(value, Node):
+            stack.extend(getattr(value, name) for name in value.__slots__)
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+
+    return counts
+
+
+class CountVisitor(NodeVisitor):
+    def __init__(self):
+        self.counts = [0, 0]
+
+    def visit_IdentifierNode(self, node):
+        self.counts[0] += 1
+
+    def visit_FunctionCallNode(self, node):
+        self.counts[1] += 1
+        self.generic_visit(node)
+
+
+class CountWalker(CountVisitor):
+    # walk() goes on into the children by itself
+    def visit_FunctionCallNode(self, node):
+        self.counts[1] += 1
+
+
+def visit_counts(statements):
+    visitor = CountVisitor()
+    visitor.visit(statements)
+    return visitor.counts
+
+
+def walk_counts(statements):
+    visitor = CountWalker()
+    visitor.walk(statements)
+    return visitor.counts
+
+
+def main():
+    code = generate_program(REPEAT)
+    parser = Parser(Lexer("<benchmark>", code).tokenize())
+    statements = parser.otto_progstmt()
+    if parser.errors:
+        raise SystemExit(f"Benchmark source does not parse:\n{parser.errors[0]}")
+
+    counts = isinstance_counts(statements)
+    if visit_counts(statements) != counts or walk_counts(statements) != counts:
+        raise SystemExit("Visitors disagree with the isinstance chain")
+    print(f"{counts[0]} identifiers, {counts[1]} calls")
+
+    before = best_time(isinstance_counts, statements)
+    print(f"isinstance chain:  {before * 1e3:7.1f} ms")
+    for name, function in [("NodeVisitor.visit", visit_counts), ("NodeVisitor.walk", walk_counts)]:
+        after = best_time(function, statements)
+        print(f"{name + ':':18} {after * 1e3:7.1f} ms  ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+from benchmarks.common import best_time
+from lexical_analyzer.lexer import Lexer
+from syntax_analyzer.folding import fold_constants
+from syntax_analyzer.parser import Parser
+from syntax_analyzer.visitor import NodeVisitor
+from virtual_machine.compiler import compile_program
+from virtual_machine.vm import VM, display
+
+# Running loop-heavy programs: a straightforward tree-walking interpreter
+# (a NodeVisitor evaluating each node, with variables in dicts) against
+# compiling them to bytecode and running it on the virtual machine. Both
+# run the folded tree and must print the same.
+# Run from the project root: python -m benchmarks.vm_loops
+
+PROGRAMS = {
+    "counting loop": """
+        i = 0;
+        total = 0;
+        while (i < 200000) {
+            total += i * 3 % 7;
+            i += 1;
+        }
+        utter(total);
+    """,
+    "nested for": """
+        xs = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20];
+        count = 0;
+        for a in xs {
+            for b in xs {
+                for c in xs {
+                    if (a + b > c) { count += 1; } elif (a == c) { count -= 1; }
+                }
+            }
+        }
+        utter(count);
+    """,
+    "recursive calls": """
+        def fib(n) {
+            if (n < 2) { return n; }
+            a = fib((n - 1));
+            b = fib((n - 2));
+            return a + b;
+        }
+        result = fib(20);
+        utter(result);
+    """,
+    "calls in a loop": """
+        def advance(x, total) {
+            if (x % 2 == 0) { return total + x / 2; }
+            return total - x;
+        }
+        i = 0;
+        total = 0;
+        while (i < 50000) {
+            total = advance(i, total);
+            i += 1;
+        }
+        utter(total);
+    """,
+}
+RUNS = 3
+
+
+class Return(Exception):
+    def __init__(self, value):
+        self.value = value
+
+
+class TreeInterpreter(NodeVisitor):
+    # How the tree would be run without a compiler: visit() evaluates a
+    # node, a function call runs its body with a dict of its own
+    def __init__(self, output):
+        self.output = output
+        self.globals = {}
+        self.scope = self.globals
+
+    def lookup(self, name):
+        if name in self.scope:
+            return self.scope[name]
+        return self.globals[name]
+
+    def run(self, statements):
+        for statement in statements:
+            self.visit(statement)
+
+    def visit_ConstantNode(self, node):
+        return node.value
+
+    def visit_IdentifierNode(self, node):
+        return self.lookup(node.token.value)
+
+    def visit_ListNode(self, node):
+        return [self.visit(element) for element in node.elements]
+
+    def visit_BinaryOpNode(self, node):
+        op = node.op_token.value
+        left = self.visit(node.left_node)
+        if op == "and":
+            return left and self.visit(node.right_node)
+        if op == "or":
+            return left or self.visit(node.right_node)
+        return BINARY[op](left, self.visit(node.right_node))
+
+    def visit_UnaryOpNode(self, node):
+        value = self.visit(node.node)
+        op = node.op_token.value
+        return not value if op == "not" else -value if op == "-" else +value
+
+    def visit_AssignStmtNode(self, node):
+        name = node.identifier.value
+        value = self.visit(node.value)
+        if node.op.value != "=":
+            value = BINARY[node.op.value[:-1]](self.lookup(name), value)
+        self.scope[name] = value
+
+    def visit_OutputStmtNode(self, node):
+        self.output(display(self.visit(node.output)))
+
+    def visit_ConditionalStmtNode(self, node):
+        for condition, body in node.cases:
+            if self.visit(condition):
+                self.run(body)
+                return
+        if node.else_case is not None:
+            self.run(node.else_case)
+
+    def visit_WhileStmtNode(self, node):
+        while self.visit(node.condition):
+            self.run(node.body)
+
+    def visit_ForStmtNode(self, node):
+        items = self.visit(node.arr) if not hasattr(node.arr, "type") else self.lookup(node.arr.value)
+        for item in items:
+            self.scope[node.loop_var.value] = item
+            self.run(node.body)
+
+    def visit_FunctionDefNode(self, node):
+        self.scope[node.identifier.value] = node
+
+    def visit_ReturnStmtNode(self, node):
+        raise Return(self.visit(node.value))
+
+    def visit_FunctionCallNode(self, node):
+        function = self.visit(node.atom)
+        args = [self.visit(arg) for arg in node.args]
+
+        caller = self.scope
+        self.scope = {param.value: arg for param, arg in zip(function.params, args)}
+        try:
+            self.run(function.body)
+            return None
+        except Return as returned:
+            return returned.value
+        finally:
+            self.scope = caller
+
+
+BINARY = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": lambda a, b: a / b,
+    "//": lambda a, b: a // b,
+    "%": lambda a, b: a % b,
+    "**": lambda a, b: a ** b,
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    "<=": lambda a, b: a <= b,
+    ">=": lambda a, b: a >= b,
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+}
+
+
+def interpret(statements):
+    lines = []
+    TreeInterpreter(lines.append).run(statements)
+    return lines
+
+
+def execute(code):
+    lines = []
+    VM(output=lines.append).run(code)
+    return lines
+
+
+def main():
+    for name, source in PROGRAMS.items():
+        parser = Parser(Lexer("<benchmark>", source).tokenize())
+        statements = parser.otto_progstmt()
+        if parser.errors:
+            raise SystemExit(f"Benchmark source does not parse:\n{parser.errors[0]}")
+        fold_constants(statements)
+
+        code = compile_program(statements)
+        if execute(code) != interpret(statements):
+            raise SystemExit(f"{name}: the virtual machine and the interpreter disagree")
+
+        before = best_time(interpret, statements, runs=RUNS)
+        after = best_time(execute, code, runs=RUNS)
+        print(f"{name + ':':17} tree walker {before * 1e3:7.1f} ms  "
+              f"VM {after * 1e3:7.1f} ms  ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
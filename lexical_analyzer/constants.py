@@ -46,6 +46,13 @@ KEYWORDS = [
 
 NOISE_WORDS = ["delete", "except", "finally"]
 
+# Keyword and noise word each noise word is split into
+NOISE_WORD_PARTS = {
+    "delete": ("del", "ete"),
+    "except": ("exc", "ept"),
+    "finally": ("final", "ly"),
+}
+
 RESWORDS = ["true", "false", "null"]
 
 SYMBOL_OPERATORS = {
@@ -98,6 +105,53 @@ WORD_OPERATORS = {
     "in": "MEMBER_OP",
 }
 
+# Assignment operators that combine with the current value (x += 1)
+COMPOUND_ASSIGN_OPS = {
+    "ADD_ASSIGN_OP",
+    "SUB_ASSIGN_OP",
+    "MUL_ASSIGN_OP",
+    "DIV_ASSIGN_OP",
+    "FDIV_ASSIGN_OP",
+    "MOD_ASSIGN_OP",
+    "POW_ASSIGN_OP",
+}
+
+# Precedence of binary operators in expressions (higher binds tighter),
+# used by the parser's precedence-climbing expression parser
+BINARY_OP_PRECEDENCE = {
+    # Logical
+    "AND_OP": 1,
+    "OR_OP": 1,
+
+    # Comparison
+    "LT_OP": 2,
+    "GT_OP": 2,
+    "LTE_OP": 2,
+    "GTE_OP": 2,
+    "EQ_OP": 2,
+    "NEQ_OP": 2,
+
+    # Arithmetic
+    "ADD_OP": 3,
+    "SUB_OP": 3,
+    "MOD_OP": 4,
+    "MUL_OP": 4,
+    "DIV_OP": 4,
+    "FDIV_OP": 4,
+    "POW_OP": 5,
+}
+
+# Binary operators that group right to left (a ** b ** c == a ** (b ** c))
+RIGHT_ASSOC_OPS = ("POW_OP",)
+
+# Precedence of prefix operators: they are only accepted where an operand
+# of at most this precedence is expected, and their operand is parsed at it
+UNARY_OP_PRECEDENCE = {
+    "NOT_OP": 2,
+    "ADD_OP": 5,
+    "SUB_OP": 5,
+}
+
 DELIMITERS = {
     "(": "LPAREN_DELIM",
     ")": "RPAREN_DELIM",
@@ -108,3 +162,6 @@ DELIMITERS = {
     ";": "SEMI_DELIM",
     ",": "COMMA_DELIM"
 }
+
+# Token types kept out of the parser's token stream (see TokenStream.trivia)
+TRIVIA_TYPES = ("SL_COMMENT", "ML_COMMENT")
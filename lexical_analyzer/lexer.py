@@ -1,27 +1,278 @@
+import mmap
+import os
+from bisect import bisect_left
+
 from lexical_analyzer.constants import *
 from lexical_analyzer.regex import match_float, match_int, IDENTIFIER_REGEX
-from lexical_analyzer.position import Position
+from lexical_analyzer.position import LineIndex, MappedSource, StreamLines
+from lexical_analyzer.scanner import scan
 from lexical_analyzer.token import Token
+from lexical_analyzer.token_stream import TokenStream
+from utils.budget import DEADLINE_CHECK_INTERVAL, BudgetExceeded
+from utils.error import BudgetExceededError
+
+# "regex" scans with one precompiled pattern (see scanner.py),
+# "classic" moves one character at a time
+LEXER_ENGINES = ("regex", "classic")
 
 
 class Lexer:
-    def __init__(self, file, text):
+    # budget (utils/budget.py) turns on strict mode: tokenize() raises
+    # BudgetExceeded once it produces too many tokens or runs out of time.
+    # pool (utils/intern_pool.py) shares lexemes with other files lexed
+    # with the same pool
+    def __init__(self, file, text, engine="regex", budget=None, pool=None):
+        if engine not in LEXER_ENGINES:
+            raise ValueError(f"Unknown lexer engine '{engine}'")
+
         self.file = file
         self.text = text
-        self.pos = Position(-1, 0, -1, file, text)
+        self.engine = engine
+        self.budget = budget
+        self.pool = pool
+
+        # Bytes-like text (e.g. a memory-mapped file) is read as UTF-8
+        if isinstance(text, str):
+            self.source = LineIndex(file, text)
+        elif engine == "regex":
+            self.source = MappedSource(file, text)
+        else:
+            raise ValueError(f"Lexer engine '{engine}' only accepts str text")
+
+        self.idx = -1
         self.current_char = None
         self.advance()
 
     def advance(self):
-        self.pos.advance(self.current_char)
-        self.current_char = self.text[self.pos.idx] if self.pos.idx < len(
+        self.idx += 1
+        self.current_char = self.text[self.idx] if self.idx < len(
             self.text) else None
 
-    def tokenize(self):
+    def tokenize(self, symbols=None):
+        # symbols (a SymbolTable, see symbols.py) is filled with the
+        # lexemes of the tokens as they are scanned
+        if self.engine == "regex":
+            return self.tokenize_regex(symbols)
+
+        tokens = self.tokenize_classic()
+        if symbols is not None:
+            symbols.source = self.source
+            symbols.add_tokens(tokens)
+        return tokens
+
+    @classmethod
+    def from_mapped_file(cls, path, file=None, pool=None):
+        # Memory-maps a UTF-8 file instead of reading it, so lexemes are
+        # only decoded when the parser (or symbol table) asks for them.
+        # Token offsets are then byte offsets
+        with open(path, "rb") as fileobj:
+            if os.fstat(fileobj.fileno()).st_size:
+                text = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                text = b""  # Empty files cannot be mapped
+
+        return cls(file or path, text, pool=pool)
+
+    def tokenize_regex(self, symbols=None):
+        tokens = TokenStream(self.source, pool=self.pool)
+        append = tokens.append
+        append_trivia = tokens.append_trivia
+        text = self.text
+
+        # Comments go to the trivia stream with their lexeme left in the source
+        scanned = scan(text)
+        if self.budget is not None:
+            scanned = self.budgeted(scanned)
+
+        # Separate loops with symbols, so plain tokenize() pays nothing for them
+        if symbols is not None:
+            symbols.source = self.source
+            add_symbol = symbols.add
+
+        if isinstance(text, str) and symbols is None:
+            for type_, value, start, end in scanned:
+                if type_ in TRIVIA_TYPES:
+                    append_trivia(type_, value, start, end)
+                    continue
+
+                if value is None:
+                    value = text[start:end]
+                append(type_, value, start, end)
+
+        elif isinstance(text, str):
+            for type_, value, start, end in scanned:
+                if type_ in TRIVIA_TYPES:
+                    append_trivia(type_, value, start, end)
+                    continue
+
+                if value is None:
+                    value = text[start:end]
+                append(type_, value, start, end)
+                add_symbol(value, type_, start)
+
+        else:
+            append_raw = tokens.append_raw
+            for type_, value, start, end in scanned:
+                if type_ in TRIVIA_TYPES:
+                    append_trivia(type_, value, start, end)
+                    continue
+
+                if value is None:
+                    append_raw(type_, start, end)
+                    if symbols is not None:
+                        add_symbol(text[start:end].decode(), type_, start)
+                    continue
+
+                if not isinstance(value, str):
+                    value = value.decode()
+                append(type_, value, start, end)
+                if symbols is not None:
+                    add_symbol(value, type_, start)
+
+        # Indicates end of file
+        append("EOF", "EOF", len(text), len(text) + 1)
+        return tokens
+
+    def relex(self, previous_tokens, edit_start, edit_end, new_text):
+        # Updates previous_tokens, the TokenStream tokenize() returned for
+        # self.text, after text[edit_start:edit_end] is replaced by new_text,
+        # and returns it. self.text becomes the edited text. The changed
+        # token range is recorded for Parser.reparse (see TokenStream.splice)
+        # The scanner keeps no state but its offset, and a token only depends
+        # on its own text and the character after it. So scanning restarts at
+        # the end of the last token that ends before the edit, and stops at
+        # the first token past the edit that starts where a token of the old
+        # scan started (the rest of both texts being the same). Strings and
+        # comments that reach into the edit are rescanned whole
+        if not isinstance(self.text, str):
+            raise ValueError("Only str text can be relexed")
+        if not 0 <= edit_start <= edit_end <= len(self.text):
+            raise ValueError("Edit range is outside the text")
+
+        tokens = previous_tokens
+        trivia = tokens.trivia
+        text = self.text[:edit_start] + new_text + self.text[edit_end:]
+        shift = len(new_text) - (edit_end - edit_start)
+        edit_stop = edit_start + len(new_text)  # End of the edit in text
+
+        # End of the last token (or comment) the edit cannot affect
+        restart = 0
+        first = bisect_left(tokens.ends, edit_start)
+        if first:
+            restart = tokens.ends[first - 1]
+        first_trivia = bisect_left(trivia.ends, edit_start)
+        if first_trivia:
+            restart = max(restart, trivia.ends[first_trivia - 1])
+
+        relexed = []
+        stop = len(text)  # Rescanned up to the old EOF by default
+        for type_, value, start, end in scan(text, restart):
+            if start >= edit_stop and self.scanned_at(tokens, start - shift):
+                stop = start
+                break
+
+            if value is None and type_ not in TRIVIA_TYPES:
+                value = text[start:end]
+            relexed.append((type_, value, start, end))
+
+        tokens.splice(restart, stop - shift, relexed, shift)
+
+        self.source.edit(edit_start, edit_end, new_text, text)
+        tokens.source = trivia.source = self.source
+        self.text = text
+        self.idx = -1
+        self.advance()
+
+        return tokens
+
+    @staticmethod
+    def scanned_at(tokens, idx):
+        # Whether a token (or comment) of tokens starts at idx
+        for stream in (tokens, tokens.trivia):
+            token_idx = bisect_left(stream.starts, idx)
+            if token_idx < len(stream.starts) and stream.starts[token_idx] == idx:
+                return True
+        return False
+
+    # Strict mode
+    def budgeted(self, scanned):
+        for count, token in enumerate(scanned, 1):
+            self.check_budget(count, token[2])
+            yield token
+
+    def check_budget(self, count, idx):
+        # count tokens were produced so far, the last one starts at idx
+        budget = self.budget
+
+        if budget.max_tokens is not None and count > budget.max_tokens:
+            self.exhaust("tokens", budget.max_tokens, idx)
+
+        if count % DEADLINE_CHECK_INTERVAL == 0 and budget.expired():
+            self.exhaust("deadline", budget.timeout, idx)
+
+    def exhaust(self, limit, max_value, idx):
+        pos = self.source.position(idx)
+        raise BudgetExceeded(BudgetExceededError(pos, pos, limit, max_value))
+
+    @classmethod
+    def iter_tokens(cls, fileobj, chunk_size=65536, file="<stream>"):
+        # Lexes a text file object chunk by chunk with the regex engine.
+        # Only the unfinished tail of the input is kept between chunks, and
+        # of the line starts only those of the current token's lines
+        lines = StreamLines(file, 0, 0)
+        buffer = ""
+        offset = 0  # Offset of buffer[0] in the whole input
+        read_size = chunk_size
+        at_eof = False
+
+        while not at_eof:
+            chunk = fileobj.read(read_size)
+            at_eof = not chunk
+            buffer += chunk
+
+            consumed = 0
+            for type_, value, start, end in scan(buffer, final=at_eof):
+                if value is None:
+                    value = buffer[start:end]
+                lines = cls.stream_lines(lines, buffer, offset, consumed, start, end)
+                yield Token(type_, value, offset + start, offset + end, lines)
+                consumed = end
+
+            # A token longer than the buffer, read more before rescanning it
+            read_size = chunk_size if consumed else max(chunk_size, len(buffer))
+
+            buffer = buffer[consumed:]
+            offset += consumed
+
+        # Indicates end of file
+        end_idx = offset + len(buffer)
+        lines = cls.stream_lines(lines, buffer, offset, 0, len(buffer), len(buffer))
+        yield Token("EOF", "EOF", end_idx, source=lines)
+
+    @staticmethod
+    def stream_lines(lines, buffer, offset, scanned, start, end):
+        # StreamLines of a token at buffer[start:end], given those of the
+        # text up to buffer[scanned]. Tokens on the same lines share them
+        newline_idx = buffer.rfind("\n", scanned, start)
+        if newline_idx != -1:
+            first_ln = lines.last_ln() + buffer.count("\n", scanned, start)
+            lines = StreamLines(lines.file_name, first_ln, offset + newline_idx + 1)
+
+        # Tokens spanning lines (strings, comments)
+        newline_idx = buffer.find("\n", start, end)
+        while newline_idx != -1:
+            lines.line_starts.append(offset + newline_idx + 1)
+            newline_idx = buffer.find("\n", newline_idx + 1, end)
+
+        return lines
+
+    def tokenize_classic(self):
         # List of Token objects with attributes: type, value)
         tokens = []
 
         while self.current_char is not None:
+            if self.budget is not None:
+                self.check_budget(len(tokens) + 1, self.idx)
 
             # Ignore whitespace
             if self.current_char.isspace():
@@ -65,15 +316,15 @@ class Lexer:
 
             # Invalid char
             else:
-                tokens.append(self.make_invalid(self.pos))
+                tokens.append(self.make_invalid(self.idx))
 
         # Indicates end of file
-        tokens.append(Token("EOF", "EOF", start_pos=self.pos))
-        return tokens
+        tokens.append(Token("EOF", "EOF", self.idx, source=self.source))
+        return TokenStream.from_tokens(tokens, self.source, self.pool)
 
     # Helper methods
     def make_num(self):
-        start_pos = self.pos.copy()
+        start = self.idx
 
         num = ""
 
@@ -83,18 +334,18 @@ class Lexer:
 
         # This is when a number is used to start an identifier
         if self.current_char is not None and self.current_char in LETTERS:
-            return self.make_invalid(start_pos, num)
+            return self.make_invalid(start, num)
 
         if match_float(num):
-            return Token("FLOAT", num, start_pos, self.pos)
+            return Token("FLOAT", num, start, self.idx, self.source)
 
         if match_int(num):
-            return Token("INT", num, start_pos, self.pos)
+            return Token("INT", num, start, self.idx, self.source)
 
-        return self.make_invalid(start_pos, num)
+        return self.make_invalid(start, num)
 
     def make_word(self):
-        start_pos = self.pos.copy()
+        start = self.idx
 
         word = ""
 
@@ -103,39 +354,32 @@ class Lexer:
             self.advance()
 
         if self.current_char is not None and self.current_char not in VALID_IDENTIFIER_CHARS and self.current_char not in DELIMITERS and not self.current_char.isspace():
-            return self.make_invalid(start_pos, word)
+            return self.make_invalid(start, word)
 
         if word in WORD_OPERATORS:
-            return Token(WORD_OPERATORS[word], word, start_pos, self.pos)
+            return Token(WORD_OPERATORS[word], word, start, self.idx, self.source)
 
         if word in RESWORDS:
-            return Token("RESWORD", word, start_pos, self.pos)
+            return Token("RESWORD", word, start, self.idx, self.source)
 
         if word in KEYWORDS:
-            return Token("KEYWORD", word, start_pos, self.pos)
+            return Token("KEYWORD", word, start, self.idx, self.source)
 
         if word in NOISE_WORDS:
-            word_table = {
-                "delete": ["del", "ete"],
-                "except": ["exc", "ept"],
-                "finally": ["final", "ly"],
-            }
-
-            keyword = word_table[word][0]
-            noise_word = word_table[word][1]
+            keyword, noise_word = NOISE_WORD_PARTS[word]
 
             return [
-                Token("KEYWORD", keyword, start_pos, self.pos),
-                Token("NOISE_WORD", noise_word, start_pos, self.pos)
+                Token("KEYWORD", keyword, start, self.idx, self.source),
+                Token("NOISE_WORD", noise_word, start, self.idx, self.source)
             ]
 
         if IDENTIFIER_REGEX.match(word):
-            return Token("IDENTIFIER", word, start_pos, self.pos)
+            return Token("IDENTIFIER", word, start, self.idx, self.source)
 
-        return self.make_invalid(start_pos, word)
+        return self.make_invalid(start, word)
 
     def make_string(self, quote):
-        start_pos = self.pos.copy()
+        start = self.idx
 
         escape_chars = {
             "n": "\n",  # newline
@@ -160,7 +404,7 @@ class Lexer:
 
         # Raise error if string is not properly terminated
         if self.current_char != quote:
-            return Token("UNCLOSED_STR", f'"{str}', start_pos, self.pos)
+            return Token("UNCLOSED_STR", f'"{str}', start, self.idx, self.source)
 
         self.advance()  # Consume closing quote
 
@@ -168,21 +412,23 @@ class Lexer:
 
         # Checks if the next char is a letter (identifiers cannot start with strings)
         if self.current_char is not None and self.current_char in LETTERS:
-            return self.make_invalid(start_pos, str_with_quotes)
+            return self.make_invalid(start, str_with_quotes)
 
-        return Token("STRING", str_with_quotes, start_pos, self.pos)
+        return Token("STRING", str_with_quotes, start, self.idx, self.source)
 
     def make_operator(self, operator):
-        start_pos = self.pos.copy()
+        start = self.idx
 
         operator_type = operator
         self.advance()
 
         # If current char is just "!", it should return an invalid token
         if operator == "!" and self.current_char != "=":
-            return self.make_invalid(start_pos)
+            return self.make_invalid(start)
 
         while (self.current_char is not None) and (self.current_char in "+-*/%=<>&|^~"):
+            operator_idx = self.idx
+
             # Exponent
             if operator == "*" and self.current_char == "*":
                 operator_type += self.current_char
@@ -208,16 +454,20 @@ class Lexer:
                 operator_type += self.current_char
                 self.advance()
 
+            # Operator chars that do not combine (e.g. "+-") start a new operator
+            if self.idx == operator_idx:
+                break
+
         token = SYMBOL_OPERATORS.get(operator_type)
 
         # Checks if the next char is a letter (identifiers cannot start with special chars)
         if self.current_char is not None and self.current_char in LETTERS:
-            return self.make_invalid(start_pos, operator_type)
+            return self.make_invalid(start, operator_type)
 
-        return Token(token, operator_type, start_pos, self.pos)
+        return Token(token, operator_type, start, self.idx, self.source)
 
     def make_comment(self):
-        start_pos = self.pos.copy()
+        start = self.idx
 
         comment_text = self.current_char  # Consume opening "#"
         self.advance()
@@ -227,43 +477,44 @@ class Lexer:
             comment_text += self.current_char  # Consume opening "*"
             self.advance()
 
-            while self.current_char != "*" and self.peek() != "#":
+            while self.current_char is not None and self.current_char != "*" and self.peek() != "#":
                 comment_text += self.current_char
                 self.advance()
 
-            # Consume closing "*#"
+            # Consume closing "*#". An unterminated comment is an invalid
+            # token running to the end of the file, reported by the parser
             for _ in range(2):
+                if self.current_char is None:
+                    return Token("INVALID_TOKEN", comment_text, start, self.idx, self.source)
                 comment_text += self.current_char
                 self.advance()
 
-            return Token("ML_COMMENT", comment_text, start_pos, self.pos)
+            return Token("ML_COMMENT", comment_text, start, self.idx, self.source)
 
         # Single-line comment
         while (self.current_char is not None) and (self.current_char != "\n"):
             comment_text += self.current_char
             self.advance()
 
-        return Token("SL_COMMENT", comment_text, start_pos, self.pos)
+        return Token("SL_COMMENT", comment_text, start, self.idx, self.source)
 
     def make_delim(self):
-        start_pos = self.pos.copy()
+        start = self.idx
 
         delim_char = self.current_char
         delim_type = DELIMITERS.get(delim_char)
         self.advance()
 
-        return Token(delim_type, delim_char, start_pos, self.pos)
+        return Token(delim_type, delim_char, start, self.idx, self.source)
 
-    def make_invalid(self, start_pos, text=""):
-        # if not start_pos:
-        #     start_pos = self.pos.copy()
+    def make_invalid(self, start, text=""):
 
         while (self.current_char is not None) and (not self.current_char.isspace()):
             text += self.current_char
             self.advance()
 
-        return Token("INVALID_TOKEN", text, start_pos, self.pos)
+        return Token("INVALID_TOKEN", text, start, self.idx, self.source)
 
     def peek(self, offset=1):
-        peek_idx = self.pos.idx + offset
+        peek_idx = self.idx + offset
         return self.text[peek_idx] if peek_idx < len(self.text) else None
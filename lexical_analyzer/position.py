@@ -1,3 +1,7 @@
+from array import array
+from bisect import bisect_right
+
+
 class Position:
     def __init__(self, idx, ln, col, file_name, file_text):
         self.idx = idx
@@ -6,15 +10,146 @@ class Position:
         self.file_name = file_name
         self.file_text = file_text
 
-    def advance(self, current_char=None):
-        self.idx += 1
-        self.col += 1
+    def copy(self):
+        return Position(self.idx, self.ln, self.col, self.file_name, self.file_text)
+
 
-        if current_char == "\n":
-            self.ln += 1
-            self.col = 0
+class LineIndex:
+    # Turns character offsets into line/column positions of one source text.
+    # Line starts are only collected the first time a position is asked for
+    def __init__(self, file_name, text=None):
+        self.file_name = file_name
+        self.text = text
+        self.line_starts = None if text is not None else array("q", [0])
 
-        return self
+    def build(self):
+        line_starts = array("q", [0])
+        find = self.text.find
 
-    def copy(self):
-        return Position(self.idx, self.ln, self.col, self.file_name, self.file_text)
+        newline_idx = find("\n")
+        while newline_idx != -1:
+            line_starts.append(newline_idx + 1)
+            newline_idx = find("\n", newline_idx + 1)
+
+        self.line_starts = line_starts
+
+    def line_col(self, idx):
+        if self.line_starts is None:
+            self.build()
+
+        ln = bisect_right(self.line_starts, idx) - 1
+        return ln, idx - self.line_starts[ln]
+
+    def offset(self, ln, col):
+        # Inverse of line_col
+        if self.line_starts is None:
+            self.build()
+        return self.line_starts[ln] + col
+
+    def position(self, idx):
+        ln, col = self.line_col(idx)
+        return Position(idx, ln, col, self.file_name, self.text)
+
+    def slice(self, start, end):
+        return self.text[start:end]
+
+    def edit(self, start, end, new_text, text):
+        # Switches to text, which is self.text with [start:end] replaced by
+        # new_text. Tokens of the old text keep this index, the ones before
+        # the edit stay valid. Line starts already collected are patched
+        self.text = text
+        if self.line_starts is None:
+            return
+
+        line_starts = self.line_starts
+        first = bisect_right(line_starts, start)
+        last = bisect_right(line_starts, end)
+        shift = len(new_text) - (end - start)
+
+        patched = line_starts[:first]
+        newline_idx = new_text.find("\n")
+        while newline_idx != -1:
+            patched.append(start + newline_idx + 1)
+            newline_idx = new_text.find("\n", newline_idx + 1)
+        patched.extend(map(shift.__add__, line_starts[last:]))
+
+        self.line_starts = patched
+
+
+class StreamLines(LineIndex):
+    # LineIndex of a few consecutive lines of a streamed source, which has
+    # no text (see Lexer.iter_tokens): line first_ln starts at
+    # line_starts[0]. Each token refers to the lines it spans, so the
+    # lexer only keeps the current ones and positions stay correct for as
+    # long as the tokens are kept
+    def __init__(self, file_name, first_ln, line_start):
+        super().__init__(file_name)
+        self.first_ln = first_ln
+        self.line_starts[0] = line_start
+
+    def line_col(self, idx):
+        ln = max(bisect_right(self.line_starts, idx) - 1, 0)
+        return self.first_ln + ln, idx - self.line_starts[ln]
+
+    def offset(self, ln, col):
+        return self.line_starts[ln - self.first_ln] + col
+
+    def last_ln(self):
+        return self.first_ln + len(self.line_starts) - 1
+
+
+class MappedText:
+    # Read-only str-like view of a memory-mapped UTF-8 file, with the few
+    # methods display_squiggles needs. Offsets are byte offsets and only
+    # the slices that are asked for get decoded
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def __getitem__(self, idx):
+        return self.buffer[idx].decode("utf-8", "replace")
+
+    def find(self, sub, start=0, end=None):
+        return self.buffer.find(sub.encode(), start, len(self.buffer) if end is None else end)
+
+    def rfind(self, sub, start=0, end=None):
+        return self.buffer.rfind(sub.encode(), start, len(self.buffer) if end is None else end)
+
+    def __reduce__(self):
+        # Pickled (e.g. by utils/cache.py) with a copy of the mapped bytes
+        return MappedText, (bytes(self.buffer),)
+
+
+class MappedSource(LineIndex):
+    # LineIndex of a memory-mapped UTF-8 file. Token offsets are byte
+    # offsets, columns are still counted in characters
+    def __init__(self, file_name, buffer):
+        super().__init__(file_name, MappedText(buffer))
+        self.buffer = buffer
+
+    def build(self):
+        line_starts = array("q", [0])
+        find = self.buffer.find
+
+        newline_idx = find(b"\n")
+        while newline_idx != -1:
+            line_starts.append(newline_idx + 1)
+            newline_idx = find(b"\n", newline_idx + 1)
+
+        self.line_starts = line_starts
+
+    def line_col(self, idx):
+        ln, byte_col = super().line_col(idx)
+
+        # Offsets past the end (EOF token) count one column per byte
+        line_start = idx - byte_col
+        past_end = max(idx - len(self.buffer), 0)
+        return ln, len(self.slice(line_start, idx - past_end)) + past_end
+
+    def slice(self, start, end):
+        return self.buffer[start:end].decode("utf-8")
+
+    def __reduce__(self):
+        return MappedSource, (self.file_name, bytes(self.buffer))
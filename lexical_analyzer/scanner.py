@@ -0,0 +1,204 @@
+import re
+
+from lexical_analyzer.constants import *
+
+
+# Token type of every word that is not an identifier
+WORD_TYPES = {}
+WORD_TYPES.update((word, "KEYWORD") for word in KEYWORDS)
+WORD_TYPES.update((word, "RESWORD") for word in RESWORDS)
+WORD_TYPES.update(WORD_OPERATORS)
+WORD_TYPES.update((word, "NOISE_WORD") for word in NOISE_WORDS)
+
+ESCAPE_CHARS = {
+    "n": "\n",  # newline
+    "t": "\t",  # tab
+    "r": "\r",  # carriage return
+}
+
+# Whitespace (str.isspace) in str patterns and in UTF-8 encoded bytes
+SPACE = r"\s"
+UTF8_SPACE = (r"(?:[\t-\r\x1c-\x20]|\xc2[\x85\xa0]|\xe1\x9a\x80"
+              r"|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|\xe2\x81\x9f|\xe3\x80\x80)")
+
+
+# One alternation for every token that can be recognized without looking
+# back at the lexer state. Anything else (invalid tokens, unclosed strings,
+# multi-line comments) falls through to scan_fallback()
+def master_pattern(space):
+    return rf"""
+    (?P<WS>{space}+)
+  | (?P<FLOAT>[0-9]+\.[0-9]+)(?![0-9.A-Za-z_])
+  | (?P<INT>[0-9]+)(?![0-9.A-Za-z_])
+  | (?P<WORD>[A-Za-z][A-Za-z0-9_]*)(?={space}|[()\[\]{{}};,]|\Z)
+  | (?P<STRING>"[^"\\]*(?:\\.[^"\\]*)*"|'[^'\\]*(?:\\.[^'\\]*)*')(?![A-Za-z_])
+  | (?P<SL_COMMENT>\#(?!\*)[^\n]*)
+  | (?P<DELIM>[()\[\]{{}};,])
+  | (?P<OP>(?>\*[*=]*|/[/=]*|<[<=]*|>[>=]*|[-+%&|^~=]=*|!=+))(?![A-Za-z_])
+"""
+
+
+STRING_PATTERN = r""""[^"\\]*(?:\\.[^"\\]*)*"|'[^'\\]*(?:\\.[^'\\]*)*'"""
+
+ESCAPE_PATTERN = r"\\(.?)"
+
+
+class ScanTables:
+    # Compiled patterns and lookup tables for one kind of input: str, or
+    # UTF-8 bytes such as a memory-mapped file. Bytes lookups use bytes keys
+    # (int keys for single characters, which is what indexing bytes gives)
+    def __init__(self, is_bytes):
+        self.is_bytes = is_bytes
+
+        if is_bytes:
+            def encode(text): return text.encode()
+            def char_key(char): return ord(char)
+            space = UTF8_SPACE
+            non_space = rf"(?:(?!{UTF8_SPACE}).)*"
+        else:
+            def encode(text): return text
+            def char_key(char): return char
+            space = SPACE
+            non_space = r"\S*"
+
+        self.master = re.compile(encode(master_pattern(space)), re.VERBOSE | re.DOTALL)
+        self.string = re.compile(encode(STRING_PATTERN), re.DOTALL)
+        self.escape = re.compile(encode(ESCAPE_PATTERN), re.DOTALL)
+        self.non_space = re.compile(encode(non_space), re.DOTALL)
+
+        self.word_types = {encode(word): type_ for word, type_ in WORD_TYPES.items()}
+        self.noise_parts = {encode(word): parts for word, parts in NOISE_WORD_PARTS.items()}
+        self.operators = {encode(op): type_ for op, type_ in SYMBOL_OPERATORS.items()}
+        self.delimiters = {char_key(char): type_ for char, type_ in DELIMITERS.items()}
+        self.escape_chars = {encode(char): encode(value) for char, value in ESCAPE_CHARS.items()}
+
+        self.quotes = (encode("'"), encode('"'))
+        self.backslash = encode("\\")
+        self.hash = encode("#")
+        self.star = encode("*")
+        self.bang = encode("!")
+        self.equals = encode("=")
+
+    def unescape(self, text):
+        if self.backslash not in text:
+            return text
+
+        escape_chars = self.escape_chars
+        return self.escape.sub(lambda match: escape_chars.get(match[1], match[1]), text)
+
+
+TEXT_TABLES = ScanTables(is_bytes=False)
+BYTES_TABLES = ScanTables(is_bytes=True)
+
+
+def scan(text, pos=0, final=True):
+    # Yields (type, value, start, end) for every token in text, which is a
+    # str or a UTF-8 bytes-like object (bytes, mmap). value is None when the
+    # lexeme is exactly text[start:end], otherwise it is the processed lexeme
+    # (str for noise word parts, the type of text for everything else).
+    # When text is not final (more input may follow), scanning stops before
+    # any token that reaches the end of text, since it may continue
+    tables = TEXT_TABLES if isinstance(text, str) else BYTES_TABLES
+    length = len(text)
+    match_token = tables.master.match
+    word_types = tables.word_types
+    noise_parts = tables.noise_parts
+    delimiters = tables.delimiters
+    operators = tables.operators
+    backslash = tables.backslash
+
+    while pos < length:
+        match = match_token(text, pos)
+
+        if match is None:
+            token = scan_fallback(text, pos, tables)
+            if token[3] >= length and not final:
+                return
+
+            yield token
+            pos = token[3]
+            continue
+
+        kind = match.lastgroup
+        end = match.end()
+
+        if end >= length and not final and kind != "WS":
+            return
+
+        if kind == "WORD":
+            word = match.group()
+            word_type = word_types.get(word, "IDENTIFIER")
+
+            # Noise words are split into a keyword and its noise word
+            if word_type == "NOISE_WORD":
+                keyword, noise_word = noise_parts[word]
+                yield ("KEYWORD", keyword, pos, end)
+                yield ("NOISE_WORD", noise_word, pos, end)
+            else:
+                yield (word_type, None, pos, end)
+
+        elif kind == "DELIM":
+            yield (delimiters[text[pos]], None, pos, end)
+
+        elif kind == "OP":
+            yield (operators.get(match.group()), None, pos, end)
+
+        elif kind == "STRING":
+            string = match.group()
+            if backslash in string:
+                quote = string[:1]
+                yield ("STRING", quote + tables.unescape(string[1:-1]) + quote, pos, end)
+            else:
+                yield ("STRING", None, pos, end)
+
+        elif kind != "WS":
+            yield (kind, None, pos, end)
+
+        pos = end
+
+
+def scan_fallback(text, pos, tables=TEXT_TABLES):
+    # The token the master regex rejects, mirroring the classic lexer
+    char = text[pos:pos + 1]
+    length = len(text)
+
+    # Strings
+    if char in tables.quotes:
+        match = tables.string.match(text, pos)
+
+        # Raise error if string is not properly terminated
+        if match is None:
+            value = tables.quotes[1] + tables.unescape(text[pos + 1:])
+            return ("UNCLOSED_STR", value, pos, length)
+
+        # String followed by a letter
+        end = tables.non_space.match(text, match.end()).end()
+        string = match.group()
+        value = char + tables.unescape(string[1:-1]) + char + text[match.end():end]
+        return ("INVALID_TOKEN", value, pos, end)
+
+    # Multi-line comment: ends at the first "*" or right after the next "#".
+    # An unterminated one is an invalid token running to the end of text
+    if char == tables.hash:
+        star_idx = text.find(tables.star, pos + 2)
+        hash_idx = text.find(tables.hash, pos + 3)
+        ends = [idx + 2 for idx in (star_idx, hash_idx - 1) if idx >= pos + 2]
+        end = min(ends) if ends else length + 1
+        if end > length:
+            return ("INVALID_TOKEN", None, pos, length)
+
+        # The character after "*" may take more than one byte
+        if tables.is_bytes:
+            while end < length and text[end] & 0xC0 == 0x80:
+                end += 1
+
+        return ("ML_COMMENT", None, pos, min(end, length))
+
+    end = tables.non_space.match(text, pos).end()
+
+    # "!" that is not part of "!=" is dropped from the invalid lexeme
+    if char == tables.bang and text[pos + 1:pos + 2] != tables.equals:
+        return ("INVALID_TOKEN", text[pos + 1:end], pos, end)
+
+    # Any other invalid token runs until the next whitespace
+    return ("INVALID_TOKEN", None, pos, end)
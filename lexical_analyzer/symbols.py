@@ -0,0 +1,185 @@
+from array import array
+from bisect import bisect_left
+
+from utils.symbol_table import read_string, read_varint, write_string, write_varint
+
+# Serialized form (SymbolTable.to_bytes): magic and version, the token
+# types, then for each symbol its type index, lexeme, occurrence count and
+# the gaps between its offsets, all as varints. A lexeme appears once per
+# type it was scanned as. Tokens the lexer gives no type (e.g. "*==")
+# have type None, written as an empty type name
+SYMBOLS_MAGIC = b"OTSY"
+SYMBOLS_VERSION = 2
+
+
+class Symbol:
+    __slots__ = ("lexeme", "type", "offsets")
+
+    def __init__(self, lexeme, type_, offsets=None):
+        self.lexeme = lexeme
+        self.type = type_
+
+        # Start offsets of every occurrence, in source order
+        self.offsets = array("Q") if offsets is None else offsets
+
+    @property
+    def count(self):
+        return len(self.offsets)
+
+    def __repr__(self):
+        return f"{self.type}:{self.lexeme} x{len(self.offsets)}"
+
+
+class SymbolTable:
+    # Index of the distinct lexemes of a source, comments and EOF left out.
+    # Fill it while lexing with Lexer.tokenize(symbols=SymbolTable()), or
+    # from a TokenStream with from_tokens. There is one Symbol per lexeme
+    # and type, as the same lexeme can be scanned as different types (an
+    # identifier right after a "!" is part of an INVALID_TOKEN).
+    # Lexer.relex does not update it
+    def __init__(self, source=None):
+        # LineIndex the offsets are into, for locations()
+        self.source = source
+
+        # Symbols by (lexeme, type), by lexeme and by type, each in order
+        # of first occurrence
+        self.symbols = {}
+        self.lexemes = {}
+        self.types = {}
+
+        # Sorted lexemes for with_prefix, rebuilt after symbols are added
+        self.sorted_lexemes = None
+
+    @classmethod
+    def from_tokens(cls, tokens):
+        table = cls(tokens.source)
+        table.add_tokens(tokens)
+        return table
+
+    def add_tokens(self, tokens):
+        # Every token of a TokenStream but its EOF
+        add = self.add
+        for idx in range(len(tokens) - 1):
+            add(tokens.value_at(idx), tokens.type_at(idx), tokens.starts[idx])
+
+    def add(self, lexeme, type_, offset):
+        symbol = self.symbols.get((lexeme, type_))
+
+        if symbol is None:
+            symbol = self.add_symbol(Symbol(lexeme, type_))
+
+        symbol.offsets.append(offset)
+
+    def add_symbol(self, symbol):
+        self.symbols[symbol.lexeme, symbol.type] = symbol
+        self.lexemes.setdefault(symbol.lexeme, []).append(symbol)
+        self.types.setdefault(symbol.type, []).append(symbol)
+        self.sorted_lexemes = None
+        return symbol
+
+    # Queries
+    def get(self, lexeme, type_):
+        return self.symbols.get((lexeme, type_))
+
+    def of_lexeme(self, lexeme):
+        # Symbols of one lexeme, a single one unless it was scanned as
+        # different types
+        return list(self.lexemes.get(lexeme, ()))
+
+    def by_type(self, type_):
+        # Symbols of one token type, in order of first occurrence
+        return list(self.types.get(type_, ()))
+
+    def with_prefix(self, prefix):
+        # Symbols whose lexeme starts with prefix, sorted by lexeme
+        if self.sorted_lexemes is None:
+            self.sorted_lexemes = sorted(self.lexemes)
+
+        lexemes = self.sorted_lexemes
+        symbols = []
+
+        for idx in range(bisect_left(lexemes, prefix), len(lexemes)):
+            if not lexemes[idx].startswith(prefix):
+                break
+            symbols.extend(self.lexemes[lexemes[idx]])
+
+        return symbols
+
+    def locations(self, lexeme, type_=None):
+        # (line, column) of every occurrence of lexeme, or of lexeme
+        # scanned as type_, both 0-based and in source order
+        if type_ is None:
+            offsets = sorted(offset for symbol in self.lexemes.get(lexeme, ()) for offset in symbol.offsets)
+        else:
+            symbol = self.symbols.get((lexeme, type_))
+            offsets = symbol.offsets if symbol is not None else ()
+        return [self.source.line_col(offset) for offset in offsets]
+
+    def __contains__(self, lexeme):
+        return lexeme in self.lexemes
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __iter__(self):
+        return iter(self.symbols.values())
+
+    def __repr__(self):
+        return f"SymbolTable({len(self.symbols)} symbols)"
+
+    # Serialization
+    def to_bytes(self):
+        data = bytearray(SYMBOLS_MAGIC)
+        data.append(SYMBOLS_VERSION)
+
+        type_ids = {}
+        write_varint(data, len(self.types))
+        for type_ in self.types:
+            type_ids[type_] = len(type_ids)
+            write_string(data, "" if type_ is None else type_)
+
+        write_varint(data, len(self.symbols))
+        for symbol in self.symbols.values():
+            write_varint(data, type_ids[symbol.type])
+            write_string(data, symbol.lexeme)
+            write_varint(data, len(symbol.offsets))
+
+            previous = 0
+            for offset in symbol.offsets:
+                write_varint(data, offset - previous)
+                previous = offset
+
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data, source=None):
+        if data[:len(SYMBOLS_MAGIC)] != SYMBOLS_MAGIC or data[len(SYMBOLS_MAGIC)] != SYMBOLS_VERSION:
+            raise ValueError("Not an Otto symbol index")
+
+        table = cls(source)
+        pos = len(SYMBOLS_MAGIC) + 1
+
+        type_names = []
+        type_count, pos = read_varint(data, pos)
+        for _ in range(type_count):
+            type_, pos = read_string(data, pos)
+            type_ = type_ or None
+            type_names.append(type_)
+            table.types[type_] = []
+
+        symbol_count, pos = read_varint(data, pos)
+        for _ in range(symbol_count):
+            type_id, pos = read_varint(data, pos)
+            lexeme, pos = read_string(data, pos)
+            count, pos = read_varint(data, pos)
+
+            offsets = array("Q")
+            offset = 0
+            for _ in range(count):
+                gap, pos = read_varint(data, pos)
+                offset += gap
+                offsets.append(offset)
+
+            table.add_symbol(Symbol(lexeme, type_names[type_id], offsets))
+
+        return table
@@ -1,18 +1,24 @@
 class Token:
-    def __init__(self, type_, value, start_pos, end_pos=None):
+    __slots__ = ("type", "value", "start", "end", "source")
+
+    def __init__(self, type_, value, start, end=None, source=None):
         self.type = type_
         self.value = value
 
-        if start_pos:
-            self.start_pos = start_pos.copy()
+        # Character offsets into the source text
+        self.start = start
+        self.end = start + 1 if end is None else end
+
+        # LineIndex of the source text, used to compute positions on demand
+        self.source = source
 
-            # end_pos is not provided
-            self.end_pos = start_pos.copy()
-            self.end_pos.advance()
+    @property
+    def start_pos(self):
+        return self.source.position(self.start)
 
-        # end_pos is provided
-        if end_pos:
-            self.end_pos = end_pos.copy()
+    @property
+    def end_pos(self):
+        return self.source.position(self.end)
 
     def matches(self, type, value=None):
         return self.type == type and self.value == value
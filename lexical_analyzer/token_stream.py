@@ -0,0 +1,288 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+
+from lexical_analyzer.constants import TRIVIA_TYPES
+from lexical_analyzer.token import Token
+from utils.intern_pool import InternPool
+
+# Lexeme id of tokens whose value is read from the source when asked for
+RAW_LEXEME = 0xFFFFFFFF
+
+
+class TokenStream:
+    # Tokens stored as parallel columns: type id, start/end offsets and the
+    # id of the (interned) lexeme. Token objects are only built on request
+    def __init__(self, source=None, with_trivia=True, pool=None):
+        self.source = source
+
+        # Strings shared with other streams lexed with the same pool
+        self.pool = InternPool() if pool is None else pool
+
+        # Comments live in their own stream, each one attached to the
+        # index of the token that follows it (EOF for trailing comments)
+        self.trivia = TokenStream(source, False, self.pool) if with_trivia else None
+        self.trivia_owners = array("Q")
+
+        # Interned token types and lexemes
+        self.type_names = []
+        self.type_ids = {}
+        self.lexemes = []
+        self.lexeme_ids = {}
+
+        # Token range replaced since the last take_changed(), see splice()
+        self.changed = None
+
+        # Columns
+        self.types = array("B")
+        self.starts = array("Q")
+        self.ends = array("Q")
+        self.values = array("I")
+
+    @classmethod
+    def from_tokens(cls, tokens, source=None, pool=None):
+        stream = cls(source, pool=pool)
+
+        for token in tokens:
+            if stream.source is None:
+                stream.source = stream.trivia.source = token.source
+
+            if token.type in TRIVIA_TYPES:
+                stream.append_trivia(token.type, token.value, token.start, token.end)
+            else:
+                stream.append(token.type, token.value, token.start, token.end)
+
+        return stream
+
+    def append(self, type_, value, start, end):
+        type_id = self.type_ids.get(type_)
+        if type_id is None:
+            type_ = self.pool.intern(type_)
+            type_id = self.type_ids[type_] = len(self.type_names)
+            self.type_names.append(type_)
+
+        value_id = self.lexeme_ids.get(value)
+        if value_id is None:
+            value = self.pool.intern(value)
+            value_id = self.lexeme_ids[value] = len(self.lexemes)
+            self.lexemes.append(value)
+
+        self.types.append(type_id)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.values.append(value_id)
+
+    def append_raw(self, type_, start, end):
+        # Token whose value is exactly source[start:end]
+        type_id = self.type_ids.get(type_)
+        if type_id is None:
+            type_ = self.pool.intern(type_)
+            type_id = self.type_ids[type_] = len(self.type_names)
+            self.type_names.append(type_)
+
+        self.types.append(type_id)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.values.append(RAW_LEXEME)
+
+    def append_trivia(self, type_, value, start, end):
+        # value None means the lexeme is exactly source[start:end]
+        if value is None:
+            self.trivia.append_raw(type_, start, end)
+        else:
+            self.trivia.append(type_, value, start, end)
+        self.trivia_owners.append(len(self.types))
+
+    def splice(self, start, stop, tokens, shift):
+        # Replaces every token (comments included) that starts in
+        # source[start:stop] with tokens, (type, value, start, end) in
+        # source order, and moves the tokens after them by shift characters.
+        # Lexemes of removed tokens stay interned. The replaced range of
+        # (non-comment) tokens is added to self.changed
+        trivia = self.trivia
+        first = bisect_left(self.starts, start)
+        last = bisect_left(self.starts, stop)
+        first_trivia = bisect_left(trivia.starts, start)
+        last_trivia = bisect_left(trivia.starts, stop)
+
+        tail = self.cut(first, last, shift)
+        trivia_tail = trivia.cut(first_trivia, last_trivia, shift)
+        owners_tail = self.trivia_owners[last_trivia:]
+        del self.trivia_owners[first_trivia:]
+
+        for type_, value, token_start, token_end in tokens:
+            if type_ in TRIVIA_TYPES:
+                self.append_trivia(type_, value, token_start, token_end)
+            else:
+                self.append(type_, value, token_start, token_end)
+
+        # Comments after the splice keep pointing at the same tokens
+        owner_shift = len(self.types) - last
+        self.trivia_owners.extend(map(owner_shift.__add__, owners_tail))
+
+        self.record_change(first, last, len(self.types), shift)
+        self.paste(tail)
+        trivia.paste(trivia_tail)
+
+    def record_change(self, first, old_stop, new_stop, shift):
+        # Tokens first..old_stop-1 were replaced by first..new_stop-1 and
+        # the ones after them moved by shift characters. Composed with the
+        # change already recorded, so self.changed always describes the
+        # tokens before take_changed() was last called
+        if self.changed is not None:
+            first_0, old_stop_0, new_stop_0, shift_0 = self.changed
+
+            # First token after both changes, in between coordinates
+            edge = max(old_stop, new_stop_0)
+
+            first = min(first, first_0)
+            old_stop, new_stop = edge - (new_stop_0 - old_stop_0), edge + (new_stop - old_stop)
+            shift += shift_0
+
+        self.changed = (first, old_stop, new_stop, shift)
+
+    def take_changed(self):
+        # (first, old_stop, new_stop, shift) since the last call, or None
+        changed = self.changed
+        self.changed = None
+        return changed
+
+    def cut(self, first, last, shift):
+        # Drops the tokens from first on, returning the columns of the ones
+        # from last on with their offsets moved by shift
+        starts = self.starts[last:]
+        ends = self.ends[last:]
+        if shift:
+            starts = array("Q", map(shift.__add__, starts))
+            ends = array("Q", map(shift.__add__, ends))
+        tail = (self.types[last:], starts, ends, self.values[last:])
+
+        del self.types[first:]
+        del self.starts[first:]
+        del self.ends[first:]
+        del self.values[first:]
+        return tail
+
+    def paste(self, columns):
+        types, starts, ends, values = columns
+        self.types.extend(types)
+        self.starts.extend(starts)
+        self.ends.extend(ends)
+        self.values.extend(values)
+
+    def trivia_range(self, idx):
+        # Indices into self.trivia of the comments right before token idx
+        owners = self.trivia_owners
+        return range(bisect_left(owners, idx), bisect_right(owners, idx))
+
+    # Cursor API, returns None for out of range indices
+    def has_token(self, idx):
+        return 0 <= idx < len(self.types)
+
+    def type_at(self, idx):
+        if 0 <= idx < len(self.types):
+            return self.type_names[self.types[idx]]
+        return None
+
+    def value_at(self, idx):
+        if 0 <= idx < len(self.types):
+            value_id = self.values[idx]
+            if value_id == RAW_LEXEME:
+                return self.pool.intern(self.source.slice(self.starts[idx], self.ends[idx]))
+            return self.lexemes[value_id]
+        return None
+
+    def token_at(self, idx):
+        if 0 <= idx < len(self.types):
+            value_id = self.values[idx]
+            if value_id == RAW_LEXEME:
+                value = self.pool.intern(self.source.slice(self.starts[idx], self.ends[idx]))
+            else:
+                value = self.lexemes[value_id]
+
+            return Token(
+                self.type_names[self.types[idx]],
+                value,
+                self.starts[idx],
+                self.ends[idx],
+                self.source
+            )
+        return None
+
+    # Sequence API, compatible with a list of Token objects
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self.token_at(i) for i in range(*idx.indices(len(self)))]
+
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("token index out of range")
+
+        return self.token_at(idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.token_at(idx)
+
+    def __repr__(self):
+        return f"TokenStream({len(self)} tokens)"
+
+    # A shared pool can hold the strings of many other files, so it is
+    # not pickled (e.g. by utils/cache.py) with the stream
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["pool"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pool = self.trivia.pool if self.trivia is not None else InternPool()
+
+
+class TokenBuffer:
+    # Cursor API over a token iterator (e.g. Lexer.iter_tokens), so the
+    # parser can consume streamed tokens. Only the token before the one
+    # last asked for is kept, which covers the parser's single lookahead.
+    # Comments are dropped, streamed input keeps no trivia
+    def __init__(self, tokens):
+        self.tokens = (token for token in tokens if token.type not in TRIVIA_TYPES)
+        self.window = deque()
+        self.offset = 0  # Index of window[0]
+
+    def has_token(self, idx):
+        if idx < 0:
+            return False
+
+        # Read tokens up to idx
+        while self.offset + len(self.window) <= idx:
+            token = next(self.tokens, None)
+            if token is None:
+                break
+            self.window.append(token)
+
+        # Drop tokens the parser can no longer ask for
+        last_idx = min(idx, self.offset + len(self.window) - 1)
+        while self.offset < last_idx - 1:
+            self.window.popleft()
+            self.offset += 1
+
+        return self.offset <= idx < self.offset + len(self.window)
+
+    def type_at(self, idx):
+        if self.has_token(idx):
+            return self.window[idx - self.offset].type
+        return None
+
+    def value_at(self, idx):
+        if self.has_token(idx):
+            return self.window[idx - self.offset].value
+        return None
+
+    def token_at(self, idx):
+        if self.has_token(idx):
+            return self.window[idx - self.offset]
+        return None
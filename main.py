@@ -1,11 +1,11 @@
 import os
 import sys
-from tabulate import tabulate
 
-from lexical_analyzer.lexer import Lexer
-from syntax_analyzer.parser import Parser
+from batch import error_summary, parse_file
+from utils.cache import ParseCache
+from utils.symbol_table import write_symbol_table
 
-# Register otto file here
+# Register otto file here (batch.py lexes and parses many files at once)
 FILE_PATH = "test.otto"
 
 
@@ -17,38 +17,18 @@ if not FILE_PATH.endswith(".otto"):
 
 
 # File is valid
-symbol_table = []  # To store lexemes and tokens
+# LEXER and PARSER: Generate list of tokens and parse tree. Results of
+# files parsed before are read back from the cache, keyed by the file
+# contents (see utils/cache.py)
+tokens, messages, stopped = parse_file(FILE_PATH, ParseCache())
 
-# Process and scan file for tokens
-with open(FILE_PATH, "r", encoding="utf-8") as file:
-    code = file.read()
+for message in messages:
+    print(message)
+print(error_summary(messages, stopped))
 
-    # LEXER: Generate list of tokens
-    lexer = Lexer(f"<{FILE_PATH}>", code)
-    tokens = lexer.tokenize()
-
-    # Extract lexemes & tokens to symbol table
-    for token in tokens:
-        lexeme = token.value.strip()
-        token_type = token.type
-        symbol_table.append([lexeme, token_type])
-
-    # PARSER: Generate parse tree
-    parser = Parser(tokens)
-    ast = parser.otto_progstmt()
-
-    # UNCOMMENT WHEN DEBUGGING
-    # for statement in ast:
-    #     print(statement)
-
-    if parser.error:
-        print(parser.error)
-    else:
-        print("Parsing completed with no errors")
-
-# Write symbol table to output file
+# Write symbol table to output file, as a "pretty" table or in one of
+# the formats of utils/symbol_table.py ("tsv", "jsonl" or "binary")
 OUTPUT_FILE = "symbol_table.txt"
+OUTPUT_FORMAT = "pretty"
 
-with open(OUTPUT_FILE, "w", encoding="utf-8") as output_file:
-    output_file.write(tabulate(symbol_table, headers=[
-                      "LEXEME", "TOKEN"], tablefmt="pretty"))
+write_symbol_table(OUTPUT_FILE, tokens, OUTPUT_FORMAT)
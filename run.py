@@ -0,0 +1,85 @@
+import argparse
+import dis
+import sys
+
+from lexical_analyzer.lexer import Lexer
+from syntax_analyzer.folding import fold_constants
+from syntax_analyzer.parser import Parser
+from utils.cache import CACHE_DIR, CodeCache
+from virtual_machine.bytecode import disassemble
+from virtual_machine.compiler import CompilerPanic, compile_program
+from virtual_machine.transpiler import load_program, run_python
+from virtual_machine.vm import VM, VMPanic
+
+# Runs an Otto program, e.g.
+#   python run.py test.otto
+# The program is parsed, folded, compiled to bytecode and run on the
+# virtual machine (see virtual_machine/). With --engine python it is
+# transpiled to a Python code object instead, which is cached in
+# .otto_cache/ so an unchanged file starts without being parsed again.
+# Syntax, compile and runtime errors are printed and make the exit
+# status 1
+
+
+def print_errors(errors):
+    for error in errors:
+        print(error)
+    return 1
+
+
+def run_vm(source, file_name, show_code):
+    parser = Parser(Lexer(file_name, source).tokenize())
+    statements = parser.otto_progstmt()
+    if parser.errors:
+        return print_errors(parser.errors)
+
+    code = compile_program(fold_constants(statements))
+    if show_code:
+        print(disassemble(code))
+    else:
+        VM().run(code)
+    return 0
+
+
+def run_transpiled(source, file_name, show_code, cache):
+    code, errors = load_program(source, file_name, cache)
+    if errors:
+        return print_errors(errors)
+
+    if show_code:
+        dis.dis(code)
+    else:
+        run_python(code, source)
+    return 0
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Run an .otto program")
+    arg_parser.add_argument("path", help=".otto file to run")
+    arg_parser.add_argument("--engine", choices=("vm", "python"), default="vm",
+                            help="run on the virtual machine (default) or as transpiled Python code")
+    arg_parser.add_argument("--dis", action="store_true",
+                            help="print the compiled code instead of running it")
+    arg_parser.add_argument("--no-cache", action="store_true",
+                            help=f"do not read or write the {CACHE_DIR} cache (python engine)")
+    args = arg_parser.parse_args(argv)
+
+    try:
+        with open(args.path, "r", encoding="utf-8") as file:
+            source = file.read()
+    except OSError as exc:
+        sys.exit(f"ERROR: {exc}")
+
+    file_name = f"<{args.path}>"
+    try:
+        if args.engine == "vm":
+            return run_vm(source, file_name, args.dis)
+
+        cache = None if args.no_cache else CodeCache()
+        return run_transpiled(source, file_name, args.dis, cache)
+    except (CompilerPanic, VMPanic) as panic:
+        return print_errors([panic.error])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
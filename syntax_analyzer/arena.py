@@ -0,0 +1,329 @@
+from array import array
+from bisect import bisect_left
+
+from lexical_analyzer.token import Token
+from syntax_analyzer.nodes import Node
+
+# Kinds of the entries that are not nodes. Node classes get the kinds from
+# FIRST_NODE_KIND on, in the order an arena first meets them
+LIST_KIND = 0
+TUPLE_KIND = 1
+TOKEN_KIND = 2
+NONE_KIND = 3
+VALUE_KIND = 4  # Anything else (e.g. the Error of an ErrorNode)
+FIRST_NODE_KIND = 5
+
+# Missing child, sibling or token
+NO_INDEX = 0xFFFFFFFF
+
+
+class AstArena:
+    # A parse tree as four parallel columns, one entry per node, list,
+    # tuple, token and None of the tree:
+    #   kinds          kind of the entry (see above)
+    #   token_indices  index into tokens of the entry's token, for nodes and
+    #                  lists the first token under them, for values the
+    #                  index into self.values
+    #   first_child    index of the first child entry
+    #   next_sibling   index of the next entry of the same parent
+    # Entries are stored in pre-order, the statement list first (ROOT), so
+    # a subtree is a contiguous range and whole-tree scans are plain loops
+    # over the columns. Nodes whose only field is a token (numbers,
+    # identifiers, ...) have no child entry, their token is their own.
+    # Build one with from_nodes, read it with a cursor (ArenaCursor,
+    # ArenaVisitor, walk), scan it for a node class with find or turn it
+    # back into nodes with to_nodes
+    ROOT = 0
+
+    def __init__(self, tokens):
+        # TokenStream the token indices are into
+        self.tokens = tokens
+
+        self.kinds = array("H")
+        self.token_indices = array("I")
+        self.first_child = array("I")
+        self.next_sibling = array("I")
+
+        # Node classes by kind - FIRST_NODE_KIND, and other field values
+        self.classes = []
+        self.class_kinds = {}
+        self.values = []
+
+    @classmethod
+    def from_nodes(cls, statements, tokens):
+        # Arena of a parse tree (usually the statement list of a parse) and
+        # the TokenStream it was parsed from. Raises ValueError if the tree
+        # holds a token that is not in tokens
+        arena = cls(tokens)
+        kinds = arena.kinds
+        token_indices = arena.token_indices
+        first_child = arena.first_child
+        next_sibling = arena.next_sibling
+
+        # Parent and last child added so far of every entry
+        parents = []
+        last_child = []
+
+        stack = [(statements, NO_INDEX)]
+        while stack:
+            value, parent = stack.pop()
+            idx = len(kinds)
+            token_idx = NO_INDEX
+            children = ()
+
+            if isinstance(value, Node):
+                kind = arena.class_kind(value.__class__)
+                fields = [getattr(value, name) for name in value.__slots__]
+                if len(fields) == 1 and isinstance(fields[0], Token):
+                    token_idx = arena.token_index(fields[0])
+                else:
+                    children = fields
+            elif isinstance(value, list):
+                kind = LIST_KIND
+                children = value
+            elif isinstance(value, tuple):
+                kind = TUPLE_KIND
+                children = value
+            elif isinstance(value, Token):
+                kind = TOKEN_KIND
+                token_idx = arena.token_index(value)
+            elif value is None:
+                kind = NONE_KIND
+            else:
+                kind = VALUE_KIND
+                arena.values.append(value)
+
+            kinds.append(kind)
+            token_indices.append(len(arena.values) - 1 if kind == VALUE_KIND else token_idx)
+            first_child.append(NO_INDEX)
+            next_sibling.append(NO_INDEX)
+            parents.append(parent)
+            last_child.append(NO_INDEX)
+
+            if parent != NO_INDEX:
+                previous = last_child[parent]
+                if previous == NO_INDEX:
+                    first_child[parent] = idx
+                else:
+                    next_sibling[previous] = idx
+                last_child[parent] = idx
+
+            # The first token of a subtree is the first one in pre-order,
+            # and an ancestor that has one already has it for all above it
+            if token_idx != NO_INDEX:
+                while parent != NO_INDEX and token_indices[parent] == NO_INDEX:
+                    token_indices[parent] = token_idx
+                    parent = parents[parent]
+
+            stack.extend((child, idx) for child in reversed(children))
+
+        return arena
+
+    def class_kind(self, node_class):
+        kind = self.class_kinds.get(node_class)
+        if kind is None:
+            kind = self.class_kinds[node_class] = FIRST_NODE_KIND + len(self.classes)
+            self.classes.append(node_class)
+        return kind
+
+    def token_index(self, token):
+        # Index of token in the stream, found by its start offset
+        tokens = self.tokens
+        starts = tokens.starts
+        idx = bisect_left(starts, token.start)
+
+        while idx < len(starts) and starts[idx] == token.start:
+            if tokens.type_at(idx) == token.type:
+                return idx
+            idx += 1
+
+        raise ValueError(f"Token {token!r} at {token.start} is not in the token stream")
+
+    def to_nodes(self, idx=ROOT):
+        # The tree under entry idx as node objects (the statement list for
+        # ROOT). Node classes take their fields in __slots__ order
+        kinds = self.kinds
+        token_indices = self.token_indices
+        first_child = self.first_child
+        next_sibling = self.next_sibling
+        token_at = self.tokens.token_at
+
+        # Children have larger indices than their parent, so building the
+        # entries last to first finds every child already built
+        end = self.subtree_end(idx)
+        built = [None] * (end - idx)
+
+        for entry in range(end - 1, idx - 1, -1):
+            kind = kinds[entry]
+
+            if kind == TOKEN_KIND:
+                value = token_at(token_indices[entry])
+            elif kind == NONE_KIND:
+                value = None
+            elif kind == VALUE_KIND:
+                value = self.values[token_indices[entry]]
+            else:
+                children = []
+                child = first_child[entry]
+                while child != NO_INDEX:
+                    children.append(built[child - idx])
+                    built[child - idx] = None
+                    child = next_sibling[child]
+
+                if kind == LIST_KIND:
+                    value = children
+                elif kind == TUPLE_KIND:
+                    value = tuple(children)
+                else:
+                    node_class = self.classes[kind - FIRST_NODE_KIND]
+                    if not children and len(node_class.__slots__) == 1:
+                        children.append(token_at(token_indices[entry]))
+                    value = node_class(*children)
+
+            built[entry - idx] = value
+
+        return built[0]
+
+    # Cursor API
+    def node_class(self, idx):
+        # Class of a node entry, None for other entries
+        kind = self.kinds[idx]
+        if kind >= FIRST_NODE_KIND:
+            return self.classes[kind - FIRST_NODE_KIND]
+        return None
+
+    def token(self, idx):
+        # Token of a token entry, first token of a node or list entry
+        kind = self.kinds[idx]
+        if kind == VALUE_KIND or self.token_indices[idx] == NO_INDEX:
+            return None
+        return self.tokens.token_at(self.token_indices[idx])
+
+    def value(self, idx):
+        # Field value of a value entry
+        if self.kinds[idx] == VALUE_KIND:
+            return self.values[self.token_indices[idx]]
+        return None
+
+    def children(self, idx):
+        child = self.first_child[idx]
+        while child != NO_INDEX:
+            yield child
+            child = self.next_sibling[child]
+
+    def subtree_end(self, idx):
+        # One past the last entry under idx: the entry after its last
+        # descendant down the last child of each level
+        first_child = self.first_child
+        next_sibling = self.next_sibling
+
+        while True:
+            child = first_child[idx]
+            if child == NO_INDEX:
+                return idx + 1
+
+            while next_sibling[child] != NO_INDEX:
+                child = next_sibling[child]
+            idx = child
+
+    def walk(self, idx=ROOT):
+        # Entry indices under idx, idx included, in pre-order
+        return range(idx, self.subtree_end(idx))
+
+    def find(self, node_class, idx=ROOT):
+        # Indices of the node_class entries under idx, in pre-order: a scan
+        # of the kinds column, no node is visited
+        kind = self.class_kinds.get(node_class)
+        if kind is None:
+            return []
+
+        end = self.subtree_end(idx)
+        return [entry for entry, entry_kind in enumerate(self.kinds[idx:end], idx) if entry_kind == kind]
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __repr__(self):
+        return f"AstArena({len(self.kinds)} entries)"
+
+
+class ArenaCursor:
+    # Moves over the entries of an arena like a tree cursor: goto_* return
+    # False (and stay put) when there is no such entry
+    def __init__(self, arena, idx=AstArena.ROOT):
+        self.arena = arena
+        self.idx = idx
+        self.parents = []
+
+    @property
+    def kind(self):
+        return self.arena.kinds[self.idx]
+
+    @property
+    def node_class(self):
+        return self.arena.node_class(self.idx)
+
+    @property
+    def token(self):
+        return self.arena.token(self.idx)
+
+    def goto_first_child(self):
+        child = self.arena.first_child[self.idx]
+        if child == NO_INDEX:
+            return False
+
+        self.parents.append(self.idx)
+        self.idx = child
+        return True
+
+    def goto_next_sibling(self):
+        # The entry the cursor started at has no siblings
+        sibling = self.arena.next_sibling[self.idx]
+        if sibling == NO_INDEX or not self.parents:
+            return False
+
+        self.idx = sibling
+        return True
+
+    def goto_parent(self):
+        if not self.parents:
+            return False
+
+        self.idx = self.parents.pop()
+        return True
+
+
+class ArenaVisitor:
+    # Calls visit_<node class name>(arena, idx) for every node entry under
+    # idx, in pre-order. A method returning False skips the entries under
+    # its node. Lists, tuples, tokens and values are walked, not visited
+    def visit(self, arena, idx=AstArena.ROOT):
+        handlers = [getattr(self, f"visit_{node_class.__name__}", None) for node_class in arena.classes]
+        kinds = arena.kinds
+        first_child = arena.first_child
+        next_sibling = arena.next_sibling
+        parents = []
+
+        while True:
+            child = first_child[idx]
+            kind = kinds[idx]
+
+            if kind >= FIRST_NODE_KIND:
+                handler = handlers[kind - FIRST_NODE_KIND]
+                if handler is not None and handler(arena, idx) is False:
+                    child = NO_INDEX
+
+            if child != NO_INDEX:
+                parents.append(idx)
+                idx = child
+                continue
+
+            # Up to the nearest entry with a next sibling
+            while parents:
+                sibling = next_sibling[idx]
+                if sibling != NO_INDEX:
+                    idx = sibling
+                    break
+                idx = parents.pop()
+            else:
+                return
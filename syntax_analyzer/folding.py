@@ -0,0 +1,257 @@
+import math
+import operator
+
+from lexical_analyzer.token import Token
+from syntax_analyzer.nodes import ConditionalStmtNode, ConstantNode, WhileStmtNode
+from syntax_analyzer.visitor import NodeTransformer
+
+# Constant folding: fold_constants(statements) decodes every literal into
+# a ConstantNode, replaces operators over constants by their result and
+# takes out if/elif/else branches and while loops that can never run.
+# Folding follows Python's semantics and leaves anything else (e.g.
+# division by zero, mixing booleans with numbers) for run time.
+# Operators are matched by lexeme, not token type, since the lexer names
+# ">" LT_OP and "<" GT_OP
+
+# Binary operators over two numbers (ints or floats, not booleans)
+NUMBER_OPS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    "//": operator.floordiv,
+    "%": operator.mod,
+    "**": operator.pow,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# Binary operators over two strings
+STRING_OPS = {
+    "+": operator.add,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# Binary operators over two booleans, or two nulls
+BOOL_OPS = {
+    "and": operator.and_,
+    "or": operator.or_,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+NULL_OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# Integers folded from an operator are at most this many bits, larger
+# results are left for run time instead of growing the tree (and str()
+# refuses to spell integers past sys.get_int_max_str_digits())
+MAX_INT_BITS = 1024
+
+
+def value_kind(value):
+    # Operands of different kinds are never folded together
+    if value is None:
+        return NULL_OPS
+    if isinstance(value, bool):
+        return BOOL_OPS
+    if isinstance(value, (int, float)):
+        return NUMBER_OPS
+    return STRING_OPS
+
+
+def too_large(value):
+    return isinstance(value, int) and value.bit_length() > MAX_INT_BITS
+
+
+def literal_value(node):
+    # Python value of a NumberNode, StringNode, BoolNode or NullNode.
+    # Raises ValueError for integers too long to convert
+    token = node.token
+    if token.type == "INT":
+        return int(token.value)
+    if token.type == "FLOAT":
+        return float(token.value)
+    if token.type == "STRING":
+        return token.value[1:-1]
+    if token.value == "null":
+        return None
+    return token.value == "true"
+
+
+def constant_token(value, start_token, end_token):
+    # Token spelling value, spanning start_token to end_token
+    if value is None:
+        token_type, lexeme = "RESWORD", "null"
+    elif isinstance(value, bool):
+        token_type, lexeme = "RESWORD", "true" if value else "false"
+    elif isinstance(value, int):
+        token_type, lexeme = "INT", str(value)
+    elif isinstance(value, float):
+        token_type, lexeme = "FLOAT", repr(value)
+    else:
+        token_type, lexeme = "STRING", f'"{value}"'
+
+    return Token(token_type, lexeme, start_token.start, end_token.end, start_token.source)
+
+
+def condition_value(condition):
+    # True or false for a literal boolean condition, None otherwise
+    if condition.__class__ is ConstantNode and isinstance(condition.value, bool):
+        return condition.value
+    return None
+
+
+class ConstantFolder(NodeTransformer):
+    # Used through transform(), bottom-up: operands are already folded when
+    # an operator is visited, and statements when their block is. folds
+    # counts the operators folded and statements removed
+
+    def __init__(self):
+        self.folds = 0
+
+    # Literals
+    def visit_literal(self, node):
+        # Integer literals too long to convert are left for the compiler
+        # to report
+        try:
+            return ConstantNode(node.token, literal_value(node))
+        except ValueError:
+            return node
+
+    visit_NumberNode = visit_StringNode = visit_BoolNode = visit_NullNode = visit_literal
+
+    # Operators
+    def visit_BinaryOpNode(self, node):
+        left = node.left_node
+        right = node.right_node
+        if left.__class__ is not ConstantNode or right.__class__ is not ConstantNode:
+            return node
+
+        ops = value_kind(left.value)
+        if value_kind(right.value) is not ops or node.op_token.value not in ops:
+            return node
+
+        op = node.op_token.value
+        if op == "**" and isinstance(left.value, int) and isinstance(right.value, int):
+            if right.value > 0 and left.value.bit_length() * right.value > MAX_INT_BITS:
+                return node
+
+        try:
+            value = ops[op](left.value, right.value)
+        except ArithmeticError:
+            return node
+
+        # Complex roots of negative numbers, infinities, NaN and huge integers
+        if isinstance(value, complex) or isinstance(value, float) and not math.isfinite(value) or too_large(value):
+            return node
+
+        self.folds += 1
+        return ConstantNode(constant_token(value, left.token, right.token), value)
+
+    def visit_UnaryOpNode(self, node):
+        operand = node.node
+        if operand.__class__ is not ConstantNode:
+            return node
+
+        op = node.op_token.value
+        kind = value_kind(operand.value)
+        if op == "not" and kind is BOOL_OPS:
+            value = not operand.value
+        elif op == "-" and kind is NUMBER_OPS:
+            value = -operand.value
+        elif op == "+" and kind is NUMBER_OPS:
+            value = operand.value
+        else:
+            return node
+
+        if too_large(value):
+            return node
+
+        self.folds += 1
+        return ConstantNode(constant_token(value, node.op_token, operand.token), value)
+
+    # Blocks
+    def visit_ConditionalStmtNode(self, node):
+        for _, body in node.cases:
+            self.prune(body)
+        if node.else_case is not None:
+            self.prune(node.else_case)
+        return node
+
+    def visit_WhileStmtNode(self, node):
+        self.prune(node.body)
+        return node
+
+    def visit_ForStmtNode(self, node):
+        self.prune(node.body)
+        return node
+
+    def visit_FunctionDefNode(self, node):
+        self.prune(node.body)
+        return node
+
+    def prune(self, statements):
+        # Takes the dead branches out of a list of statements
+        if statements is None:
+            return
+
+        live = []
+        for statement in statements:
+            if statement.__class__ is ConditionalStmtNode:
+                live.extend(self.live_branches(statement))
+            elif statement.__class__ is WhileStmtNode and condition_value(statement.condition) is False:
+                self.folds += 1
+            else:
+                live.append(statement)
+
+        statements[:] = live
+
+    def live_branches(self, statement):
+        # Statements an if/elif/else can be replaced by: the statement
+        # without its false cases, or the body that always runs
+        cases = []
+
+        for condition, body in statement.cases:
+            value = condition_value(condition)
+            if value is False:
+                continue
+
+            if value is True:
+                self.folds += 1
+                if not cases:
+                    return body
+
+                # Cases after an always true one never run
+                statement.cases = cases
+                statement.else_case = body
+                return [statement]
+
+            cases.append((condition, body))
+
+        if not cases:
+            self.folds += 1
+            return statement.else_case or []
+
+        if len(cases) < len(statement.cases):
+            self.folds += 1
+            statement.cases = cases
+        return [statement]
+
+
+def fold_constants(statements):
+    # Folds the statements of a parse in place, returns them
+    folder = ConstantFolder()
+    folder.transform(statements)
+    folder.prune(statements)
+    return statements
@@ -1,4 +1,109 @@
-class NumberNode:
+from lexical_analyzer.token import Token
+from utils.error import Error
+
+
+class Node:
+    # Base of the parse tree nodes. Each node class lists its fields in
+    # __slots__, which drive equality and hashing, and in child_fields the
+    # ones that can hold nodes (directly or in lists and tuples), which
+    # drive children() and syntax_analyzer/visitor.py. Nodes are
+    # equal when they have the same class and equal fields, comparing
+    # tokens by type and value only (not position) and errors by type and
+    # message, so two parses of the same code are equal wherever it sits
+    # in the file. Comparison and hashing walk the trees iteratively, so
+    # deep trees (see StackParser) do not hit the recursion limit
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # Classes that do not say which fields hold nodes get all of them
+        if "child_fields" not in cls.__dict__:
+            cls.child_fields = cls.__slots__
+
+    def children(self):
+        # Child nodes in field order, looking into lists and tuples
+        for name in self.child_fields:
+            value = getattr(self, name)
+
+            if isinstance(value, Node):
+                yield value
+            elif isinstance(value, (list, tuple)):
+                yield from container_nodes(value)
+
+    def __eq__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+
+        stack = [(self, other)]
+        while stack:
+            left, right = stack.pop()
+
+            if isinstance(left, Node):
+                if left.__class__ is not right.__class__:
+                    return False
+                for name in left.__slots__:
+                    stack.append((getattr(left, name), getattr(right, name)))
+
+            elif isinstance(left, (list, tuple)):
+                if left.__class__ is not right.__class__ or len(left) != len(right):
+                    return False
+                stack.extend(zip(left, right))
+
+            elif isinstance(left, Token):
+                if not (isinstance(right, Token) and left.type == right.type and left.value == right.value):
+                    return False
+
+            elif isinstance(left, Error):
+                if not (left.__class__ is right.__class__ and left.details == right.details):
+                    return False
+
+            elif left != right:
+                return False
+
+        return True
+
+    def __hash__(self):
+        return hash(tuple(structure(self)))
+
+
+def container_nodes(values):
+    # Nodes in a list or tuple, looking into nested ones (e.g. the
+    # (condition, body) cases of a ConditionalStmtNode)
+    for value in values:
+        if isinstance(value, Node):
+            yield value
+        elif isinstance(value, (list, tuple)):
+            yield from container_nodes(value)
+
+
+def structure(node):
+    # Flat pre-order description of node: classes, token types and values,
+    # and list lengths. Equal nodes have the same structure
+    stack = [node]
+    while stack:
+        value = stack.pop()
+
+        if isinstance(value, Node):
+            yield value.__class__
+            stack.extend(getattr(value, name) for name in reversed(value.__slots__))
+        elif isinstance(value, (list, tuple)):
+            yield (value.__class__, len(value))
+            stack.extend(reversed(value))
+        elif isinstance(value, Token):
+            yield value.type
+            yield value.value
+        elif isinstance(value, Error):
+            yield value.__class__
+            yield value.details
+        else:
+            yield value
+
+
+class NumberNode(Node):
+    __slots__ = ("token",)
+    child_fields = ()
+
     def __init__(self, token):
         self.token = token
 
@@ -6,7 +111,10 @@ class NumberNode:
         return f"{self.token.value}"
 
 
-class StringNode:
+class StringNode(Node):
+    __slots__ = ("token",)
+    child_fields = ()
+
     def __init__(self, token):
         self.token = token
 
@@ -14,7 +122,10 @@ class StringNode:
         return f"{self.token.value}"
 
 
-class BoolNode:
+class BoolNode(Node):
+    __slots__ = ("token",)
+    child_fields = ()
+
     def __init__(self, token):
         self.token = token
 
@@ -22,7 +133,10 @@ class BoolNode:
         return f"{self.token.value}"
 
 
-class NullNode:
+class NullNode(Node):
+    __slots__ = ("token",)
+    child_fields = ()
+
     def __init__(self, token):
         self.token = token
 
@@ -30,7 +144,10 @@ class NullNode:
         return f"{self.token.value}"
 
 
-class IdentifierNode:
+class IdentifierNode(Node):
+    __slots__ = ("token",)
+    child_fields = ()
+
     def __init__(self, token):
         self.token = token
 
@@ -38,15 +155,38 @@ class IdentifierNode:
         return f"{self.token.value}"
 
 
-class ListNode:
-    def __init__(self, elements):
+class ConstantNode(Node):
+    # Literal whose value has been decoded, or constant expression folded
+    # into one (see syntax_analyzer/folding.py). value is an int, float,
+    # str, bool or None, token spells it and spans the original code
+    __slots__ = ("token", "value")
+    child_fields = ()
+
+    def __init__(self, token, value):
+        self.token = token
+        self.value = value
+
+    def __repr__(self):
+        return f"{self.token.value}"
+
+
+class ListNode(Node):
+    # bracket is the "[" token, so empty lists have a position too
+    __slots__ = ("bracket", "elements")
+    child_fields = ("elements",)
+
+    def __init__(self, bracket, elements):
+        self.bracket = bracket
         self.elements = elements
 
     def __repr__(self):
         return f"[{', '.join([str(element) for element in self.elements])}]"
 
 
-class BinaryOpNode:
+class BinaryOpNode(Node):
+    __slots__ = ("left_node", "op_token", "right_node")
+    child_fields = ("left_node", "right_node")
+
     def __init__(self, left_node, op_token, right_node):
         self.left_node = left_node
         self.op_token = op_token
@@ -56,7 +196,10 @@ class BinaryOpNode:
         return f"({self.left_node} {self.op_token.value} {self.right_node})"
 
 
-class UnaryOpNode:
+class UnaryOpNode(Node):
+    __slots__ = ("op_token", "node")
+    child_fields = ("node",)
+
     def __init__(self, op_token, node):
         self.op_token = op_token
         self.node = node
@@ -67,7 +210,10 @@ class UnaryOpNode:
         return f"({self.op_token.value}{self.node})"
 
 
-class AssignStmtNode:
+class AssignStmtNode(Node):
+    __slots__ = ("identifier", "op", "value")
+    child_fields = ("value",)
+
     def __init__(self, identifier, op, value):
         self.identifier = identifier
         self.op = op
@@ -77,15 +223,23 @@ class AssignStmtNode:
         return f"{self.identifier.value} {self.op.value} {self.value};"
 
 
-class InputStmtNode:
-    def __init__(self, value):
+class InputStmtNode(Node):
+    # identifier = input(value);
+    __slots__ = ("identifier", "value")
+    child_fields = ("value",)
+
+    def __init__(self, identifier, value):
+        self.identifier = identifier
         self.value = value
 
     def __repr__(self):
         return str(self.value)
 
 
-class OutputStmtNode:
+class OutputStmtNode(Node):
+    __slots__ = ("output",)
+    child_fields = ("output",)
+
     def __init__(self, output):
         self.output = output
 
@@ -93,7 +247,10 @@ class OutputStmtNode:
         return str(self.output)
 
 
-class ConditionalStmtNode:
+class ConditionalStmtNode(Node):
+    __slots__ = ("cases", "else_case")
+    child_fields = ("cases", "else_case")
+
     def __init__(self, cases, else_case):
         self.cases = cases
         self.else_case = else_case
@@ -118,7 +275,10 @@ class ConditionalStmtNode:
         return condition_str
 
 
-class ForStmtNode:
+class ForStmtNode(Node):
+    __slots__ = ("loop_var", "arr", "body")
+    child_fields = ("arr", "body")
+
     def __init__(self, loop_var, arr, body):
         self.loop_var = loop_var
         self.arr = arr
@@ -133,7 +293,10 @@ class ForStmtNode:
         return for_str
 
 
-class WhileStmtNode:
+class WhileStmtNode(Node):
+    __slots__ = ("condition", "body")
+    child_fields = ("condition", "body")
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
@@ -147,7 +310,10 @@ class WhileStmtNode:
         return while_str
 
 
-class OttomateStmtNode:
+class OttomateStmtNode(Node):
+    __slots__ = ("identifier",)
+    child_fields = ()
+
     def __init__(self, identifier):
         self.identifier = identifier
 
@@ -155,7 +321,10 @@ class OttomateStmtNode:
         return f"Ottomate {self.identifier};"
 
 
-class StepStmtNode:
+class StepStmtNode(Node):
+    __slots__ = ("identifier",)
+    child_fields = ()
+
     def __init__(self, identifier):
         self.identifier = identifier
 
@@ -163,8 +332,12 @@ class StepStmtNode:
         return f"step {self.identifier};"
 
 
-class TestStmtNode:
-    def __init__(self, cases):
+class TestStmtNode(Node):
+    __slots__ = ("keyword", "cases")
+    child_fields = ("cases",)
+
+    def __init__(self, keyword, cases):
+        self.keyword = keyword
         self.cases = cases
 
     def __repr__(self):
@@ -176,7 +349,10 @@ class TestStmtNode:
         return test_str
 
 
-class ExecuteStmtNode:
+class ExecuteStmtNode(Node):
+    __slots__ = ("arr", "func")
+    child_fields = ("arr",)
+
     def __init__(self, arr, func):
         self.arr = arr
         self.func = func
@@ -185,7 +361,10 @@ class ExecuteStmtNode:
         return f"execute({self.arr}, {self.func});"
 
 
-class FunctionDefNode:
+class FunctionDefNode(Node):
+    __slots__ = ("identifier", "params", "body")
+    child_fields = ("body",)
+
     def __init__(self, identifier, params, body):
         self.identifier = identifier
         self.params = params
@@ -201,18 +380,37 @@ class FunctionDefNode:
         return func_str
 
 
-class ReturnStmtNode:
-    def __init__(self, value):
+class ReturnStmtNode(Node):
+    __slots__ = ("keyword", "value")
+    child_fields = ("value",)
+
+    def __init__(self, keyword, value):
+        self.keyword = keyword
         self.value = value
 
     def __repr__(self):
         return f"return {self.value};"
 
 
-class FunctionCallNode:
+class FunctionCallNode(Node):
+    __slots__ = ("atom", "args")
+    child_fields = ("atom", "args")
+
     def __init__(self, atom, args):
         self.atom = atom
         self.args = args
 
     def __repr__(self):
         return f"{self.atom}({", ".join([str(arg) for arg in self.args])})"
+
+
+class ErrorNode(Node):
+    # Placeholder for a statement that could not be parsed
+    __slots__ = ("error",)
+    child_fields = ()
+
+    def __init__(self, error):
+        self.error = error
+
+    def __repr__(self):
+        return f"<error: {self.error.details}>"
@@ -0,0 +1,283 @@
+import mmap
+import os
+import sys
+import tempfile
+from array import array
+
+from lexical_analyzer.position import LineIndex
+from lexical_analyzer.token_stream import RAW_LEXEME, TokenStream
+from syntax_analyzer.arena import AstArena
+from syntax_analyzer.nodes import Node
+from utils.symbol_table import read_varint, write_string, write_varint
+
+# Compiled scripts (.ottoc): the tokens, comments and parse tree of a
+# script, saved once (e.g. with batch.py --compile at deploy time) and
+# loaded without lexing or parsing it again. Layout:
+#   magic, version, byte order of the columns (0 little, 1 big endian)
+#   string table: varint count, then each string (varint length + UTF-8),
+#   padded to a multiple of 8 bytes
+#   file name (varint string id), then the line starts column
+#   tokens, then comments: varint count and string ids of the type names,
+#   then the types, starts, ends and values (string ids) columns
+#   comment owners column
+#   tree flag byte, then the varint count and string ids of the node class
+#   names and the kinds, token indices, first child and next sibling
+#   columns of an AstArena
+# A column is its typecode, item size and varint length, then its items
+# aligned to their size, so loading one is a memoryview cast, not a copy.
+# Bump OTTOC_VERSION whenever this layout or a node class changes
+OTTOC_MAGIC = b"OTTC"
+OTTOC_VERSION = 3
+COMPILED_SUFFIX = ".ottoc"
+
+BYTE_ORDERS = ("little", "big")
+
+
+class OttocWriter:
+    # Collects the strings and columns of one compiled script
+    def __init__(self):
+        self.strings = []
+        self.string_ids = {}
+        self.body = bytearray()
+
+    def string_id(self, string):
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = self.string_ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def write_strings(self, strings):
+        write_varint(self.body, len(strings))
+        for string in strings:
+            write_varint(self.body, self.string_id(string))
+
+    def write_column(self, column):
+        # Arrays, or memoryviews of a loaded script
+        body = self.body
+        itemsize = column.itemsize
+        body += (column.typecode if isinstance(column, array) else column.format).encode()
+        body.append(itemsize)
+        write_varint(body, len(column))
+        body += bytes(-len(body) % itemsize)
+        body += column if isinstance(column, array) else column.tobytes()
+
+    def write_stream(self, stream):
+        self.write_strings(stream.type_names)
+        self.write_column(stream.types)
+        self.write_column(stream.starts)
+        self.write_column(stream.ends)
+
+        # Lexeme ids become string ids, lexemes of memory-mapped sources
+        # (read from the source when asked for) are stored as well
+        lexeme_ids = [self.string_id(lexeme) for lexeme in stream.lexemes]
+        values = stream.values
+        if RAW_LEXEME in values:
+            string_ids = array("I")
+            for idx, value_id in enumerate(values):
+                if value_id == RAW_LEXEME:
+                    string_ids.append(self.string_id(stream.value_at(idx)))
+                else:
+                    string_ids.append(lexeme_ids[value_id])
+        else:
+            string_ids = array("I", map(lexeme_ids.__getitem__, values))
+        self.write_column(string_ids)
+
+    def write_arena(self, arena):
+        self.write_strings([node_class.__name__ for node_class in arena.classes])
+        self.write_column(arena.kinds)
+        self.write_column(arena.token_indices)
+        self.write_column(arena.first_child)
+        self.write_column(arena.next_sibling)
+
+    def getvalue(self):
+        header = bytearray(OTTOC_MAGIC)
+        header.append(OTTOC_VERSION)
+        header.append(BYTE_ORDERS.index(sys.byteorder))
+
+        write_varint(header, len(self.strings))
+        for string in self.strings:
+            write_string(header, string)
+
+        # Columns are aligned within the body, which starts 8-byte aligned
+        header += bytes(-len(header) % 8)
+        return bytes(header + self.body)
+
+
+class OttocReader:
+    # Reads the parts of a compiled script in order from a memoryview
+    def __init__(self, data):
+        self.data = memoryview(data).cast("B")
+        self.pos = 0
+        self.strings = []
+
+        magic_end = len(OTTOC_MAGIC)
+        if self.data[:magic_end] != OTTOC_MAGIC:
+            raise ValueError("Not an Otto compiled script")
+        if self.data[magic_end] != OTTOC_VERSION:
+            raise ValueError(f"Compiled script version {self.data[magic_end]} is not {OTTOC_VERSION}")
+
+        # Columns in the other byte order are copied and swapped
+        self.swap = BYTE_ORDERS[self.data[magic_end + 1]] != sys.byteorder
+        self.pos = magic_end + 2
+
+    def varint(self):
+        value, self.pos = read_varint(self.data, self.pos)
+        return value
+
+    def read_string_table(self):
+        data = self.data
+        strings = self.strings
+
+        for _ in range(self.varint()):
+            size = self.varint()
+            strings.append(str(data[self.pos:self.pos + size], "utf-8"))
+            self.pos += size
+
+        self.pos += -self.pos % 8
+
+    def read_strings(self):
+        return [self.strings[self.varint()] for _ in range(self.varint())]
+
+    def read_column(self):
+        typecode = chr(self.data[self.pos])
+        itemsize = self.data[self.pos + 1]
+        self.pos += 2
+        if array(typecode).itemsize != itemsize:
+            raise ValueError(f"Compiled script column '{typecode}' has {itemsize}-byte items on this platform")
+
+        length = self.varint()
+        self.pos += -self.pos % itemsize
+        items = self.data[self.pos:self.pos + length * itemsize]
+        self.pos += length * itemsize
+
+        if self.swap:
+            column = array(typecode)
+            column.frombytes(items)
+            column.byteswap()
+            return column
+        return items.cast(typecode)
+
+    def read_stream(self, stream):
+        stream.type_names = self.read_strings()
+        stream.type_ids = {type_: type_id for type_id, type_ in enumerate(stream.type_names)}
+        stream.lexemes = self.strings
+        stream.types = self.read_column()
+        stream.starts = self.read_column()
+        stream.ends = self.read_column()
+        stream.values = self.read_column()
+        return stream
+
+    def read_arena(self, tokens):
+        classes = node_classes()
+        arena = AstArena(tokens)
+
+        for name in self.read_strings():
+            if name not in classes:
+                raise ValueError(f"Compiled script uses unknown node class '{name}'")
+            arena.class_kind(classes[name])
+
+        arena.kinds = self.read_column()
+        arena.token_indices = self.read_column()
+        arena.first_child = self.read_column()
+        arena.next_sibling = self.read_column()
+        return arena
+
+
+def node_classes():
+    # Every Node subclass by name, subclasses of subclasses included
+    classes = {}
+    stack = [Node]
+    while stack:
+        for node_class in stack.pop().__subclasses__():
+            classes[node_class.__name__] = node_class
+            stack.append(node_class)
+    return classes
+
+
+def dump_ottoc(tokens, statements=None):
+    # Compiled script of a TokenStream and the statements parsed from it.
+    # Raises ValueError for trees with errors, which are not worth keeping,
+    # and for folded trees (see syntax_analyzer/folding.py), whose decoded
+    # values and new tokens the format has no room for
+    arena = None
+    if statements is not None:
+        arena = AstArena.from_nodes(statements, tokens)
+        if arena.values:
+            raise ValueError("Parse trees with errors or folded constants cannot be compiled")
+
+    writer = OttocWriter()
+    source = tokens.source
+
+    if source is None:
+        line_starts = array("q", [0])
+        file_name = ""
+    else:
+        if source.line_starts is None:
+            source.build()
+        line_starts = source.line_starts
+        file_name = source.file_name
+
+    write_varint(writer.body, writer.string_id(file_name))
+    writer.write_column(line_starts)
+    writer.write_stream(tokens)
+    writer.write_stream(tokens.trivia)
+    writer.write_column(tokens.trivia_owners)
+
+    writer.body.append(arena is not None)
+    if arena is not None:
+        writer.write_arena(arena)
+
+    return writer.getvalue()
+
+
+def loads_ottoc(data):
+    # (tokens, arena) of a compiled script, arena None if it has no tree.
+    # The columns are views into data, so the streams are read-only (not
+    # relexed, spliced or pickled). Positions keep their line and column
+    # (in bytes for scripts lexed from memory-mapped files) but have no
+    # source text, like those of streamed sources
+    reader = OttocReader(data)
+    reader.read_string_table()
+
+    source = LineIndex(reader.strings[reader.varint()])
+    source.line_starts = reader.read_column()
+
+    tokens = reader.read_stream(TokenStream(source, with_trivia=False))
+    tokens.trivia = reader.read_stream(TokenStream(source, False, tokens.pool))
+    tokens.trivia_owners = reader.read_column()
+
+    has_tree = reader.data[reader.pos]
+    reader.pos += 1
+    arena = reader.read_arena(tokens) if has_tree else None
+
+    return tokens, arena
+
+
+def load_ottoc(path):
+    # Maps the file instead of reading it, the mapping stays open while
+    # the returned columns use it
+    with open(path, "rb") as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return loads_ottoc(data)
+
+
+def write_ottoc(path, tokens, statements=None):
+    # Written to a temporary file first, so a script being loaded is never
+    # seen half written
+    data = dump_ottoc(tokens, statements)
+    directory = os.path.dirname(path) or "."
+
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def compiled_path(path):
+    # Where batch.py --compile saves the compiled script of path
+    return os.path.splitext(path)[0] + COMPILED_SUFFIX
@@ -1,150 +1,545 @@
+import math
+from bisect import bisect_left
+from operator import itemgetter
+
+from lexical_analyzer.constants import BINARY_OP_PRECEDENCE, COMPOUND_ASSIGN_OPS, RIGHT_ASSOC_OPS, UNARY_OP_PRECEDENCE
+from lexical_analyzer.token import Token
+from lexical_analyzer.token_stream import TokenBuffer, TokenStream
 from syntax_analyzer.nodes import *
-from utils.error import InvalidTokenError, UnclosedStringError, InvalidSyntaxError
+from utils.budget import DEADLINE_CHECK_INTERVAL, BudgetExceeded
+from utils.error import BudgetExceededError, InvalidTokenError, UnclosedStringError, InvalidSyntaxError
+
+
+# Default for Parser(max_errors=...), None collects every error
+MAX_ERRORS = 100
+
+# Token types the lexer emits for lexical errors
+ERROR_TOKEN_TYPES = ("INVALID_TOKEN", "UNCLOSED_STR")
+
+
+class ParserPanic(Exception):
+    # Unwinds the statement being parsed back to Parser.stmt, which
+    # recovers. error is None when the lexical error at the current token
+    # is reported instead
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+
+
+class ErrorLimitReached(Exception):
+    # Stops the parse at the first error past max_errors
+    pass
+
+
+# Operands that are a single token, built in expr() without a call to atom()
+OPERAND_NODES = {
+    "INT": NumberNode,
+    "FLOAT": NumberNode,
+    "STRING": StringNode,
+    "IDENTIFIER": IdentifierNode,
+}
+
+
+# Fields of a statement span, see Parser.spans
+SPAN_START = itemgetter(0)
+SPAN_STOP = itemgetter(1)
+SPAN_NODE = itemgetter(2)
+SPAN_OK = itemgetter(3)
+
+# Parser.reparse changed range when the tokens did not change
+UNCHANGED = (math.inf, math.inf, math.inf, 0)
+
+
+def node_tokens(node):
+    # Every token in node (or list, tuple)
+    tokens = []
+    stack = [node]
+    while stack:
+        value = stack.pop()
+
+        if isinstance(value, Token):
+            tokens.append(value)
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif isinstance(value, Node):
+            stack.extend(getattr(value, name) for name in value.__slots__)
+
+    return tokens
+
+
+def move_tokens(tokens, shift):
+    for token in tokens:
+        token.start += shift
+        token.end += shift
 
 
 class Parser:
-    def __init__(self, tokens):
+    # budget (utils/budget.py) turns on strict mode: parsing stops with a
+    # BudgetExceededError once too many tokens are read, statements or
+    # expressions nest too deep, or the deadline passes. incremental keeps
+    # what reparse() needs to update this parse after an edit. share_leaves
+    # builds one node for all equal leaves (see leaf())
+    def __init__(self, tokens, max_errors=MAX_ERRORS, budget=None, incremental=False, share_leaves=False):
+        # Lists of Token objects are converted to the columnar stream,
+        # other iterables (e.g. Lexer.iter_tokens) are read through a buffer
+        if isinstance(tokens, (list, tuple)):
+            tokens = TokenStream.from_tokens(tokens)
+        elif not isinstance(tokens, (TokenStream, TokenBuffer)):
+            tokens = TokenBuffer(tokens)
+
         self.tokens = tokens
+
+        # Every error found, in order, and the first one. stopped is set
+        # when the parse gave up on finding more than max_errors errors
+        self.errors = []
         self.error = None
+        self.max_errors = max_errors
+        self.stopped = False
+
+        # Strict mode. The budget is checked when token_idx reaches
+        # token_limit, so reading a token costs a single comparison
+        self.budget = budget
+        self.depth = 0
+        self.max_depth = math.inf
+        self.token_limit = math.inf
+        if budget is not None:
+            self.token_limit = 1
+            if budget.max_depth is not None:
+                self.max_depth = budget.max_depth
+
+        # Incremental mode, one (start, stop, node, ok, inner, tokens) span
+        # per top-level statement: it covers tokens start..stop-1 and also
+        # looked at token stop, ok means it had no errors, inner holds the
+        # spans of the statements directly inside it (relative to start,
+        # tokens None) and tokens every Token built for it. Used by
+        # reparse() to find the statements an edit left alone
+        self.incremental = incremental
+        self.spans = []
+        self.inner_spans = self.spans
+        self.span_start = 0
+        self.made_tokens = []
+
+        # Spans of the parse being updated and the changed token range,
+        # only set by reparse()
+        self.previous_spans = None
+        self.changed = UNCHANGED
+
+        # Leaf nodes by (node class, token type, lexeme), for this parse only:
+        # a leaf holds the token, and so the file, of its first occurrence.
+        # reparse() moves the tokens of reused nodes, which shared leaves
+        # cannot allow
+        self.leaves = None
+        if share_leaves:
+            if incremental:
+                raise ValueError("Leaves cannot be shared in an incremental parse")
+            self.leaves = {}
+
         self.token_idx = -1
+
+        # Index and type of the current token, the Token object itself
+        # is only built when a node or an error needs it
+        self.current_idx = -1
+        self.current_type = None
         self.read_token()
 
+    @property
+    def current_token(self):
+        token = self.tokens.token_at(self.current_idx)
+        if self.incremental:
+            self.made_tokens.append(token)
+        return token
+
+    @property
+    def current_value(self):
+        return self.tokens.value_at(self.current_idx)
+
+    def matches(self, type, value=None):
+        return self.current_type == type and self.current_value == value
+
     def read_token(self):
         self.token_idx += 1
+        if self.token_idx >= self.token_limit:
+            self.check_budget()
 
-        # Check if token index is within bounds
-        while self.token_idx < len(self.tokens):
-            self.current_token = self.tokens[self.token_idx]
+        # Check if token index is within bounds. Comments are not in the
+        # token stream (see TokenStream.trivia), so every token is significant.
+        # Operators like "***" have no type, so None alone is not the end
+        token_type = self.tokens.type_at(self.token_idx)
+        if token_type is not None or self.tokens.has_token(self.token_idx):
+            self.current_idx = self.token_idx
+            self.current_type = token_type
 
-            if self.current_token.type in ("SL_COMMENT", "ML_COMMENT"):
-                self.token_idx += 1  # Ignore comment tokens
-            else:
-                # UNCOMMENT WHEN DEBUGGING
-                # print(f"Current token: {self.current_token}")
-                return self.current_token
+            # UNCOMMENT WHEN DEBUGGING
+            # print(f"Current token: {self.current_token}")
+            return self.current_type
 
         return None
 
     def next_token(self):
-        next_idx = self.token_idx + 1
+        return self.tokens.type_at(self.token_idx + 1)
 
-        if next_idx < len(self.tokens):
-            return self.tokens[next_idx].type
-        return None
+    def at_end(self):
+        # At EOF, or every token has been read
+        return self.current_type == "EOF" or self.current_idx != self.token_idx
 
     def set_error(self, start_pos, end_pos, message):
-        self.error = InvalidSyntaxError(start_pos, end_pos, message)
+        # Abandons the current statement, see stmt(). A syntax error at an
+        # invalid token is reported as the lexical error while recovering
+        if self.current_type in ERROR_TOKEN_TYPES:
+            raise ParserPanic(None)
+        raise ParserPanic(InvalidSyntaxError(start_pos, end_pos, message))
+
+    def report(self, error):
+        # Errors past max_errors are dropped, the first one stops the parse
+        if self.max_errors is not None and len(self.errors) >= self.max_errors:
+            self.stopped = True
+            raise ErrorLimitReached()
+
+        self.errors.append(error)
+        if self.error is None:
+            self.error = error
+
+    # Strict mode
+    def check_budget(self):
+        budget = self.budget
+
+        if budget.max_tokens is not None and self.token_idx >= budget.max_tokens:
+            self.exhaust("tokens", budget.max_tokens)
+        if budget.expired():
+            self.exhaust("deadline", budget.timeout)
+
+        self.token_limit = self.token_idx + DEADLINE_CHECK_INTERVAL
+        if budget.max_tokens is not None:
+            self.token_limit = min(self.token_limit, budget.max_tokens)
+
+    def nest(self):
+        # Entered a nested statement, expression or list
+        self.depth += 1
+        if self.depth > self.max_depth:
+            self.exhaust("nesting", self.max_depth)
+
+    def exhaust(self, limit, max_value):
+        # Reported at the token being read, or the last one
+        token = self.tokens.token_at(self.token_idx) or self.current_token
+        raise BudgetExceeded(BudgetExceededError(token.start_pos, token.end_pos, limit, max_value))
+
+    def lexical_error(self):
+        # Error for the INVALID_TOKEN or UNCLOSED_STR current token
+        error_class = InvalidTokenError if self.current_type == "INVALID_TOKEN" else UnclosedStringError
+        token = self.current_token
+        return error_class(token.start_pos, token.end_pos, token.value)
 
     # Entry point of parser
     def otto_progstmt(self):
         statements = []
 
         # Parse multiple statements
-        while self.current_token is not None and self.current_token.type != "EOF":
-            stmt = self.stmt()
+        try:
+            while not self.at_end():
+                # Statements an edit left alone (see reparse)
+                if self.previous_spans is not None and self.reuse_stmts(statements):
+                    continue
+
+                stmt = self.stmt()
+
+                # Parse multiple statements
+                if stmt is not None:
+                    statements.append(stmt)
 
-            # Parse multiple statements
-            if stmt is not None:
-                statements.append(stmt)
+        # Too many errors, stop at the last complete statement
+        except ErrorLimitReached:
+            pass
+
+        # Out of budget (strict mode), the error is reported last
+        except BudgetExceeded as exceeded:
+            self.errors.append(exceeded.error)
+            if self.error is None:
+                self.error = exceeded.error
 
         return statements
 
-    # Statements
-    def stmt(self):
+    # Incremental parsing
+    def reparse(self, previous, changed):
+        # Same result as otto_progstmt(), for tokens edited (with
+        # Lexer.relex) since previous, the Parser of the old tokens, parsed
+        # them. changed is (first, old_stop, new_stop, shift) from
+        # TokenStream.take_changed(): tokens before first are the same, and
+        # tokens from new_stop on were tokens old_stop.. moved by shift
+        # characters. Error-free statements, at any depth, whose tokens and
+        # lookahead are all outside the change are reused instead of parsed.
+        # Tokens of reused statements after the edit are moved in place, so
+        # the previous tree must not be used afterwards
+        if not previous.incremental:
+            raise ValueError("The previous parse was not incremental")
+
+        self.incremental = True
+        self.previous_spans = previous.spans
+        self.changed = UNCHANGED if changed is None else changed
+        return self.otto_progstmt()
+
+    def previous_idx(self, idx):
+        # Index before the edit of token idx, None if it changed
+        first, old_stop, new_stop, shift = self.changed
+        if idx < first:
+            return idx
+        if idx >= new_stop:
+            return idx - (new_stop - old_stop)
+        return None
 
-        # Handle invalid tokens
-        if self.current_token.type == "INVALID_TOKEN":
-            self.error = InvalidTokenError(
-                self.current_token.start_pos,
-                self.current_token.end_pos,
-                self.current_token.value
-            )
-            self.read_token()
-            return None
+    def reusable(self, start, stop, ok):
+        # Whether the previous statement at tokens start..stop (previous
+        # indices) is unchanged
+        first, old_stop, new_stop, shift = self.changed
+        return ok and (stop < first or start >= old_stop)
+
+    def reuse_stmts(self, statements):
+        # Reuses the run of top-level statements that starts at the
+        # current token, returns whether there was one
+        first, old_stop, new_stop, shift = self.changed
+        start_idx = self.current_idx
+        previous_start = self.previous_idx(start_idx)
+        if previous_start is None:
+            return False
+
+        previous_spans = self.previous_spans
+        span_idx = bisect_left(previous_spans, previous_start, key=SPAN_START)
+        if span_idx == len(previous_spans) or previous_spans[span_idx][0] != previous_start:
+            return False
+
+        # Top-level statements follow each other without gaps, so the run
+        # ends at the edit or at the first statement with errors
+        if previous_start < first:
+            stop_idx = bisect_left(previous_spans, first, lo=span_idx, key=SPAN_STOP)
+            shift = 0
+        else:
+            stop_idx = len(previous_spans)
+
+        oks = list(map(SPAN_OK, previous_spans[span_idx:stop_idx]))
+        if False in oks:
+            stop_idx = span_idx + oks.index(False)
+        if stop_idx == span_idx:
+            return False
+
+        run = previous_spans[span_idx:stop_idx]
+        statements.extend(filter(None, map(SPAN_NODE, run)))
+
+        moved = start_idx - previous_start
+        if moved or shift:
+            moved_run = []
+            for start, stop, node, ok, inner, tokens in run:
+                if tokens is None:
+                    tokens = node_tokens(node)
+                if shift:
+                    move_tokens(tokens, shift)
+                moved_run.append((start + moved, stop + moved, node, ok, inner, tokens))
+            run = moved_run
+        self.spans.extend(run)
+
+        self.token_idx = run[-1][1] - 1
+        self.read_token()
+        return True
 
-        # Handle unclosed strings
-        if self.current_token.type == "UNCLOSED_STR":
-            self.error = UnclosedStringError(
-                self.current_token.start_pos,
-                self.current_token.end_pos,
-                self.current_token.value
-            )
-            self.read_token()
+    def previous_span(self, start_idx):
+        # Span of the previous parse for an unchanged statement that starts
+        # at token start_idx, with previous start and stop indices
+        previous_start = self.previous_idx(start_idx)
+        if previous_start is None:
             return None
 
-        # Parse either assignment or input statement
-        if self.current_token.type == "IDENTIFIER":
+        spans = self.previous_spans
+        base = 0
+        while spans:
+            span_idx = bisect_left(spans, previous_start - base + 1, key=SPAN_START) - 1
+            if span_idx < 0:
+                return None
 
-            # If next token is "=", go to either input or assignment statement
-            if self.next_token() == "ASSIGN_OP":
-                # Read the identifier token
-                identifier = self.current_token
-                self.read_token()
+            start, stop, node, ok, inner, tokens = spans[span_idx]
+            start += base
+            stop += base
 
-                # Read the assignment operator
-                op = self.current_token
-                self.read_token()
+            if start == previous_start:
+                if not self.reusable(start, stop, ok):
+                    return None
+                return start, stop, node, ok, inner, tokens
 
-                # Parse as input statement if "input" keyword is found
-                if self.current_token.matches("KEYWORD", "input"):
-                    return self.input_stmt(identifier)
+            # Look inside the statement that contains it
+            if previous_start >= stop:
+                return None
+            spans = inner
+            base = start
 
-                # Otherwise, parse as assignment statement
-                return self.assign_stmt(identifier, op)
+        return None
 
-            # For compound assignment expressions
-            compound_assign_ops = ("ADD_ASSIGN_OP", "SUB_ASSIGN_OP", "MUL_ASSIGN_OP",
-                                   "DIV_ASSIGN_OP", "FDIV_ASSIGN_OP", "MOD_ASSIGN_OP",
-                                   "POW_ASSIGN_OP")
+    def reuse_stmt(self, span):
+        start, stop, node, ok, inner, tokens = span
+        start_idx = self.current_idx
+        stop_idx = stop + start_idx - start
 
-            if self.next_token() in compound_assign_ops:
-                # Read the identifier token
-                identifier = self.current_token
-                self.read_token()
+        if tokens is None:
+            tokens = node_tokens(node)
+        if start >= self.changed[1] and self.changed[3]:
+            move_tokens(tokens, self.changed[3])
 
-                # Read the compound assignment operator
-                op = self.current_token
-                self.read_token()
+        # Tokens are only kept for top-level statements
+        if self.inner_spans is self.spans:
+            self.spans.append((start_idx, stop_idx, node, True, inner, tokens))
+        else:
+            self.made_tokens.extend(tokens)
+            self.inner_spans.append((start_idx - self.span_start, stop_idx - self.span_start, node, True, inner, None))
 
-                # Parse as assignment statement
-                return self.assign_stmt(identifier, op)
+        self.token_idx = stop_idx - 1
+        self.read_token()
+        return node
 
-            # For function calls
-            if self.next_token() == "LPAREN_DELIM":
-                return self.function_call()
+    def open_span(self, start_idx):
+        # Collects the spans of the statements inside the one at start_idx
+        parent = (self.inner_spans, self.span_start, len(self.errors))
+        self.inner_spans = []
+        self.span_start = start_idx
+        return parent
 
-        # Parse output statement
-        elif self.current_token.matches("KEYWORD", "utter"):
-            return self.output_stmt()
+    def close_span(self, parent, start_idx, node):
+        inner = tuple(self.inner_spans)
+        self.inner_spans, self.span_start, errors = parent
 
-        # Parse conditional statement
-        elif self.current_token.matches("KEYWORD", "if"):
-            return self.conditional_stmt()
+        tokens = None
+        if self.inner_spans is self.spans:
+            tokens = tuple(self.made_tokens)
+            self.made_tokens.clear()
 
-        # Parse iterative statements
-        elif self.current_token.matches("KEYWORD", "for"):
-            return self.for_stmt()
+        span_start = self.span_start
+        ok = len(self.errors) == errors
+        self.inner_spans.append((start_idx - span_start, self.current_idx - span_start, node, ok, inner, tokens))
 
-        elif self.current_token.matches("KEYWORD", "while"):
-            return self.while_stmt()
+    # Statements
+    def stmt(self):
+        start_idx = self.current_idx
+
+        if self.incremental:
+            if self.previous_spans is not None:
+                span = self.previous_span(start_idx)
+                if span is not None:
+                    return self.reuse_stmt(span)
+            parent = self.open_span(start_idx)
+
+        depth = self.depth
+        self.nest()
+
+        try:
+            node = self.dispatch_stmt()
+        except ParserPanic as panic:
+            node = self.recover(panic.error, start_idx)
+
+        self.depth = depth
+        if self.incremental:
+            self.close_span(parent, start_idx, node)
+        return node
+
+    def dispatch_stmt(self):
+        # Statements are chosen by token type, or by keyword for keywords
+        handler = self.type_stmts.get(self.current_type)
+        if handler is None and self.current_type == "KEYWORD":
+            handler = self.keyword_stmts.get(self.current_value)
+
+        # Otherwise, parse arithmetic and/or boolean expressions
+        if handler is None:
+            return self.expr_stmt()
+
+        return handler(self)
+
+    @classmethod
+    def register_stmt(cls, handler, keyword=None, token_type=None):
+        # Adds a statement kind: handler(parser) is called when the current
+        # token is the given keyword or has the given type. Tables are
+        # copied, so registering on a subclass leaves Parser unchanged
+        if keyword is not None:
+            cls.keyword_stmts = {**cls.keyword_stmts, keyword: handler}
+        if token_type is not None:
+            cls.type_stmts = {**cls.type_stmts, token_type: handler}
+
+    # Handle invalid tokens and unclosed strings
+    def invalid_token(self):
+        error = self.lexical_error()
+        self.read_token()
+
+        self.report(error)
+        return ErrorNode(error)
+
+    # Panic mode error recovery
+    def recover(self, error, start_idx):
+        first_error = len(self.errors)
+        if error is not None:
+            self.report(error)
+
+        # Always move past the token the statement started at
+        self.synchronize(skip_first=self.current_idx == start_idx)
+
+        if len(self.errors) > first_error:
+            error = self.errors[first_error]
+        return ErrorNode(error)
+
+    def synchronize(self, skip_first=False):
+        # Skips to the end of the broken statement: past ";" or a whole
+        # "{ ... }" block, or up to a "}" or statement keyword. Invalid
+        # tokens skipped on the way are reported
+        depth = 0
+
+        while not self.at_end():
+            token_type = self.current_type
+
+            if depth == 0 and not skip_first:
+                if token_type == "RBRACE_DELIM":
+                    return
+                if token_type == "KEYWORD" and self.current_value in self.keyword_stmts:
+                    return
+            skip_first = False
 
-        # Parse function definition
-        elif self.current_token.matches("KEYWORD", "def"):
-            return self.function_def()
+            if token_type in ERROR_TOKEN_TYPES:
+                self.report(self.lexical_error())
+            self.read_token()
 
-        elif self.current_token.matches("KEYWORD", "return"):
-            return self.return_stmt()
+            if token_type == "LBRACE_DELIM":
+                depth += 1
+            elif token_type == "RBRACE_DELIM":
+                depth = max(depth - 1, 0)
+                if depth == 0:
+                    return
+            elif token_type == "SEMI_DELIM" and depth == 0:
+                return
+
+    # Parse assignment, input statement or function call
+    def identifier_stmt(self):
+        next_type = self.next_token()
+
+        # If next token is "=", go to either input or assignment statement.
+        # Compound assignment operators always go to assignment statement
+        if next_type == "ASSIGN_OP" or next_type in COMPOUND_ASSIGN_OPS:
+            # Read the identifier token
+            identifier = self.current_token
+            self.read_token()
 
-        # Parse special features
-        elif (self.current_token.type == "KEYWORD" and
-              self.current_token.value in ("Ottomate", "step", "test", "execute")):
-            return self.uniq_stmt()
+            # Read the assignment operator
+            op = self.current_token
+            self.read_token()
 
-        # Parse arithmetic and/or boolean expressions
-        expr = self.logical_expr()
+            # Parse as input statement if "input" keyword is found
+            if next_type == "ASSIGN_OP" and self.matches("KEYWORD", "input"):
+                return self.input_stmt(identifier)
+
+            # Otherwise, parse as assignment statement
+            return self.assign_stmt(identifier, op)
+
+        # For function calls
+        if next_type == "LPAREN_DELIM":
+            return self.function_call()
+
+        return self.expr_stmt()
+
+    def expr_stmt(self):
+        expr = self.expr()
 
         # Check if expression ends with semicolon
-        if self.current_token.type != "SEMI_DELIM":
+        if self.current_type != "SEMI_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -165,7 +560,7 @@ class Parser:
         self.read_token()
 
         # Check if next token is "("
-        if self.current_token.type != "LPAREN_DELIM":
+        if self.current_type != "LPAREN_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -178,7 +573,7 @@ class Parser:
         value = self.atom()
 
         # Check if next token is ")"
-        if self.current_token.type != "RPAREN_DELIM":
+        if self.current_type != "RPAREN_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -188,7 +583,7 @@ class Parser:
         self.read_token()
 
         # Check if statement ends with semicolon
-        if self.current_token.type != "SEMI_DELIM":
+        if self.current_type != "SEMI_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -197,14 +592,14 @@ class Parser:
             return None
         self.read_token()
 
-        return InputStmtNode(value)
+        return InputStmtNode(identifier, value)
 
     def output_stmt(self):
         # Read "utter" keyword
         self.read_token()
 
         # Check if next token is "("
-        if self.current_token.type != "LPAREN_DELIM":
+        if self.current_type != "LPAREN_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -214,10 +609,10 @@ class Parser:
         self.read_token()
 
         # Parse output value
-        output = self.logical_expr()
+        output = self.expr()
 
         # Check if next token is ")"
-        if self.current_token.type != "RPAREN_DELIM":
+        if self.current_type != "RPAREN_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -227,7 +622,7 @@ class Parser:
         self.read_token()
 
         # Check if statement ends with semicolon
-        if self.current_token.type != "SEMI_DELIM":
+        if self.current_type != "SEMI_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -252,7 +647,7 @@ class Parser:
         cases.append((if_condition, if_body))
 
         # Parse elif conditions and bodies
-        while self.current_token.matches("KEYWORD", "elif"):
+        while self.matches("KEYWORD", "elif"):
             # Read "elif" keyword
             self.read_token()
 
@@ -262,7 +657,7 @@ class Parser:
             cases.append((elif_condition, elif_body))
 
         # Parse else body
-        if self.current_token.matches("KEYWORD", "else"):
+        if self.matches("KEYWORD", "else"):
             # Read "else" keyword
             self.read_token()
 
@@ -277,7 +672,7 @@ class Parser:
         self.read_token()
 
         # Check for loop variable
-        if self.current_token.type != "IDENTIFIER":
+        if self.current_type != "IDENTIFIER":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -290,7 +685,7 @@ class Parser:
         self.read_token()
 
         # Check for "in" keyword
-        if self.current_token.type != "MEMBER_OP":
+        if self.current_type != "MEMBER_OP":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -300,7 +695,7 @@ class Parser:
         self.read_token()
 
         # Check for list
-        if self.current_token.type not in ("IDENTIFIER", "LBRACK_DELIM"):
+        if self.current_type not in ("IDENTIFIER", "LBRACK_DELIM"):
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -310,14 +705,14 @@ class Parser:
 
         # Get list variable
         arr = None
-        if self.current_token.type == "IDENTIFIER":
+        if self.current_type == "IDENTIFIER":
             arr = self.current_token
             self.read_token()
         else:
             arr = self.list()
 
         # Parse for loop body
-        if self.current_token.type != "LBRACE_DELIM":
+        if self.current_type != "LBRACE_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -343,7 +738,7 @@ class Parser:
         self.read_token()
 
         # Check if next token is an identifier
-        if self.current_token.type != "IDENTIFIER":
+        if self.current_type != "IDENTIFIER":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -356,7 +751,7 @@ class Parser:
         self.read_token()
 
         # Check if next token is "("
-        if self.current_token.type != "LPAREN_DELIM":
+        if self.current_type != "LPAREN_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -366,24 +761,12 @@ class Parser:
         self.read_token()
 
         # Get function parameters
-        params = []
-        while self.current_token.type != "RPAREN_DELIM":
-            if self.current_token.type != "IDENTIFIER":
-                self.set_error(
-                    self.current_token.start_pos,
-                    self.current_token.end_pos,
-                    "Expected an identifier"
-                )
-                return None
-
-            params.append(self.current_token)
-            self.read_token()
-
-            if self.current_token.type == "COMMA_DELIM":
-                self.read_token()
+        params = self.function_params()
+        if params is None:
+            return None
 
         # Check if next token is ")"
-        if self.current_token.type != "RPAREN_DELIM":
+        if self.current_type != "RPAREN_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -399,13 +782,14 @@ class Parser:
 
     def return_stmt(self):
         # Read "return" keyword
+        keyword = self.current_token
         self.read_token()
 
         # Parse return value
-        value = self.logical_expr()
+        value = self.expr()
 
         # Check if statement ends with semicolon
-        if self.current_token.type != "SEMI_DELIM":
+        if self.current_type != "SEMI_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -414,25 +798,7 @@ class Parser:
             return None
         self.read_token()
 
-        return ReturnStmtNode(value)
-
-    # New Features
-    def uniq_stmt(self):
-        # Ottomate
-        if self.current_token.matches("KEYWORD", "Ottomate"):
-            return self.ottomate()
-
-        # step
-        if self.current_token.matches("KEYWORD", "step"):
-            return self.step()
-
-        # test
-        if self.current_token.matches("KEYWORD", "test"):
-            return self.test()
-
-        # execute
-        if self.current_token.matches("KEYWORD", "execute"):
-            return self.execute()
+        return ReturnStmtNode(keyword, value)
 
     # SPECIAL FEATURES
     def ottomate(self):
@@ -440,7 +806,7 @@ class Parser:
         self.read_token()
 
         # Check if next token is an identifier
-        if self.current_token.type != "IDENTIFIER":
+        if self.current_type != "IDENTIFIER":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -453,7 +819,7 @@ class Parser:
         self.read_token()
 
         # Check if statement ends with semicolon
-        if self.current_token.type != "SEMI_DELIM":
+        if self.current_type != "SEMI_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -469,7 +835,7 @@ class Parser:
         self.read_token()
 
         # Check if next token is an identifier
-        if self.current_token.type != "IDENTIFIER":
+        if self.current_type != "IDENTIFIER":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -482,7 +848,7 @@ class Parser:
         self.read_token()
 
         # Check if statement ends with semicolon
-        if self.current_token.type != "SEMI_DELIM":
+        if self.current_type != "SEMI_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -497,10 +863,11 @@ class Parser:
         cases = []
 
         # Read "test" keyword
+        keyword = self.current_token
         self.read_token()
 
         # Check for "{"
-        if self.current_token.type != "LBRACE_DELIM":
+        if self.current_type != "LBRACE_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -510,14 +877,12 @@ class Parser:
         self.read_token()
 
         # Parse test cases
-        while self.current_token.type != "RBRACE_DELIM":
-            cases.append(self.function_call())
-
-            if self.current_token.type == "COMMA_DELIM":
-                self.read_token()
+        while self.current_type not in ("RBRACE_DELIM", "EOF"):
+            cases.append(self.call())
+            self.test_separator()
 
         # Check for "}"
-        if self.current_token.type != "RBRACE_DELIM":
+        if self.current_type != "RBRACE_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -526,14 +891,32 @@ class Parser:
             return None
         self.read_token()
 
-        return TestStmtNode(cases)
+        return TestStmtNode(keyword, cases)
+
+    def test_separator(self):
+        # A test case is a call followed by ";", "," or "; ," (as in
+        # "f(1); , g()"), or by nothing when it is the last one
+        separated = False
+        if self.current_type == "SEMI_DELIM":
+            self.read_token()
+            separated = True
+        if self.current_type == "COMMA_DELIM":
+            self.read_token()
+            separated = True
+
+        if not separated and self.current_type != "RBRACE_DELIM":
+            self.set_error(
+                self.current_token.start_pos,
+                self.current_token.end_pos,
+                "Expected ',' or '}'"
+            )
 
     def execute(self):
         # Read "execute" keyword
         self.read_token()
 
         # Check if next token is "("
-        if self.current_token.type != "LPAREN_DELIM":
+        if self.current_type != "LPAREN_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -546,7 +929,7 @@ class Parser:
         arr = self.list()
 
         # Check if next token is ","
-        if self.current_token.type != "COMMA_DELIM":
+        if self.current_type != "COMMA_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -556,7 +939,7 @@ class Parser:
         self.read_token()
 
         # Parse function call
-        if self.current_token.type != "IDENTIFIER":
+        if self.current_type != "IDENTIFIER":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -567,7 +950,7 @@ class Parser:
         self.read_token()
 
         # Check if next token is ")"
-        if self.current_token.type != "RPAREN_DELIM":
+        if self.current_type != "RPAREN_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -577,7 +960,7 @@ class Parser:
         self.read_token()
 
         # Check if statement ends with semicolon
-        if self.current_token.type != "SEMI_DELIM":
+        if self.current_type != "SEMI_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -588,74 +971,80 @@ class Parser:
 
         return ExecuteStmtNode(arr, func)
 
-    # OPERATIONS (lowest to highest precedence: logical_expr -> atom)
-    # Boolean expressions
+    # OPERATIONS (precedence table: BINARY_OP_PRECEDENCE in constants.py)
+    # Boolean and arithmetic expressions
+    def expr(self, min_precedence=1):
+        self.nest()
 
-    def logical_expr(self):
-        return self.binary_op(self.comparison_expr, ("AND_OP", "OR_OP"))
-
-    def comparison_expr(self):
-        # not
-        if self.current_token.type == "NOT_OP":
-            not_token = self.current_token
+        # Prefix operators (not, unary + and -)
+        unary_precedence = UNARY_OP_PRECEDENCE.get(self.current_type)
+        if unary_precedence is not None and min_precedence <= unary_precedence:
+            op_token = self.current_token
             self.read_token()
+            left_node = UnaryOpNode(op_token, self.expr(unary_precedence))
+        elif self.current_type in OPERAND_NODES:
+            # Numbers, strings and identifiers
+            left_node = self.leaf(OPERAND_NODES[self.current_type])
+            self.read_token()
+        else:
+            left_node = self.atom()
 
-            node = self.comparison_expr()
-
-            return UnaryOpNode(not_token, node)
+        # Binary operators that bind at least as tight as min_precedence
+        while True:
+            precedence = BINARY_OP_PRECEDENCE.get(self.current_type)
+            if precedence is None or precedence < min_precedence:
+                self.depth -= 1
+                return left_node
 
-        # Comparison operators
-        comparison_ops = ("LT_OP", "GT_OP", "LTE_OP",
-                          "GTE_OP", "EQ_OP", "NEQ_OP")
-        return self.binary_op(self.add_subract, comparison_ops)
+            op_type = self.current_type
+            op_token = self.current_token
+            self.read_token()
 
-    # Arithmetic expressions
-    def add_subract(self):
-        return self.binary_op(self.modulo_multiply_divide, ("ADD_OP", "SUB_OP"))
+            # Left-associative operators only take tighter operators on the right
+            if op_type in RIGHT_ASSOC_OPS:
+                right_node = self.expr(precedence)
+            else:
+                right_node = self.expr(precedence + 1)
 
-    def modulo_multiply_divide(self):
-        return self.binary_op(self.factor, ("MOD_OP", "MUL_OP", "DIV_OP", "FDIV_OP"))
+            left_node = BinaryOpNode(left_node, op_token, right_node)
 
-    # For unary operation or exponentiation
-    def factor(self):
-        # Parse unary operations (positive or negative nums)
-        token = self.current_token
-        if token.type in ("ADD_OP", "SUB_OP"):
-            self.read_token()
-            factor = self.factor()
-            return UnaryOpNode(token, factor)
+    # For function call statements
+    def function_call(self):
+        call = self.call()
 
-        # For exponentiation
-        return self.power()
+        # Check for semicolon
+        if self.current_type != "SEMI_DELIM":
+            self.set_error(
+                self.current_token.start_pos,
+                self.current_token.end_pos,
+                "Expected ';'"
+            )
+            return None
+        self.read_token()
 
-    def power(self):
-        return self.binary_op(self.atom, ("POW_OP",), self.factor)
+        return call
 
-    # For function calls
-    def function_call(self):
+    # For function calls, without the ";" of a statement
+    def call(self):
         atom = self.atom()
 
         # For function calls
-        if self.current_token.type == "LPAREN_DELIM":
+        if self.current_type == "LPAREN_DELIM":
             self.read_token()
             args = []
 
-            # No arguments
-            if self.current_token.type == "RPAREN_DELIM":
-                self.read_token()
-                return FunctionCallNode(atom, args)
+            # Parse arguments, if any
+            if self.current_type != "RPAREN_DELIM":
+                args.append(self.atom())
 
-            # Parse first argument
-            args.append(self.atom())
+                # Parse subsequent args if any
+                while self.current_type == "COMMA_DELIM":
+                    self.read_token()
 
-            # Parse subsequent args if any
-            while self.current_token.type == "COMMA_DELIM":
-                self.read_token()
-
-                args.append(self.atom())
+                    args.append(self.atom())
 
             # Check for closing parenthesis
-            if self.current_token.type != "RPAREN_DELIM":
+            if self.current_type != "RPAREN_DELIM":
                 self.set_error(
                     self.current_token.start_pos,
                     self.current_token.end_pos,
@@ -664,63 +1053,70 @@ class Parser:
                 return None
             self.read_token()
 
-            # Check for semicolon
-            if self.current_token.type != "SEMI_DELIM":
-                self.set_error(
-                    self.current_token.start_pos,
-                    self.current_token.end_pos,
-                    "Expected ';'"
-                )
-                return None
-            self.read_token()
-
             return FunctionCallNode(atom, args)
 
         # Continue to atom method if not function call
         return atom
 
+    def leaf(self, node_class):
+        # Node of the current token. With share_leaves, equal leaves are the
+        # same node, holding the token of their first occurrence
+        if self.leaves is None:
+            return node_class(self.current_token)
+
+        key = (node_class, self.current_type, self.current_value)
+        node = self.leaves.get(key)
+        if node is None:
+            node = self.leaves[key] = node_class(self.current_token)
+        return node
+
     # Literals and parenthesis expressions
     def atom(self):
-        token = self.current_token
+        token_type = self.current_type
 
         # Parse numbers
-        if token.type in ("INT", "FLOAT"):
+        if token_type in ("INT", "FLOAT"):
+            node = self.leaf(NumberNode)
             self.read_token()
-            return NumberNode(token)
+            return node
 
         # Parse strings
-        elif token.type == "STRING":
+        elif token_type == "STRING":
+            node = self.leaf(StringNode)
             self.read_token()
-            return StringNode(token)
+            return node
 
         # Parse booleans
-        elif token.matches("RESWORD", "true") or token.matches("RESWORD", "false"):
+        elif self.matches("RESWORD", "true") or self.matches("RESWORD", "false"):
+            node = self.leaf(BoolNode)
             self.read_token()
-            return BoolNode(token)
+            return node
 
         # Parse null
-        elif token.matches("RESWORD", "null"):
+        elif self.matches("RESWORD", "null"):
+            node = self.leaf(NullNode)
             self.read_token()
-            return NullNode(token)
+            return node
 
         # Parse identifiers
-        elif token.type == "IDENTIFIER":
+        elif token_type == "IDENTIFIER":
+            node = self.leaf(IdentifierNode)
             self.read_token()
-            return IdentifierNode(token)
+            return node
 
         # Parse lists
-        elif token.type == "LBRACK_DELIM":
+        elif token_type == "LBRACK_DELIM":
             return self.list()
 
         # Parse parenthesis expressions
-        elif token.type == "LPAREN_DELIM":
+        elif token_type == "LPAREN_DELIM":
             self.read_token()
 
             # Get expression inside parenthesis
-            expr = self.logical_expr()
+            expr = self.expr()
 
             # Check if parenthesis is closed
-            if self.current_token.type != "RPAREN_DELIM":
+            if self.current_type != "RPAREN_DELIM":
                 self.set_error(
                     self.current_token.start_pos,
                     self.current_token.end_pos,
@@ -740,46 +1136,51 @@ class Parser:
         return None
 
     # HELPER METHODS
-    def binary_op(self, left_nonterminal, accepted_ops, right_nonterminal=None):
-        # Both left and right nonterminals are the same
-        if right_nonterminal is None:
-            right_nonterminal = left_nonterminal
+    def function_params(self):
+        params = []
 
-        left_node = left_nonterminal()
+        while self.current_type not in ("RPAREN_DELIM", "EOF"):
+            if self.current_type != "IDENTIFIER":
+                self.set_error(
+                    self.current_token.start_pos,
+                    self.current_token.end_pos,
+                    "Expected an identifier"
+                )
+                return None
 
-        while self.current_token.type in accepted_ops:
-            op_token = self.current_token
+            params.append(self.current_token)
             self.read_token()
 
-            # Recursively get the following operands
-            right_node = right_nonterminal()
-
-            left_node = BinaryOpNode(left_node, op_token, right_node)
+            if self.current_type == "COMMA_DELIM":
+                self.read_token()
 
-        return left_node
+        return params
 
     def list(self):
         elements = []
+        self.nest()
 
         # Read "[" token
+        bracket = self.current_token
         self.read_token()
 
         # For empty list
-        if self.current_token.type == "RBRACK_DELIM":
+        if self.current_type == "RBRACK_DELIM":
             self.read_token()
-            return ListNode(elements)
+            self.depth -= 1
+            return ListNode(bracket, elements)
 
         # Get first element
         elements.append(self.atom())
 
         # Parse subsequent elements if any
-        while self.current_token.type == "COMMA_DELIM":
+        while self.current_type == "COMMA_DELIM":
             self.read_token()
 
             elements.append(self.atom())
 
         # Check for "]"
-        if self.current_token.type != "RBRACK_DELIM":
+        if self.current_type != "RBRACK_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -788,11 +1189,12 @@ class Parser:
             return None
         self.read_token()
 
-        return ListNode(elements)
+        self.depth -= 1
+        return ListNode(bracket, elements)
 
     def condition_check(self):
         # Check if next token is "("
-        if self.current_token.type != "LPAREN_DELIM":
+        if self.current_type != "LPAREN_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -802,10 +1204,10 @@ class Parser:
         self.read_token()
 
         # Parse condition expression
-        condition = self.logical_expr()
+        condition = self.expr()
 
         # Check if next token is ")"
-        if self.current_token.type != "RPAREN_DELIM":
+        if self.current_type != "RPAREN_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -818,7 +1220,7 @@ class Parser:
 
     def code_block(self):
         # Check if next token is "{"
-        if self.current_token.type != "LBRACE_DELIM":
+        if self.current_type != "LBRACE_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -829,13 +1231,13 @@ class Parser:
 
         # Get block body
         body = []
-        while self.current_token.type != "RBRACE_DELIM":
+        while self.current_type not in ("RBRACE_DELIM", "EOF"):
             stmt = self.stmt()
             if stmt:
                 body.append(stmt)
 
         # Check if next token is "}"
-        if self.current_token.type != "RBRACE_DELIM":
+        if self.current_type != "RBRACE_DELIM":
             self.set_error(
                 self.current_token.start_pos,
                 self.current_token.end_pos,
@@ -845,3 +1247,28 @@ class Parser:
         self.read_token()
 
         return body
+
+    # Statement dispatch tables, extended through register_stmt()
+    type_stmts = {
+        "INVALID_TOKEN": invalid_token,
+        "UNCLOSED_STR": invalid_token,
+        "IDENTIFIER": identifier_stmt,
+    }
+
+    keyword_stmts = {
+        # Output, conditional and iterative statements
+        "utter": output_stmt,
+        "if": conditional_stmt,
+        "for": for_stmt,
+        "while": while_stmt,
+
+        # Functions
+        "def": function_def,
+        "return": return_stmt,
+
+        # Special features
+        "Ottomate": ottomate,
+        "step": step,
+        "test": test,
+        "execute": execute,
+    }
@@ -0,0 +1,491 @@
+from types import GeneratorType
+
+from lexical_analyzer.constants import BINARY_OP_PRECEDENCE, COMPOUND_ASSIGN_OPS, RIGHT_ASSOC_OPS, UNARY_OP_PRECEDENCE
+from syntax_analyzer.nodes import *
+from syntax_analyzer.parser import OPERAND_NODES, Parser, ParserPanic
+
+
+class StackParser(Parser):
+    # Parser that keeps nested blocks and expressions on an explicit stack
+    # instead of the Python call stack, so nesting depth is only limited by
+    # memory. Every rule that nests is a generator (the *_steps methods):
+    # it yields the generator of the nested rule and is sent back its node
+    # (or has its exception thrown in). Produces the same nodes and errors
+    # as Parser
+    def run(self, steps):
+        stack = [steps]
+        value = None
+        error = None
+
+        while stack:
+            try:
+                if error is None:
+                    nested = stack[-1].send(value)
+                else:
+                    nested = stack[-1].throw(error)
+            except StopIteration as result:
+                stack.pop()
+                value = result.value
+                error = None
+            except Exception as exc:
+                stack.pop()
+                if not stack:
+                    raise
+                error = exc
+            else:
+                stack.append(nested)
+                value = None
+                error = None
+
+        return value
+
+    def expect(self, token_type, message):
+        # Reads a token of the given type, otherwise sets an error
+        if self.current_type != token_type:
+            self.set_error(
+                self.current_token.start_pos,
+                self.current_token.end_pos,
+                message
+            )
+            return False
+        self.read_token()
+
+        return True
+
+    # Entry points, same as Parser
+    def stmt(self):
+        return self.run(self.stmt_steps())
+
+    def expr(self, min_precedence=1):
+        return self.run(self.expr_steps(min_precedence))
+
+    def atom(self):
+        return self.run(self.atom_steps())
+
+    def code_block(self):
+        return self.run(self.code_block_steps())
+
+    # Statements
+    def stmt_steps(self):
+        start_idx = self.current_idx
+
+        if self.incremental:
+            if self.previous_spans is not None:
+                span = self.previous_span(start_idx)
+                if span is not None:
+                    return self.reuse_stmt(span)
+            parent = self.open_span(start_idx)
+
+        depth = self.depth
+        self.nest()
+
+        try:
+            node = yield self.dispatch_stmt_steps()
+        except ParserPanic as panic:
+            node = self.recover(panic.error, start_idx)
+
+        self.depth = depth
+        if self.incremental:
+            self.close_span(parent, start_idx, node)
+        return node
+
+    def dispatch_stmt_steps(self):
+        handler = self.type_stmts.get(self.current_type)
+        if handler is None and self.current_type == "KEYWORD":
+            handler = self.keyword_stmts.get(self.current_value)
+
+        # Otherwise, parse arithmetic and/or boolean expressions
+        if handler is None:
+            return (yield self.expr_stmt_steps())
+
+        # Handlers are either *_steps generators or plain functions
+        # returning a node (e.g. statements that never nest)
+        node = handler(self)
+        if isinstance(node, GeneratorType):
+            node = yield node
+
+        return node
+
+    def identifier_stmt_steps(self):
+        next_type = self.next_token()
+
+        # Assignment or input statement
+        if next_type == "ASSIGN_OP" or next_type in COMPOUND_ASSIGN_OPS:
+            identifier = self.current_token
+            self.read_token()
+
+            op = self.current_token
+            self.read_token()
+
+            if next_type == "ASSIGN_OP" and self.matches("KEYWORD", "input"):
+                return (yield self.input_stmt_steps(identifier))
+
+            value = yield self.stmt_steps()
+            return AssignStmtNode(identifier, op, value)
+
+        # For function calls
+        if next_type == "LPAREN_DELIM":
+            return (yield self.function_call_steps())
+
+        return (yield self.expr_stmt_steps())
+
+    def expr_stmt_steps(self):
+        expr = yield self.expr_steps()
+
+        if not self.expect("SEMI_DELIM", "Expected ';'"):
+            return None
+
+        return expr
+
+    def input_stmt_steps(self, identifier):
+        # Read "input" keyword
+        self.read_token()
+
+        if not self.expect("LPAREN_DELIM", "Expected '('"):
+            return None
+
+        value = yield self.atom_steps()
+
+        if not self.expect("RPAREN_DELIM", "Expected ')'"):
+            return None
+        if not self.expect("SEMI_DELIM", "Expected ';'"):
+            return None
+
+        return InputStmtNode(identifier, value)
+
+    def output_stmt_steps(self):
+        # Read "utter" keyword
+        self.read_token()
+
+        if not self.expect("LPAREN_DELIM", "Expected '('"):
+            return None
+
+        output = yield self.expr_steps()
+
+        if not self.expect("RPAREN_DELIM", "Expected ')'"):
+            return None
+        if not self.expect("SEMI_DELIM", "Expected ';'"):
+            return None
+
+        return OutputStmtNode(output)
+
+    def conditional_stmt_steps(self):
+        cases = []
+        else_case = None
+
+        # Read "if" keyword
+        self.read_token()
+
+        if_condition = yield self.condition_check_steps()
+        if_body = yield self.code_block_steps()
+        cases.append((if_condition, if_body))
+
+        while self.matches("KEYWORD", "elif"):
+            self.read_token()
+
+            elif_condition = yield self.condition_check_steps()
+            elif_body = yield self.code_block_steps()
+            cases.append((elif_condition, elif_body))
+
+        if self.matches("KEYWORD", "else"):
+            self.read_token()
+
+            else_case = yield self.code_block_steps()
+
+        return ConditionalStmtNode(cases, else_case)
+
+    def for_stmt_steps(self):
+        # Read "for" keyword
+        self.read_token()
+
+        if self.current_type != "IDENTIFIER":
+            self.set_error(
+                self.current_token.start_pos,
+                self.current_token.end_pos,
+                "Expected an identifier"
+            )
+            return None
+
+        loop_var = self.current_token
+        self.read_token()
+
+        if not self.expect("MEMBER_OP", "Expected 'in' keyword"):
+            return None
+
+        if self.current_type not in ("IDENTIFIER", "LBRACK_DELIM"):
+            self.set_error(
+                self.current_token.start_pos,
+                self.current_token.end_pos,
+                "Expected list variable"
+            )
+            return None
+
+        if self.current_type == "IDENTIFIER":
+            arr = self.current_token
+            self.read_token()
+        else:
+            arr = yield self.list_steps()
+
+        if self.current_type != "LBRACE_DELIM":
+            self.set_error(
+                self.current_token.start_pos,
+                self.current_token.end_pos,
+                "Expected '{'"
+            )
+            return None
+        body = yield self.code_block_steps()
+
+        return ForStmtNode(loop_var, arr, body)
+
+    def while_stmt_steps(self):
+        # Read "while" keyword
+        self.read_token()
+
+        condition = yield self.condition_check_steps()
+        body = yield self.code_block_steps()
+
+        return WhileStmtNode(condition, body)
+
+    def function_def_steps(self):
+        # Read "def" keyword
+        self.read_token()
+
+        if self.current_type != "IDENTIFIER":
+            self.set_error(
+                self.current_token.start_pos,
+                self.current_token.end_pos,
+                "Expected an identifier"
+            )
+            return None
+
+        identifier = self.current_token
+        self.read_token()
+
+        if not self.expect("LPAREN_DELIM", "Expected an '('"):
+            return None
+
+        params = self.function_params()
+        if params is None:
+            return None
+
+        if not self.expect("RPAREN_DELIM", "Expected an ')'"):
+            return None
+
+        body = yield self.code_block_steps()
+
+        return FunctionDefNode(identifier, params, body)
+
+    def return_stmt_steps(self):
+        # Read "return" keyword
+        keyword = self.current_token
+        self.read_token()
+
+        value = yield self.expr_steps()
+
+        if not self.expect("SEMI_DELIM", "Expected an ';'"):
+            return None
+
+        return ReturnStmtNode(keyword, value)
+
+    def test_steps(self):
+        cases = []
+
+        # Read "test" keyword
+        keyword = self.current_token
+        self.read_token()
+
+        if not self.expect("LBRACE_DELIM", "Expected '{'"):
+            return None
+
+        while self.current_type not in ("RBRACE_DELIM", "EOF"):
+            cases.append((yield self.call_steps()))
+            self.test_separator()
+
+        if not self.expect("RBRACE_DELIM", "Expected '}'"):
+            return None
+
+        return TestStmtNode(keyword, cases)
+
+    def execute_steps(self):
+        # Read "execute" keyword
+        self.read_token()
+
+        if not self.expect("LPAREN_DELIM", "Expected '('"):
+            return None
+
+        arr = yield self.list_steps()
+
+        if not self.expect("COMMA_DELIM", "Expected ','"):
+            return None
+
+        if self.current_type != "IDENTIFIER":
+            self.set_error(
+                self.current_token.start_pos,
+                self.current_token.end_pos,
+                "Expected an identifier"
+            )
+            return None
+        func = self.current_token
+        self.read_token()
+
+        if not self.expect("RPAREN_DELIM", "Expected ')'"):
+            return None
+        if not self.expect("SEMI_DELIM", "Expected ';'"):
+            return None
+
+        return ExecuteStmtNode(arr, func)
+
+    # Expressions
+    def expr_steps(self, min_precedence=1):
+        self.nest()
+
+        # Prefix operators (not, unary + and -)
+        unary_precedence = UNARY_OP_PRECEDENCE.get(self.current_type)
+        if unary_precedence is not None and min_precedence <= unary_precedence:
+            op_token = self.current_token
+            self.read_token()
+            left_node = UnaryOpNode(op_token, (yield self.expr_steps(unary_precedence)))
+        elif self.current_type in OPERAND_NODES:
+            left_node = self.leaf(OPERAND_NODES[self.current_type])
+            self.read_token()
+        else:
+            left_node = yield self.atom_steps()
+
+        # Binary operators that bind at least as tight as min_precedence
+        while True:
+            precedence = BINARY_OP_PRECEDENCE.get(self.current_type)
+            if precedence is None or precedence < min_precedence:
+                self.depth -= 1
+                return left_node
+
+            op_type = self.current_type
+            op_token = self.current_token
+            self.read_token()
+
+            if op_type in RIGHT_ASSOC_OPS:
+                right_node = yield self.expr_steps(precedence)
+            else:
+                right_node = yield self.expr_steps(precedence + 1)
+
+            left_node = BinaryOpNode(left_node, op_token, right_node)
+
+    def function_call_steps(self):
+        call = yield self.call_steps()
+
+        if not self.expect("SEMI_DELIM", "Expected ';'"):
+            return None
+
+        return call
+
+    def call_steps(self):
+        atom = yield self.atom_steps()
+
+        if self.current_type != "LPAREN_DELIM":
+            return atom
+        self.read_token()
+
+        args = []
+
+        if self.current_type != "RPAREN_DELIM":
+            args.append((yield self.atom_steps()))
+
+            while self.current_type == "COMMA_DELIM":
+                self.read_token()
+
+                args.append((yield self.atom_steps()))
+
+        if not self.expect("RPAREN_DELIM", "Expected ',' or ')'"):
+            return None
+
+        return FunctionCallNode(atom, args)
+
+    def atom_steps(self):
+        # Parse lists
+        if self.current_type == "LBRACK_DELIM":
+            return (yield self.list_steps())
+
+        # Parse parenthesis expressions
+        if self.current_type == "LPAREN_DELIM":
+            self.read_token()
+
+            expr = yield self.expr_steps()
+
+            if not self.expect("RPAREN_DELIM", "Expected ')'"):
+                return None
+
+            return expr
+
+        # Literals never nest
+        return Parser.atom(self)
+
+    def list_steps(self):
+        elements = []
+        self.nest()
+
+        # Read "[" token
+        bracket = self.current_token
+        self.read_token()
+
+        # For empty list
+        if self.current_type == "RBRACK_DELIM":
+            self.read_token()
+            self.depth -= 1
+            return ListNode(bracket, elements)
+
+        elements.append((yield self.atom_steps()))
+
+        while self.current_type == "COMMA_DELIM":
+            self.read_token()
+
+            elements.append((yield self.atom_steps()))
+
+        if not self.expect("RBRACK_DELIM", "Expected ']'"):
+            return None
+
+        self.depth -= 1
+        return ListNode(bracket, elements)
+
+    def condition_check_steps(self):
+        if not self.expect("LPAREN_DELIM", "Expected '('"):
+            return None
+
+        condition = yield self.expr_steps()
+
+        if not self.expect("RPAREN_DELIM", "Expected ')'"):
+            return None
+
+        return condition
+
+    def code_block_steps(self):
+        if not self.expect("LBRACE_DELIM", "Expected '{'"):
+            return None
+
+        body = []
+        while self.current_type not in ("RBRACE_DELIM", "EOF"):
+            stmt = yield self.stmt_steps()
+            if stmt:
+                body.append(stmt)
+
+        if not self.expect("RBRACE_DELIM", "Expected '}'"):
+            return None
+
+        return body
+
+    # Statement dispatch tables, statements that never nest keep the
+    # Parser handlers. Registering on Parser does not reach StackParser
+    type_stmts = {
+        **Parser.type_stmts,
+        "IDENTIFIER": identifier_stmt_steps,
+    }
+
+    keyword_stmts = {
+        **Parser.keyword_stmts,
+        "utter": output_stmt_steps,
+        "if": conditional_stmt_steps,
+        "for": for_stmt_steps,
+        "while": while_stmt_steps,
+        "def": function_def_steps,
+        "return": return_stmt_steps,
+        "test": test_steps,
+        "execute": execute_steps,
+    }
@@ -0,0 +1,196 @@
+from syntax_analyzer.nodes import Node
+
+# Traversals of parse trees (a node, or the statement list of a parse).
+# Methods are found by node class name, e.g. visit_BinaryOpNode, and kept
+# in a table per visitor class, so each class is looked up once. Besides
+# the recursive visit() of Python's ast module, NodeVisitor.walk() and
+# NodeTransformer.transform() keep their place on an explicit stack, for
+# trees too deep to recurse into (see StackParser)
+
+def roots(tree):
+    # Nodes of a statement list, or the node itself
+    if isinstance(tree, list):
+        return [statement for statement in tree if isinstance(statement, Node)]
+    return [tree]
+
+
+def walk(tree):
+    # Every node of tree in pre-order, without recursion
+    stack = [iter(roots(tree))]
+
+    while stack:
+        # Nodes of one level run in this loop, which is only left to go
+        # down into the children of a node
+        for node in stack[-1]:
+            yield node
+            if node.child_fields:
+                stack.append(node.children())
+                break
+        else:
+            stack.pop()
+
+
+class NodeVisitor:
+    # visit(node) calls visit_<class name>(node), or generic_visit(node),
+    # which visits the children. A visit_ method goes on into the children
+    # of its node by calling generic_visit itself.
+    # walk(tree) calls visit_<class name>(node) for every node in
+    # pre-order and leave_<class name>(node) after its children, without
+    # recursion. Missing methods are skipped, and a visit_ method returning
+    # False skips the children of its node (and its leave_ method)
+
+    # Node class -> visit function, and node class -> (visit, leave)
+    # functions of walk(). Every subclass gets tables of its own
+    visitors = {}
+    walkers = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.visitors = {}
+        cls.walkers = {}
+
+    @classmethod
+    def visitor(cls, node_class):
+        function = cls.visitors.get(node_class)
+        if function is None:
+            function = cls.visitors[node_class] = getattr(cls, f"visit_{node_class.__name__}", cls.generic_visit)
+        return function
+
+    @classmethod
+    def walker(cls, node_class):
+        functions = cls.walkers.get(node_class)
+        if functions is None:
+            functions = cls.walkers[node_class] = (
+                getattr(cls, f"visit_{node_class.__name__}", None),
+                getattr(cls, f"leave_{node_class.__name__}", None),
+            )
+        return functions
+
+    def visit(self, node):
+        if isinstance(node, list):
+            for statement in node:
+                if isinstance(statement, Node):
+                    self.visit(statement)
+            return None
+
+        visit = self.visitors.get(node.__class__) or self.visitor(node.__class__)
+        return visit(self, node)
+
+    def generic_visit(self, node):
+        for child in node.children():
+            self.visit(child)
+
+    def walk(self, tree):
+        walkers = self.walkers
+        walker = self.walker
+
+        # (children left, node to leave after them, its leave function)
+        stack = [(iter(roots(tree)), None, None)]
+
+        while stack:
+            children, parent, leave = stack[-1]
+
+            for node in children:
+                visit, node_leave = walkers.get(node.__class__) or walker(node.__class__)
+                if visit is not None and visit(self, node) is False:
+                    continue
+
+                if node.child_fields:
+                    stack.append((node.children(), node, node_leave))
+                    break
+                if node_leave is not None:
+                    node_leave(self, node)
+            else:
+                stack.pop()
+                if leave is not None:
+                    leave(self, parent)
+
+
+class NodeTransformer(NodeVisitor):
+    # A NodeVisitor whose visit_ methods return what replaces their node:
+    # the node itself, another node, or None to drop it. In a list of
+    # nodes, a list returned instead of a node is spliced in. Nodes and
+    # lists are changed in place, (condition, body) tuples are rebuilt.
+    # transform(tree) does the same bottom-up without recursion: children
+    # are transformed before their node's visit_ method is called (which
+    # then must not call generic_visit). Both return the new tree
+
+    def visit(self, node):
+        if isinstance(node, list):
+            return self.replace_items(node, [self.visit_value(item) for item in node])
+
+        visit = self.visitors.get(node.__class__) or self.visitor(node.__class__)
+        return visit(self, node)
+
+    def generic_visit(self, node):
+        for name in node.child_fields:
+            value = getattr(node, name)
+            new_value = self.visit_value(value)
+            if new_value is not value:
+                setattr(node, name, new_value)
+
+        return node
+
+    def visit_value(self, value):
+        # Nodes and lists are visited, tuples rebuilt, anything else kept
+        if isinstance(value, (Node, list)):
+            return self.visit(value)
+        if isinstance(value, tuple):
+            return tuple(map(self.visit_value, value))
+        return value
+
+    def replace_items(self, items, replacements):
+        # Puts the replacements of the nodes in items in its place
+        new_items = []
+        for item, replacement in zip(items, replacements):
+            if not isinstance(item, Node):
+                new_items.append(replacement)
+            elif isinstance(replacement, list):
+                new_items.extend(replacement)
+            elif replacement is not None:
+                new_items.append(replacement)
+
+        items[:] = new_items
+        return items
+
+    def transform(self, tree):
+        # Each node, list and tuple is transformed by a generator (see
+        # transform_value) that yields the values under it and is sent what
+        # replaces them, so a child's generator runs on top of its parent's
+        stack = [self.transform_value(tree)]
+        replacement = None
+
+        while stack:
+            try:
+                value = stack[-1].send(replacement)
+            except StopIteration as stop:
+                stack.pop()
+                replacement = stop.value
+                continue
+
+            stack.append(self.transform_value(value))
+            replacement = None
+
+        return replacement
+
+    def transform_value(self, value):
+        if isinstance(value, Node):
+            for name in value.child_fields:
+                child = getattr(value, name)
+                if isinstance(child, (Node, list, tuple)):
+                    new_child = yield child
+                    if new_child is not child:
+                        setattr(value, name, new_child)
+
+            visit = (self.walkers.get(value.__class__) or self.walker(value.__class__))[0]
+            return value if visit is None else visit(self, value)
+
+        replacements = []
+        for item in value:
+            if isinstance(item, (Node, list, tuple)):
+                item = yield item
+            replacements.append(item)
+
+        if isinstance(value, tuple):
+            return tuple(replacements)
+        return self.replace_items(value, replacements)
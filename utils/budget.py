@@ -0,0 +1,30 @@
+import time
+
+# Tokens read between two deadline checks
+DEADLINE_CHECK_INTERVAL = 1024
+
+
+class Budget:
+    # Limits for strict mode lexing and parsing, None means no limit. The
+    # deadline starts when the budget is created, so one budget shared by
+    # a Lexer and its Parser bounds the whole request
+    def __init__(self, max_tokens=None, max_depth=None, timeout=None):
+        if max_tokens is not None and max_tokens < 1:
+            raise ValueError("max_tokens must be at least 1")
+        if max_depth is not None and max_depth < 1:
+            raise ValueError("max_depth must be at least 1")
+
+        self.max_tokens = max_tokens
+        self.max_depth = max_depth
+        self.timeout = timeout
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+
+class BudgetExceeded(Exception):
+    # Stops strict mode lexing or parsing, error is a BudgetExceededError
+    def __init__(self, error):
+        super().__init__(error.details)
+        self.error = error
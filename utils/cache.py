@@ -0,0 +1,250 @@
+import hashlib
+import marshal
+import os
+import pickle
+import tempfile
+import time
+from importlib.util import MAGIC_NUMBER
+
+from syntax_analyzer.parser import MAX_ERRORS
+
+# Where main.py keeps parse results between runs
+CACHE_DIR = ".otto_cache"
+
+# Size limit of the cache directory. Once it is exceeded, least recently
+# used entries are deleted until the cache is down to EVICT_TO of it
+MAX_CACHE_BYTES = 256 << 20
+EVICT_TO = 0.75
+
+# Packages whose code decides what is cached. Their sources are part of
+# every key, so entries written by other versions are never read
+VERSIONED_PACKAGES = ("lexical_analyzer", "syntax_analyzer", "utils")
+
+# The same for code objects, which also depend on the transpiler and on
+# the Python version (through its bytecode magic number)
+CODE_VERSIONED_PACKAGES = VERSIONED_PACKAGES + ("virtual_machine",)
+
+# Files being written, and how old one has to be to belong to a writer
+# that died before renaming it
+TEMP_PREFIX = ".tmp-"
+STALE_TEMP_SECONDS = 3600
+
+ENTRY_SUFFIX = ".pickle"
+CODE_ENTRY_SUFFIX = ".marshal"
+
+
+def code_version(packages=VERSIONED_PACKAGES):
+    # Hash of the sources of packages
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha256()
+
+    for package in packages:
+        directory = os.path.join(root, package)
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".py"):
+                with open(os.path.join(directory, name), "rb") as file:
+                    digest.update(f"{package}/{name}\0".encode())
+                    digest.update(file.read())
+
+    return digest.hexdigest()
+
+
+class CacheEntry:
+    # Parse results read back from the cache. messages are the printed
+    # errors and stopped is Parser.stopped, the other fields are None
+    # unless they were asked for (the tree takes much longer to load than
+    # the tokens)
+    def __init__(self, messages, stopped, tokens=None, statements=None, errors=None):
+        self.messages = messages
+        self.stopped = stopped
+        self.tokens = tokens
+        self.statements = statements
+        self.errors = errors
+
+
+class ParseCache:
+    # Content-addressed cache of tokens, parse trees and errors, one file
+    # per source under directory/<first 2 key digits>/. Entries are written
+    # to a temporary file and renamed into place, so processes sharing the
+    # cache only ever read complete entries. Reading an entry marks it as
+    # recently used (through its modification time)
+    entry_suffix = ENTRY_SUFFIX
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = code_version()
+
+        # Bytes in the cache as far as this process knows, None until the
+        # directory is first scanned (on the first store)
+        self.size = None
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    # Keys
+    def key(self, data, file_name, max_errors=MAX_ERRORS):
+        # Key of the source bytes data. The file name is part of it since
+        # it is stored in every position, and so is the error limit
+        return self.source_key(hashlib.sha256(data).hexdigest(), file_name, max_errors)
+
+    def file_key(self, path, file_name, max_errors=MAX_ERRORS):
+        with open(path, "rb") as file:
+            digest = hashlib.file_digest(file, "sha256").hexdigest()
+        return self.source_key(digest, file_name, max_errors)
+
+    def source_key(self, digest, file_name, max_errors):
+        key = f"{self.version}\0{file_name}\0{max_errors}\0{digest}"
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:] + self.entry_suffix)
+
+    # Entries
+    def get(self, key, tokens=True, tree=False):
+        # CacheEntry stored under key, None on a miss. tree loads the
+        # statements and Error objects as well
+        def load(file):
+            entry = CacheEntry(*pickle.load(file))
+            if tokens or tree:
+                entry.tokens = pickle.load(file)
+            if tree:
+                entry.statements, entry.errors = pickle.load(file)
+            return entry
+
+        return self.read(key, load)
+
+    def put(self, key, tokens, statements, errors, stopped=False):
+        # Stores the results of lexing and parsing one source, returns
+        # whether they could be written (very deep trees cannot be pickled)
+        def dump(file):
+            messages = [str(error) for error in errors]
+            pickle.dump((messages, stopped), file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(tokens, file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump((statements, errors), file, pickle.HIGHEST_PROTOCOL)
+
+        return self.write(key, dump)
+
+    def read(self, key, load):
+        # What load(file) reads from the entry under key, None on a miss
+        path = self.path(key)
+
+        try:
+            with open(path, "rb") as file:
+                value = load(file)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        # Unreadable entries are dropped and count as misses
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError, TypeError):
+            self.remove(path)
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return value
+
+    def write(self, key, dump):
+        # Stores what dump(file) writes under key, returns whether it could
+        # be written
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                dump(file)
+                size = file.tell()
+
+            # Another process may have stored the same entry meanwhile,
+            # which has the same contents
+            os.replace(temp_path, path)
+        except (OSError, pickle.PicklingError, RecursionError, TypeError, ValueError):
+            self.remove(temp_path)
+            return False
+
+        self.stores += 1
+        if self.size is None or self.size + size > self.max_bytes:
+            self.evict()
+        else:
+            self.size += size
+
+        return True
+
+    def remove(self, path):
+        # Files open in another process cannot be removed on Windows
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        # Scans the cache, deleting least recently used entries if it is
+        # over max_bytes
+        entries = []
+        stale_before = time.time() - STALE_TEMP_SECONDS
+
+        for subdirectory in os.scandir(self.directory):
+            if not subdirectory.is_dir():
+                continue
+
+            for file in os.scandir(subdirectory.path):
+                try:
+                    stat = file.stat()
+                except OSError:
+                    continue
+
+                if file.name.startswith(TEMP_PREFIX):
+                    if stat.st_mtime < stale_before:
+                        self.remove(file.path)
+                elif file.name.endswith(self.entry_suffix):
+                    entries.append((stat.st_mtime, stat.st_size, file.path))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        if size > self.max_bytes:
+            entries.sort()
+
+            for _, entry_size, path in entries:
+                if size <= self.max_bytes * EVICT_TO:
+                    break
+                self.remove(path)
+                size -= entry_size
+                self.evictions += 1
+
+        self.size = size
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+
+class CodeCache(ParseCache):
+    # Code objects of transpiled programs (virtual_machine/transpiler.py),
+    # stored with marshal next to the parse results: a hit skips lexing,
+    # parsing and compiling. Each cache only counts and evicts its own
+    # entries against max_bytes
+    entry_suffix = CODE_ENTRY_SUFFIX
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        super().__init__(directory, max_bytes)
+        self.version = code_version(CODE_VERSIONED_PACKAGES) + MAGIC_NUMBER.hex()
+
+    def get(self, key):
+        # Code object stored under key, None on a miss
+        return self.read(key, marshal.load)
+
+    def put(self, key, code):
+        return self.write(key, lambda file: marshal.dump(code, file))
@@ -11,9 +11,12 @@ class Error:
     def __str__(self):
         message = f"{self.err_type}: {self.details}\n"
         message += f"File {self.start_pos.file_name}, line {self.start_pos.ln + 1}\n"
-        message += "\n" + display_squiggles(
-            self.start_pos.file_text, self.start_pos, self.end_pos
-        )
+
+        # Streamed sources do not keep their text around
+        if self.start_pos.file_text is not None:
+            message += "\n" + display_squiggles(
+                self.start_pos.file_text, self.start_pos, self.end_pos
+            )
 
         return message
 
@@ -34,3 +37,29 @@ class InvalidSyntaxError(Error):
         self.error = f"Invalid Syntax: {details}"
         self.node = None
         super().__init__(start_pos, end_pos, "Invalid Syntax", details)
+
+
+class BudgetExceededError(Error):
+    # limit is "tokens", "nesting" or "deadline", max_value is its budget
+    def __init__(self, start_pos, end_pos, limit, max_value):
+        self.limit = limit
+        self.max_value = max_value
+
+        if limit == "tokens":
+            details = f"More than {max_value} tokens"
+        elif limit == "nesting":
+            details = f"Nested deeper than {max_value} levels"
+        else:
+            details = f"Took longer than {max_value}s"
+
+        super().__init__(start_pos, end_pos, "Budget Exceeded", details)
+
+
+class CompileError(Error):
+    def __init__(self, start_pos, end_pos, details):
+        super().__init__(start_pos, end_pos, "Compile Error", details)
+
+
+class ExecutionError(Error):
+    def __init__(self, start_pos, end_pos, details):
+        super().__init__(start_pos, end_pos, "Runtime Error", details)
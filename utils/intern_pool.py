@@ -0,0 +1,14 @@
+class InternPool:
+    # One shared copy of every lexeme and token type name. Each TokenStream
+    # has a pool of its own unless one is passed to Lexer(pool=...), so
+    # files lexed with the same pool (e.g. by one batch.py worker) share
+    # their strings too. Leaf nodes hold the token of one file and are
+    # only shared within a parse, see Parser(share_leaves=True)
+    def __init__(self):
+        self.strings = {}
+
+    def intern(self, string):
+        return self.strings.setdefault(string, string)
+
+    def __repr__(self):
+        return f"InternPool({len(self.strings)} strings)"
@@ -0,0 +1,262 @@
+import json
+import re
+
+import tabulate
+
+# Symbol table writers. Rows are (lexeme, token type) pairs streamed from a
+# TokenStream, so writing needs no memory per row. Pick one by name with
+# write_symbol_table(path, tokens, fmt)
+
+HEADERS = ("LEXEME", "TOKEN")
+
+# Binary format: magic and version, then one record per row: the varint
+# type id, followed by the type name (varint length + UTF-8) for ids not
+# seen before, then the lexeme (varint length + UTF-8)
+BINARY_MAGIC = b"OTST"
+BINARY_VERSION = 1
+
+# Line breaks as tabulate sees them when measuring multiline cells, and
+# every boundary str.splitlines() breaks lines on when printing them
+LINE_BREAKS = re.compile("[\r\n]")
+LINE_BOUNDARIES = re.compile("[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]")
+
+# Escapes of TSV cells, so every row is exactly one line
+TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+class SymbolRows:
+    # (lexeme, token type) rows of a TokenStream, comments included before
+    # the token they belong to. Can be iterated more than once. Tokens
+    # without a type (e.g. "*==") get an empty type, which is how
+    # tabulate prints None
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def __iter__(self):
+        tokens = self.tokens
+        trivia = tokens.trivia
+        owners = tokens.trivia_owners
+        trivia_count = len(owners)
+        trivia_idx = 0
+
+        for idx in range(len(tokens)):
+            while trivia_idx < trivia_count and owners[trivia_idx] == idx:
+                yield trivia.value_at(trivia_idx).strip(), trivia.type_at(trivia_idx)
+                trivia_idx += 1
+
+            yield tokens.value_at(idx).strip(), tokens.type_at(idx) or ""
+
+
+class SymbolTableWriter:
+    # Writes rows to a file opened in binary mode if binary, else as text
+    binary = False
+
+    def write(self, file, rows):
+        raise NotImplementedError
+
+
+class PrettyWriter(SymbolTableWriter):
+    # Same text as tabulate(rows, headers=HEADERS, tablefmt="pretty"), in
+    # two passes over rows: the first measures the columns, the second
+    # writes them. Tables with ANSI escape codes, or control characters
+    # when tabulate measures wide characters, are left to tabulate
+    def write(self, file, rows):
+        wide = tabulate.wcwidth is not None and tabulate.WIDE_CHARS_MODE
+        width = tabulate.wcwidth.wcswidth if wide else len
+
+        # Column widths as single lines, and as tabulate measures them once
+        # any cell has a line break (which makes the whole table multiline)
+        widths = [width(header) for header in HEADERS]
+        multiline_widths = list(widths)
+        multiline = False
+
+        for row in rows:
+            for column, cell in enumerate(row):
+                cell_width = width(cell)
+                if "\x1b" in cell or cell_width < 0:
+                    file.write(tabulate.tabulate(list(rows), headers=HEADERS, tablefmt="pretty"))
+                    return
+
+                if cell_width > widths[column]:
+                    widths[column] = cell_width
+
+                if "\n" in cell or "\r" in cell:
+                    multiline = True
+                    cell_width = max(map(width, LINE_BREAKS.split(cell)))
+                if cell_width > multiline_widths[column]:
+                    multiline_widths[column] = cell_width
+
+        if multiline:
+            widths = multiline_widths
+
+        line = "+" + "+".join("-" * (column_width + 2) for column_width in widths) + "+"
+        file.write(line + "\n")
+        file.write(self.format_row(HEADERS, widths, multiline, width))
+        file.write(line + "\n")
+
+        file.writelines(self.format_rows(rows, widths, multiline, width))
+        file.write(line)
+
+    def format_rows(self, rows, widths, multiline, width):
+        # Lines of rows, each ending in a newline
+        if width is len:
+            template = "| " + " | ".join(f"{{:^{column_width}}}" for column_width in widths) + " |\n"
+
+            # In multiline tables, rows without line boundaries still print
+            # as a single line (rows of empty cells as none)
+            for row in rows:
+                if multiline and (not any(row) or any(map(LINE_BOUNDARIES.search, row))):
+                    yield self.format_row(row, widths, multiline, width)
+                else:
+                    yield template.format(*row)
+        else:
+            for row in rows:
+                yield self.format_row(row, widths, multiline, width)
+
+    def format_row(self, row, widths, multiline, width):
+        if not multiline:
+            # Pad by the difference between display width and length
+            return "| " + " | ".join(
+                format(cell, f"^{column_width - width(cell) + len(cell)}")
+                for cell, column_width in zip(row, widths)
+            ) + " |\n"
+
+        # Cells are split on every line boundary str.splitlines knows, and
+        # rows are as high as their highest cell
+        cells = [self.cell_lines(cell, column_width, width) for cell, column_width in zip(row, widths)]
+        height = max(map(len, cells))
+
+        lines = []
+        for line_idx in range(height):
+            lines.append("| " + " | ".join(
+                cell[line_idx] if line_idx < len(cell) else " " * column_width
+                for cell, column_width in zip(cells, widths)
+            ) + " |\n")
+
+        return "".join(lines)
+
+    def cell_lines(self, cell, column_width, width):
+        if width is len:
+            return [format(line, f"^{column_width}") for line in cell.splitlines()]
+
+        # Lines are matched up with the pieces tabulate measured, which
+        # only differ where splitlines() breaks on more than "\r" and "\n"
+        return [
+            format(line, f"^{column_width - width(piece) + len(piece)}")
+            for line, piece in zip(cell.splitlines() or cell, LINE_BREAKS.split(cell))
+        ]
+
+
+class TsvWriter(SymbolTableWriter):
+    # Tab-separated values with a header line. Backslashes, tabs and line
+    # breaks in lexemes are escaped as \\, \t, \n and \r
+    def write(self, file, rows):
+        file.write("\t".join(HEADERS) + "\n")
+        file.writelines(f"{lexeme.translate(TSV_ESCAPES)}\t{token_type}\n" for lexeme, token_type in rows)
+
+
+class JsonLinesWriter(SymbolTableWriter):
+    # One {"lexeme": ..., "token": ...} object per line
+    def write(self, file, rows):
+        # Same text as json.dumps({"lexeme": ..., "token": ...}, ensure_ascii=False)
+        encode = json.encoder.encode_basestring
+        file.writelines(
+            f'{{"lexeme": {encode(lexeme)}, "token": {encode(token_type)}}}\n'
+            for lexeme, token_type in rows
+        )
+
+
+class BinaryWriter(SymbolTableWriter):
+    # See BINARY_MAGIC, read back with read_binary_table
+    binary = True
+
+    def write(self, file, rows):
+        file.write(BINARY_MAGIC + bytes([BINARY_VERSION]))
+        type_ids = {}
+        record = bytearray()
+
+        for lexeme, token_type in rows:
+            type_id = type_ids.get(token_type)
+            if type_id is None:
+                type_id = type_ids[token_type] = len(type_ids)
+                write_varint(record, type_id)
+                write_string(record, token_type)
+            else:
+                write_varint(record, type_id)
+
+            write_string(record, lexeme)
+
+            if len(record) >= 1 << 16:
+                file.write(record)
+                record.clear()
+
+        file.write(record)
+
+
+def write_varint(buffer, value):
+    # Unsigned LEB128
+    while value >= 0x80:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def write_string(buffer, value):
+    data = value.encode("utf-8")
+    write_varint(buffer, len(data))
+    buffer += data
+
+
+def read_varint(data, pos):
+    value = 0
+    shift = 0
+
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def read_string(data, pos):
+    size, pos = read_varint(data, pos)
+    return bytes(data[pos:pos + size]).decode("utf-8"), pos + size
+
+
+def read_binary_table(data):
+    # Rows of a table written by BinaryWriter, from its bytes
+    if data[:len(BINARY_MAGIC)] != BINARY_MAGIC or data[len(BINARY_MAGIC)] != BINARY_VERSION:
+        raise ValueError("Not an Otto binary symbol table")
+
+    type_names = []
+    pos = len(BINARY_MAGIC) + 1
+
+    while pos < len(data):
+        type_id, pos = read_varint(data, pos)
+        if type_id == len(type_names):
+            type_name, pos = read_string(data, pos)
+            type_names.append(type_name)
+
+        lexeme, pos = read_string(data, pos)
+        yield lexeme, type_names[type_id]
+
+
+SYMBOL_TABLE_FORMATS = {
+    "pretty": PrettyWriter,
+    "tsv": TsvWriter,
+    "jsonl": JsonLinesWriter,
+    "binary": BinaryWriter,
+}
+
+
+def write_symbol_table(path, tokens, fmt="pretty"):
+    writer = SYMBOL_TABLE_FORMATS[fmt]()
+
+    if writer.binary:
+        with open(path, "wb") as file:
+            writer.write(file, SymbolRows(tokens))
+    else:
+        with open(path, "w", encoding="utf-8") as file:
+            writer.write(file, SymbolRows(tokens))
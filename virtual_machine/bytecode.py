@@ -0,0 +1,189 @@
+import operator
+
+# Bytecode of the virtual machine (see compiler.py and vm.py). A Code holds
+# a list of (opcode, argument) instructions run on a value stack, with
+# constants in a pool and variables resolved to slots at compile time.
+# As in Python, a function's parameters and the names it assigns are its
+# locals, other names are globals, and the locals of the program are its
+# globals: the program reads and writes them as local slots, functions
+# only read them. Instructions that take no argument have 0, jump
+# targets are instruction indices.
+# The slots of a frame are its locals followed by its constants, so a
+# slot operand is either a variable or a constant, and superinstructions
+# take their operands from slots instead of the stack. The VM tests
+# opcodes in numbering order, so the ones loops run most come first
+
+# Slots and operators on them
+LOAD_SLOT = 0           # push slot arg
+SLOT_BINARY = 1         # push BINARY_OPS[op](slot x, slot y), arg is (x, op, y)
+SLOT_COMPARE_JUMP = 2   # go to target unless BINARY_OPS[op](slot x, slot y), arg is (x, op, y, target)
+STORE_SLOT = 3          # pop into slot arg
+UPDATE_SLOT = 4         # slot x = BINARY_OPS[op](slot x, slot y), arg is (x, op, y)
+JUMP = 5                # go to arg
+BINARY_SLOT = 6         # top = BINARY_OPS[op](top, slot y), arg is (op, y)
+COMPARE_SLOT_JUMP = 7   # pop left, go to target unless BINARY_OPS[op](left, slot y), arg is (op, y, target)
+UPDATE_SLOT_TOP = 8     # pop right and left, slot x = BINARY_OPS[op](left, right), arg is (x, op)
+FOR_ITER = 9            # next item of the iterator on top into slot x, or pop it and go to target, arg is (x, target)
+LOAD_GLOBAL = 10        # push global slot arg
+CALL = 11               # pop arg arguments and the function below them, push its result
+RETURN = 12             # pop the result, return to the caller
+
+# Operators on the stack
+BINARY_ADD = 13         # pop right and left, push left + right
+BINARY_OP = 14          # pop right and left, push BINARY_OPS[arg](left, right)
+COMPARE_JUMP = 15       # pop right and left, go to target unless BINARY_OPS[op](left, right), arg is (op, target)
+JUMP_IF_FALSE = 16      # pop, go to arg if false
+JUMP_IF_FALSE_OR_POP = 17  # "and": go to arg keeping the top if false, otherwise pop
+JUMP_IF_TRUE_OR_POP = 18   # "or": go to arg keeping the top if true, otherwise pop
+UNARY_NEG = 19
+UNARY_POS = 20
+UNARY_NOT = 21
+POP = 22                # pop and discard
+
+# Run once per loop, list or function
+GET_ITER = 23           # replace the top with an iterator over it
+BUILD_LIST = 24         # pop arg values, push them as a list
+MAKE_FUNCTION = 25      # push a Function of the Code in slot arg
+OUTPUT = 26             # pop and print
+INPUT = 27              # pop the prompt, push a line read with it
+
+OPCODE_NAMES = (
+    "LOAD_SLOT", "SLOT_BINARY", "SLOT_COMPARE_JUMP", "STORE_SLOT", "UPDATE_SLOT", "JUMP",
+    "BINARY_SLOT", "COMPARE_SLOT_JUMP", "UPDATE_SLOT_TOP", "FOR_ITER", "LOAD_GLOBAL", "CALL", "RETURN",
+    "BINARY_ADD", "BINARY_OP", "COMPARE_JUMP", "JUMP_IF_FALSE", "JUMP_IF_FALSE_OR_POP",
+    "JUMP_IF_TRUE_OR_POP", "UNARY_NEG", "UNARY_POS", "UNARY_NOT", "POP",
+    "GET_ITER", "BUILD_LIST", "MAKE_FUNCTION", "OUTPUT", "INPUT",
+)
+
+# Operator lexeme and function, by the index operator arguments hold
+# ("and" and "or" are jumps, they do not always evaluate their right side)
+BINARY_OPS = (
+    ("+", operator.add),
+    ("-", operator.sub),
+    ("*", operator.mul),
+    ("/", operator.truediv),
+    ("//", operator.floordiv),
+    ("%", operator.mod),
+    ("**", operator.pow),
+    ("<", operator.lt),
+    (">", operator.gt),
+    ("<=", operator.le),
+    (">=", operator.ge),
+    ("==", operator.eq),
+    ("!=", operator.ne),
+)
+BINARY_OP_INDEX = {lexeme: idx for idx, (lexeme, _) in enumerate(BINARY_OPS)}
+BINARY_FUNCTIONS = tuple(function for _, function in BINARY_OPS)
+
+
+class Unbound:
+    # Value of the slot of a variable that has not been assigned yet. Every
+    # operator raises TypeError on it, so superinstructions do not check
+    # their operands and the VM finds the variable once one has failed.
+    # Converting it to text fails too, as string "%" formats its right
+    # operand with str() or repr() instead of calling an operator on it
+    __slots__ = ()
+
+    def fail(self, other=None):
+        raise TypeError("unbound variable")
+
+    __eq__ = __ne__ = __lt__ = __gt__ = __le__ = __ge__ = __bool__ = fail
+    __str__ = __repr__ = __format__ = fail
+    __hash__ = object.__hash__
+
+
+UNBOUND = Unbound()
+
+
+class Code:
+    # A compiled function, or the program itself. instructions are
+    # (opcode, argument) pairs and positions the token each one was
+    # compiled from, for runtime errors. operand_positions maps the index
+    # of an instruction with variable operands to the tokens of its
+    # argument items (None for the others). local_names name the local slots,
+    # parameters first, and the constants take the slots after them.
+    # global_names is shared by every Code of a program, and is also the
+    # local_names of the program
+    __slots__ = ("name", "param_count", "local_names", "global_names", "instructions", "constants",
+                 "positions", "operand_positions", "slot_tail")
+
+    def __init__(self, name, param_count, local_names, global_names, instructions, constants, positions,
+                 operand_positions):
+        self.name = name
+        self.param_count = param_count
+        self.local_names = local_names
+        self.global_names = global_names
+        self.instructions = instructions
+        self.constants = constants
+        self.positions = positions
+        self.operand_positions = operand_positions
+
+        # Slots of a new frame after its arguments
+        self.slot_tail = [UNBOUND] * (len(local_names) - param_count) + constants
+
+    def slot_name(self, slot):
+        # Variable name or constant repr of a slot
+        if slot < len(self.local_names):
+            return self.local_names[slot]
+        return repr(self.constants[slot - len(self.local_names)])
+
+    def __repr__(self):
+        return f"<code {self.name}>"
+
+
+class Function:
+    # Value of a def statement
+    __slots__ = ("code",)
+
+    def __init__(self, code):
+        self.code = code
+
+    def __repr__(self):
+        return f"<function {self.code.name}>"
+
+
+def describe_arg(code, opcode, arg):
+    # What the argument of an instruction stands for
+    name = code.slot_name
+
+    if opcode in (LOAD_SLOT, STORE_SLOT, MAKE_FUNCTION):
+        return name(arg)
+    if opcode == LOAD_GLOBAL:
+        return code.global_names[arg]
+    if opcode == SLOT_BINARY:
+        return f"{name(arg[0])} {BINARY_OPS[arg[1]][0]} {name(arg[2])}"
+    if opcode == SLOT_COMPARE_JUMP:
+        return f"{name(arg[0])} {BINARY_OPS[arg[1]][0]} {name(arg[2])}, else to {arg[3]}"
+    if opcode == UPDATE_SLOT:
+        return f"{name(arg[0])} {BINARY_OPS[arg[1]][0]}= {name(arg[2])}"
+    if opcode == BINARY_SLOT:
+        return f"{BINARY_OPS[arg[0]][0]} {name(arg[1])}"
+    if opcode == COMPARE_SLOT_JUMP:
+        return f"{BINARY_OPS[arg[0]][0]} {name(arg[1])}, else to {arg[2]}"
+    if opcode == UPDATE_SLOT_TOP:
+        return f"{name(arg[0])} {BINARY_OPS[arg[1]][0]}="
+    if opcode == COMPARE_JUMP:
+        return f"{BINARY_OPS[arg[0]][0]}, else to {arg[1]}"
+    if opcode == BINARY_OP:
+        return BINARY_OPS[arg][0]
+    if opcode == FOR_ITER:
+        return f"{name(arg[0])}, at the end to {arg[1]}"
+    return ""
+
+
+def disassemble(code):
+    # Listing of code and the functions defined in it, one instruction per line
+    lines = []
+    stack = [code]
+    while stack:
+        code = stack.pop()
+        lines.append(f"{code.name}({', '.join(code.local_names[:code.param_count])}):")
+
+        for idx, (opcode, arg) in enumerate(code.instructions):
+            plain_arg = "" if isinstance(arg, tuple) else arg
+            lines.append(f"{idx:6}  {OPCODE_NAMES[opcode]:20} {plain_arg!s:>6}  {describe_arg(code, opcode, arg)}".rstrip())
+
+        lines.append("")
+        stack.extend(reversed([constant for constant in code.constants if isinstance(constant, Code)]))
+
+    return "\n".join(lines)
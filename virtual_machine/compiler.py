@@ -0,0 +1,451 @@
+from lexical_analyzer.token import Token
+from syntax_analyzer.folding import literal_value
+from syntax_analyzer.nodes import *
+from syntax_analyzer.visitor import NodeVisitor, walk
+from utils.error import CompileError
+from virtual_machine.bytecode import *
+
+# Compiles parse trees (plain or folded, see syntax_analyzer/folding.py)
+# to bytecode: compile_program(statements) returns the Code of the
+# program, with the Code of each def in its constant pool. Scoping
+# follows Python: the parameters of a function and the names it assigns
+# are its locals, other names are globals. There are no closures, a
+# nested def sees its own locals and the globals
+
+
+class CompilerPanic(Exception):
+    # Raised by compile_program with the CompileError of the node that
+    # cannot be compiled
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+
+
+# Nodes that leave a value on the stack
+EXPRESSION_NODES = (
+    ConstantNode, NumberNode, StringNode, BoolNode, NullNode, IdentifierNode,
+    ListNode, BinaryOpNode, UnaryOpNode, FunctionCallNode,
+)
+LITERAL_NODES = (ConstantNode, NumberNode, StringNode, BoolNode, NullNode)
+
+# Operators a condition fuses with its jump
+COMPARISON_OPS = ("<", ">", "<=", ">=", "==", "!=")
+
+UNARY_OPCODES = {"not": UNARY_NOT, "-": UNARY_NEG, "+": UNARY_POS}
+
+# Statements of the automation features, which only the parser knows so far
+UNSUPPORTED_STATEMENTS = {
+    OttomateStmtNode: "Ottomate",
+    StepStmtNode: "step",
+    TestStmtNode: "test",
+    ExecuteStmtNode: "execute",
+}
+
+
+def first_token(node):
+    # First token of node in field order, or None
+    stack = [node]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, Token):
+            return value
+        if isinstance(value, Node):
+            stack.extend(getattr(value, name) for name in reversed(value.__slots__))
+        elif isinstance(value, (list, tuple)):
+            stack.extend(reversed(value))
+    return None
+
+
+def operand_token(node):
+    # Token of a variable operand, None for a constant one
+    return node.token if node.__class__ is IdentifierNode else None
+
+
+def constant_value(node):
+    # Value of a literal or folded constant
+    if node.__class__ is ConstantNode:
+        return node.value
+
+    try:
+        return literal_value(node)
+    except ValueError:
+        token = node.token
+        raise CompilerPanic(CompileError(token.start_pos, token.end_pos, "Integer literal is too long")) from None
+
+
+def assigned_names(body):
+    # Names a function body assigns, in order, not looking into nested defs
+    names = {}
+    stack = list(reversed(body))
+    while stack:
+        statement = stack.pop()
+
+        if isinstance(statement, (AssignStmtNode, InputStmtNode, FunctionDefNode)):
+            names[statement.identifier.value] = None
+        elif isinstance(statement, ForStmtNode):
+            names[statement.loop_var.value] = None
+            stack.extend(reversed(statement.body))
+        elif isinstance(statement, WhileStmtNode):
+            stack.extend(reversed(statement.body))
+        elif isinstance(statement, ConditionalStmtNode):
+            if statement.else_case is not None:
+                stack.extend(reversed(statement.else_case))
+            for _, case_body in reversed(statement.cases):
+                stack.extend(reversed(case_body))
+
+    return list(names)
+
+
+def program_names(statements):
+    # Every identifier of a program, in order. They all get a global slot
+    # before compiling, so the program's constant slots can follow them
+    names = {}
+    for node in walk(statements):
+        for field in node.__slots__:
+            value = getattr(node, field)
+            for token in value if isinstance(value, list) else (value,):
+                if isinstance(token, Token) and token.type == "IDENTIFIER":
+                    names[token.value] = None
+    return list(names)
+
+
+class Compiler(NodeVisitor):
+    # Compiles one Code, the program (local_names is None, its locals are
+    # the globals) or a function. visit_ methods of statements emit their
+    # code, those of expressions code that pushes their value. Each
+    # instruction is emitted with self.token, the token runtime errors in
+    # it point at
+    def __init__(self, name, param_count, local_names, global_names, global_slots):
+        self.name = name
+        self.param_count = param_count
+        self.local_names = local_names
+        self.local_slots = {} if local_names is None else {name: idx for idx, name in enumerate(local_names)}
+
+        # Global names by slot and slots by name, shared by every Compiler
+        # of a program and known before compiling it (see program_names)
+        self.global_names = global_names
+        self.global_slots = global_slots
+        self.slot_base = len(global_names if local_names is None else local_names)
+
+        self.instructions = []
+        self.positions = []
+        self.operand_positions = {}
+        self.constants = []
+        self.constant_slots = {}
+        self.token = None
+
+    def code(self):
+        local_names = self.global_names if self.local_names is None else self.local_names
+        return Code(self.name, self.param_count, local_names, self.global_names,
+                    self.instructions, self.constants, self.positions, self.operand_positions)
+
+    def error(self, message, node=None):
+        token = self.token if node is None else first_token(node) or self.token
+        return CompilerPanic(CompileError(token.start_pos, token.end_pos, message))
+
+    # Emitting
+    def emit(self, opcode, arg=0, operand_tokens=None):
+        # operand_tokens are the tokens of the items of arg that are slot
+        # operands, so an unassigned variable is reported where it is used
+        self.instructions.append((opcode, arg))
+        self.positions.append(self.token)
+        if operand_tokens is not None:
+            self.operand_positions[len(self.instructions) - 1] = operand_tokens
+        return len(self.instructions) - 1
+
+    def patch(self, idx, target=None):
+        # Points the jump at idx to target, by default the next instruction
+        opcode, arg = self.instructions[idx]
+        if target is None:
+            target = len(self.instructions)
+
+        # Superinstructions have the target last
+        if isinstance(arg, tuple):
+            self.instructions[idx] = (opcode, arg[:-1] + (target,))
+        else:
+            self.instructions[idx] = (opcode, target)
+
+    def constant(self, value):
+        # Slot of value, after the local slots. Pooled by type and repr, so
+        # 1, 1.0 and true (equal in Python) or 0.0 and -0.0 stay apart
+        if isinstance(value, Code):
+            self.constants.append(value)
+            return self.slot_base + len(self.constants) - 1
+
+        key = (value.__class__, repr(value))
+        idx = self.constant_slots.get(key)
+        if idx is None:
+            idx = self.constant_slots[key] = len(self.constants)
+            self.constants.append(value)
+        return self.slot_base + idx
+
+    def local_slot(self, name):
+        # Slot of name in the frame, None for a global a function reads
+        if self.local_names is None:
+            return self.global_slots[name]
+        return self.local_slots.get(name)
+
+    def load(self, name):
+        slot = self.local_slot(name)
+        if slot is None:
+            self.emit(LOAD_GLOBAL, self.global_slots[name])
+        else:
+            self.emit(LOAD_SLOT, slot)
+
+    def store(self, name):
+        # Names a function assigns are its locals (see assigned_names)
+        self.emit(STORE_SLOT, self.local_slot(name))
+
+    def operand(self, node):
+        # Slot of a constant or local variable operand, which
+        # superinstructions read themselves, otherwise None
+        if isinstance(node, LITERAL_NODES):
+            return self.constant(constant_value(node))
+        if node.__class__ is IdentifierNode:
+            return self.local_slot(node.token.value)
+        return None
+
+    # Statements
+    def statements(self, body):
+        for statement in body:
+            self.token = first_token(statement) or self.token
+            self.visit(statement)
+            if isinstance(statement, EXPRESSION_NODES):
+                self.emit(POP)
+
+    def expression(self, node):
+        if not isinstance(node, EXPRESSION_NODES):
+            raise self.error("Expected an expression", node)
+        self.visit(node)
+
+    def condition(self, node):
+        # Code that jumps unless node is true, returns the jump to patch.
+        # Comparisons jump on their result without pushing it
+        if node.__class__ is BinaryOpNode and node.op_token.value in COMPARISON_OPS:
+            op = BINARY_OP_INDEX[node.op_token.value]
+            left = self.operand(node.left_node)
+            right = self.operand(node.right_node)
+
+            if right is None:
+                self.expression(node.left_node)
+                self.expression(node.right_node)
+                self.token = node.op_token
+                return self.emit(COMPARE_JUMP, (op, None))
+
+            if left is None:
+                self.expression(node.left_node)
+                self.token = node.op_token
+                return self.emit(COMPARE_SLOT_JUMP, (op, right, None), (None, operand_token(node.right_node), None))
+
+            self.token = node.op_token
+            return self.emit(SLOT_COMPARE_JUMP, (left, op, right, None),
+                             (operand_token(node.left_node), None, operand_token(node.right_node), None))
+
+        self.expression(node)
+        return self.emit(JUMP_IF_FALSE)
+
+    def visit_AssignStmtNode(self, node):
+        name = node.identifier.value
+        op = node.op.value
+
+        if op == "=":
+            self.expression(node.value)
+            self.token = node.identifier
+            self.store(name)
+            return
+
+        # Compound assignment: "+=" applies "+"
+        binary_op = op[:-1]
+        if binary_op not in BINARY_OP_INDEX:
+            raise self.error(f"Operator '{op}' is not supported", node)
+
+        op_index = BINARY_OP_INDEX[binary_op]
+        slot = self.local_slot(name)
+
+        # The variable is read before the value is evaluated, so an
+        # unassigned one fails first whatever the value would raise
+        operand = self.operand(node.value)
+        if operand is None:
+            self.token = node.identifier
+            self.load(name)
+            self.expression(node.value)
+            self.token = node.op
+            self.emit(UPDATE_SLOT_TOP, (slot, op_index))
+        else:
+            self.token = node.op
+            self.emit(UPDATE_SLOT, (slot, op_index, operand), (node.identifier, None, operand_token(node.value)))
+
+    def visit_InputStmtNode(self, node):
+        self.expression(node.value)
+        self.token = node.identifier
+        self.emit(INPUT)
+        self.store(node.identifier.value)
+
+    def visit_OutputStmtNode(self, node):
+        self.expression(node.output)
+        self.emit(OUTPUT)
+
+    def visit_ConditionalStmtNode(self, node):
+        # Each case jumps over the next ones once its body has run
+        ends = []
+        for idx, (condition, body) in enumerate(node.cases):
+            skip = self.condition(condition)
+            self.statements(body)
+            if idx < len(node.cases) - 1 or node.else_case:
+                ends.append(self.emit(JUMP))
+            self.patch(skip)
+
+        if node.else_case:
+            self.statements(node.else_case)
+        for end in ends:
+            self.patch(end)
+
+    def visit_WhileStmtNode(self, node):
+        start = len(self.instructions)
+
+        # while (true) needs no test
+        condition = node.condition
+        skip = None
+        if not (isinstance(condition, LITERAL_NODES) and constant_value(condition)):
+            skip = self.condition(condition)
+
+        self.statements(node.body)
+        self.emit(JUMP, start)
+        if skip is not None:
+            self.patch(skip)
+
+    def visit_ForStmtNode(self, node):
+        # arr is a list, or the token of the variable holding one
+        if isinstance(node.arr, Token):
+            self.token = node.arr
+            self.load(node.arr.value)
+        else:
+            self.expression(node.arr)
+
+        # A value that cannot be looped over is reported at the variable
+        # holding it (list literals always can be)
+        self.emit(GET_ITER)
+        self.token = node.loop_var
+        start = self.emit(FOR_ITER, (self.local_slot(node.loop_var.value), None))
+        self.statements(node.body)
+        self.emit(JUMP, start)
+        self.patch(start)
+
+    def visit_FunctionDefNode(self, node):
+        name = node.identifier.value
+        params = [param.value for param in node.params]
+        if len(set(params)) != len(params):
+            raise self.error(f"Duplicate parameter in function '{name}'", node)
+
+        local_names = params + [local for local in assigned_names(node.body) if local not in params]
+        compiler = Compiler(name, len(params), local_names, self.global_names, self.global_slots)
+        compiler.token = node.identifier
+        compiler.statements(node.body)
+        compiler.emit(LOAD_SLOT, compiler.constant(None))
+        compiler.emit(RETURN)
+
+        self.token = node.identifier
+        self.emit(MAKE_FUNCTION, self.constant(compiler.code()))
+        self.store(name)
+
+    def visit_ReturnStmtNode(self, node):
+        if self.local_names is None:
+            raise self.error("'return' outside a function", node)
+
+        self.expression(node.value)
+        self.emit(RETURN)
+
+    def generic_visit(self, node):
+        keyword = UNSUPPORTED_STATEMENTS.get(node.__class__)
+        if keyword is not None:
+            raise self.error(f"'{keyword}' statements cannot be run yet", node)
+        raise self.error(f"{node.__class__.__name__} cannot be compiled", node)
+
+    # Expressions
+    def visit_literal(self, node):
+        self.token = node.token
+        self.emit(LOAD_SLOT, self.constant(constant_value(node)))
+
+    visit_ConstantNode = visit_NumberNode = visit_StringNode = visit_BoolNode = visit_NullNode = visit_literal
+
+    def visit_IdentifierNode(self, node):
+        self.token = node.token
+        self.load(node.token.value)
+
+    def visit_ListNode(self, node):
+        for element in node.elements:
+            self.expression(element)
+        self.emit(BUILD_LIST, len(node.elements))
+
+    def visit_BinaryOpNode(self, node):
+        op = node.op_token.value
+
+        # "and" and "or" only evaluate their right side when they need it
+        if op in ("and", "or"):
+            self.expression(node.left_node)
+            self.token = node.op_token
+            jump = self.emit(JUMP_IF_FALSE_OR_POP if op == "and" else JUMP_IF_TRUE_OR_POP)
+            self.expression(node.right_node)
+            self.patch(jump)
+            return
+
+        if op not in BINARY_OP_INDEX:
+            raise self.error(f"Operator '{op}' is not supported", node)
+
+        # Constant and local operands are part of the instruction
+        left = self.operand(node.left_node)
+        right = self.operand(node.right_node)
+        if right is None:
+            self.expression(node.left_node)
+            self.expression(node.right_node)
+            self.token = node.op_token
+            self.binary(op)
+        elif left is None:
+            self.expression(node.left_node)
+            self.token = node.op_token
+            self.emit(BINARY_SLOT, (BINARY_OP_INDEX[op], right), (None, operand_token(node.right_node)))
+        else:
+            self.token = node.op_token
+            self.emit(SLOT_BINARY, (left, BINARY_OP_INDEX[op], right),
+                      (operand_token(node.left_node), None, operand_token(node.right_node)))
+
+    def binary(self, op):
+        if op == "+":
+            self.emit(BINARY_ADD)
+        else:
+            self.emit(BINARY_OP, BINARY_OP_INDEX[op])
+
+    def visit_UnaryOpNode(self, node):
+        self.expression(node.node)
+        self.token = node.op_token
+        self.emit(UNARY_OPCODES[node.op_token.value])
+
+    def visit_FunctionCallNode(self, node):
+        self.expression(node.atom)
+        for arg in node.args:
+            self.expression(arg)
+        self.token = first_token(node.atom) or self.token
+        self.emit(CALL, len(node.args))
+
+
+def compile_program(statements, name="<program>"):
+    # Code of the statements of a parse without errors. Raises
+    # CompilerPanic for statements the virtual machine cannot run
+    for node in walk(statements):
+        if node.__class__ is ErrorNode:
+            raise ValueError("Parse trees with errors cannot be compiled")
+
+    global_names = program_names(statements)
+    global_slots = {name: idx for idx, name in enumerate(global_names)}
+    compiler = Compiler(name, 0, None, global_names, global_slots)
+    for statement in statements:
+        # The compiler recurses into nested blocks and expressions
+        try:
+            compiler.statements([statement])
+        except RecursionError:
+            token = first_token(statement)
+            raise CompilerPanic(CompileError(token.start_pos, token.end_pos, "Statement is nested too deep to compile")) from None
+
+    compiler.emit(LOAD_SLOT, compiler.constant(None))
+    compiler.emit(RETURN)
+    return compiler.code()
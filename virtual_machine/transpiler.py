@@ -0,0 +1,540 @@
+import ast
+import marshal
+import re
+import sys
+import zlib
+from types import CodeType, FunctionType
+
+from lexical_analyzer.lexer import Lexer
+from lexical_analyzer.position import LineIndex
+from lexical_analyzer.token import Token
+from syntax_analyzer.folding import fold_constants
+from syntax_analyzer.nodes import *
+from syntax_analyzer.parser import Parser
+from syntax_analyzer.visitor import NodeVisitor, walk
+from utils.error import CompileError, ExecutionError
+from virtual_machine.compiler import (
+    COMPARISON_OPS, EXPRESSION_NODES, UNSUPPORTED_STATEMENTS, CompilerPanic,
+    assigned_names, constant_value, first_token,
+)
+from virtual_machine.vm import MAX_CALL_DEPTH, VMPanic, display, type_name
+
+# The other way to run a program: transpile(statements) turns the parse
+# tree into a Python ast.Module, which Python compiles to a code object
+# run at CPython's own speed. Programs behave as on the virtual machine
+# (same scoping, operators and output); runtime errors are reported at
+# the .otto token they came from, since every ast node carries the
+# line and column of its token, with the VM's messages. load_program
+# caches the code objects (see CodeCache in utils/cache.py), so an
+# unchanged script is not even lexed again
+
+# Otto identifiers Python cannot use as names. They get a quote, which no
+# Otto identifier has
+RESERVED_NAMES = {"None", "True", "False", "__debug__"}
+
+BINARY_OPS = {
+    "+": ast.Add,
+    "-": ast.Sub,
+    "*": ast.Mult,
+    "/": ast.Div,
+    "//": ast.FloorDiv,
+    "%": ast.Mod,
+    "**": ast.Pow,
+}
+COMPARE_OPS = {
+    "<": ast.Lt,
+    ">": ast.Gt,
+    "<=": ast.LtE,
+    ">=": ast.GtE,
+    "==": ast.Eq,
+    "!=": ast.NotEq,
+}
+UNARY_OPS = {"not": ast.Not, "-": ast.USub, "+": ast.UAdd}
+
+# Hidden first parameter of transpiled functions: how many calls deep
+# they run, as the VM counts its frames. No Otto name has a quote
+DEPTH_NAME = "depth'"
+TOO_DEEP_NAME = "CallsTooDeep'"
+
+# Python's iter(), called on the variable a loop runs over: Python places
+# the iteration of a for statement at its target or its iterable
+# depending on the version, the VM places it at the variable
+ITER_NAME = "iter'"
+
+# Global holding the operands table of a program (see Transpiler.record),
+# and the prefix of the temporaries operand values are kept in
+OPERANDS_NAME = "operands'"
+TEMPORARY_PREFIX = "operand'"
+
+# Frames utter() and input() may take on top of the deepest call
+PYTHON_FRAMES = 100
+
+
+class CallsTooDeep(Exception):
+    # Raised by a transpiled function called deeper than MAX_CALL_DEPTH
+    # levels, reported at the call like on the VM
+    pass
+
+
+# Python exceptions a program can raise, reported as runtime errors
+RUNTIME_EXCEPTIONS = (NameError, TypeError, ArithmeticError, ValueError, RecursionError, EOFError, CallsTooDeep)
+
+# CPython's TypeError messages, and the VM's for the same errors, for the
+# errors of instructions without operands table entries (e.g. the iter()
+# of a loop). Groups are Python type names
+TYPE_ERRORS = (
+    (re.compile(r"'(\w+)' object is not iterable"),
+     "Cannot loop over a value of type {0}"),
+)
+
+# Python type names as Otto calls them
+TYPE_NAMES = {"str": "string", "NoneType": "null"}
+
+# Name of the variable in an UnboundLocalError, which has no name attribute
+UNBOUND_LOCAL = re.compile(r"local variable '(.+?)'")
+
+
+def python_name(name):
+    return name + "'" if name in RESERVED_NAMES else name
+
+
+def otto_name(name):
+    return name[:-1] if name.endswith("'") else name
+
+
+def located(node, token):
+    # node, placed at token. Nodes without a token (e.g.
+    # an empty list) get the position of their parent in transpile()
+    if token is None:
+        return node
+
+    start = token.start_pos
+    end = token.end_pos
+    node.lineno = start.ln + 1
+    node.col_offset = start.col
+    node.end_lineno = end.ln + 1
+    node.end_col_offset = end.col
+    return node
+
+
+def read_names(body):
+    # Names a function body reads, not looking into nested defs
+    names = {}
+    stack = list(body)
+    while stack:
+        node = stack.pop()
+
+        if node.__class__ is FunctionDefNode:
+            continue
+        if node.__class__ is IdentifierNode:
+            names[node.token.value] = None
+        elif node.__class__ is ForStmtNode and isinstance(node.arr, Token):
+            names[node.arr.value] = None
+        stack.extend(node.children())
+
+    return names
+
+
+class Transpiler(NodeVisitor):
+    # visit() returns the Python ast of a node: a statement or a list of
+    # them for statements, an expression for expressions
+    def __init__(self):
+        self.in_function = False
+
+        # Operands table: position of each operator and call to what its
+        # operands are, so its TypeErrors are described from their values
+        self.operands = {}
+        self.operand_depth = 0
+
+        # First token of the statement being transpiled, where errors at
+        # nodes without a token of their own are reported, as by Compiler
+        self.token = None
+
+    def error(self, message, node):
+        token = first_token(node) or self.token
+        return CompilerPanic(CompileError(token.start_pos, token.end_pos, message))
+
+    # Statements
+    def block(self, body, token):
+        # Python blocks cannot be empty
+        statements = []
+        for statement in body:
+            self.token = first_token(statement) or self.token
+            if isinstance(statement, EXPRESSION_NODES):
+                statements.append(located(ast.Expr(self.visit(statement)), first_token(statement)))
+            else:
+                statements.append(self.visit(statement))
+        return statements or [located(ast.Pass(), token)]
+
+    def expression(self, node):
+        if not isinstance(node, EXPRESSION_NODES):
+            raise self.error("Expected an expression", node)
+        return self.visit(node)
+
+    def name(self, token, context):
+        return located(ast.Name(python_name(token.value), context()), token)
+
+    def operand(self, node, side):
+        # (ast, operand) of the left or right operand of an operator or
+        # call. The operand is ("value", constant), or ("name", name) of the
+        # variable holding its value: an expression stores its value in a
+        # temporary. Named by depth and side, a temporary is only reused by
+        # operators that run after the one reading it
+        self.operand_depth += 1
+        expression = self.expression(node)
+        self.operand_depth -= 1
+        if expression.__class__ is ast.Name:
+            return expression, ("name", expression.id)
+        if expression.__class__ is ast.Constant:
+            return expression, ("value", expression.value)
+
+        name = f"{TEMPORARY_PREFIX}{self.operand_depth}{side}"
+        return ast.copy_location(ast.NamedExpr(ast.Name(name, ast.Store()), expression), expression), ("name", name)
+
+    def record(self, node, token, *entry):
+        # node, placed at token, the instruction of its position described
+        # by entry: (kind, lexeme or argument count, operands...)
+        start = token.start_pos
+        end = token.end_pos
+        self.operands[(start.ln + 1, end.ln + 1, start.col, end.col)] = entry
+        return located(node, token)
+
+    def visit_AssignStmtNode(self, node):
+        value = self.expression(node.value)
+
+        # Compound assignment: "+=" applies "+". Not an AugAssign, which
+        # would extend lists in place where the VM makes a new one
+        op = node.op.value
+        if op != "=":
+            if op[:-1] not in BINARY_OPS:
+                raise self.error(f"Operator '{op}' is not supported", node)
+            value, right = self.operand(node.value, "r")
+            target = self.name(node.identifier, ast.Load)
+            value = self.record(ast.BinOp(target, BINARY_OPS[op[:-1]](), value), node.op,
+                                "binary", op[:-1], ("name", target.id), right)
+
+        return located(ast.Assign([self.name(node.identifier, ast.Store)], value), node.identifier)
+
+    def visit_InputStmtNode(self, node):
+        value = located(ast.Call(located(ast.Name("input", ast.Load()), node.identifier),
+                                 [self.expression(node.value)], []), node.identifier)
+        return located(ast.Assign([self.name(node.identifier, ast.Store)], value), node.identifier)
+
+    def visit_OutputStmtNode(self, node):
+        token = first_token(node)
+        call = located(ast.Call(located(ast.Name("utter", ast.Load()), token), [self.expression(node.output)], []), token)
+        return located(ast.Expr(call), token)
+
+    def visit_ConditionalStmtNode(self, node):
+        # Visited in source order, so the first compile error is reported
+        # as on the VM, then nested from the last elif
+        token = first_token(node)
+        cases = [(self.expression(condition), self.block(body, token), first_token(condition))
+                 for condition, body in node.cases]
+        orelse = self.block(node.else_case, token) if node.else_case else []
+        for test, body, condition_token in reversed(cases):
+            orelse = [located(ast.If(test, body, orelse), condition_token)]
+        return orelse[0]
+
+    def visit_WhileStmtNode(self, node):
+        token = first_token(node)
+        return located(ast.While(self.expression(node.condition), self.block(node.body, token), []), token)
+
+    def visit_ForStmtNode(self, node):
+        # arr is a list, or the token of the variable holding one (list
+        # literals can always be looped over)
+        if isinstance(node.arr, Token):
+            iterable = located(ast.Call(located(ast.Name(ITER_NAME, ast.Load()), node.arr),
+                                        [self.name(node.arr, ast.Load)], []), node.arr)
+        else:
+            iterable = self.expression(node.arr)
+        return located(ast.For(self.name(node.loop_var, ast.Store), iterable,
+                               self.block(node.body, node.loop_var), []), node.loop_var)
+
+    def visit_FunctionDefNode(self, node):
+        name = node.identifier.value
+        params = [param.value for param in node.params]
+        if len(set(params)) != len(params):
+            raise self.error(f"Duplicate parameter in function '{name}'", node)
+
+        in_function = self.in_function
+        self.in_function = True
+        try:
+            body = self.block(node.body, node.identifier)
+        finally:
+            self.in_function = in_function
+
+        # Names it reads without assigning are globals, not the locals of
+        # an enclosing function (the VM has no closures)
+        local_names = set(params).union(assigned_names(node.body))
+        global_names = [python_name(read) for read in read_names(node.body) if read not in local_names]
+        too_deep = ast.Compare(ast.Name(DEPTH_NAME, ast.Load()), [ast.Gt()], [ast.Constant(MAX_CALL_DEPTH)])
+        body.insert(0, located(ast.If(too_deep, [ast.Raise(ast.Name(TOO_DEEP_NAME, ast.Load()))], []), node.identifier))
+        if global_names:
+            body.insert(0, located(ast.Global(global_names), node.identifier))
+
+        params = [located(ast.arg(python_name(param.value)), param) for param in node.params]
+        args = ast.arguments([], [ast.arg(DEPTH_NAME)] + params, None, [], [], None, [])
+        return located(ast.FunctionDef(python_name(name), args, body, [], None, None, []), node.identifier)
+
+    def visit_ReturnStmtNode(self, node):
+        if not self.in_function:
+            raise self.error("'return' outside a function", node)
+        return located(ast.Return(self.expression(node.value)), first_token(node))
+
+    def generic_visit(self, node):
+        keyword = UNSUPPORTED_STATEMENTS.get(node.__class__)
+        if keyword is not None:
+            raise self.error(f"'{keyword}' statements cannot be run yet", node)
+        raise self.error(f"{node.__class__.__name__} cannot be compiled", node)
+
+    # Expressions
+    def visit_literal(self, node):
+        return located(ast.Constant(constant_value(node)), node.token)
+
+    visit_ConstantNode = visit_NumberNode = visit_StringNode = visit_BoolNode = visit_NullNode = visit_literal
+
+    def visit_IdentifierNode(self, node):
+        return self.name(node.token, ast.Load)
+
+    def visit_ListNode(self, node):
+        elements = [self.expression(element) for element in node.elements]
+        return located(ast.List(elements, ast.Load()), first_token(node))
+
+    def visit_BinaryOpNode(self, node):
+        # Placed at the operator, where the VM reports its errors
+        op = node.op_token.value
+        if op in ("and", "or"):
+            left = self.expression(node.left_node)
+            right = self.expression(node.right_node)
+            return located(ast.BoolOp(ast.And() if op == "and" else ast.Or(), [left, right]), node.op_token)
+
+        if op not in COMPARISON_OPS and op not in BINARY_OPS:
+            raise self.error(f"Operator '{op}' is not supported", node)
+        left, left_operand = self.operand(node.left_node, "l")
+        right, right_operand = self.operand(node.right_node, "r")
+        if op in COMPARISON_OPS:
+            expression = ast.Compare(left, [COMPARE_OPS[op]()], [right])
+        else:
+            expression = ast.BinOp(left, BINARY_OPS[op](), right)
+        return self.record(expression, node.op_token, "binary", op, left_operand, right_operand)
+
+    def visit_UnaryOpNode(self, node):
+        op = node.op_token.value
+        expression, operand = self.operand(node.node, "r")
+        return self.record(ast.UnaryOp(UNARY_OPS[op](), expression), node.op_token, "unary", op, operand)
+
+    def visit_FunctionCallNode(self, node):
+        # Calls from the program run 1 deep, calls from a function one
+        # deeper than it
+        token = first_token(node.atom)
+        if self.in_function:
+            depth = ast.BinOp(ast.Name(DEPTH_NAME, ast.Load()), ast.Add(), ast.Constant(1))
+        else:
+            depth = ast.Constant(1)
+        args = [located(depth, token)] + [self.expression(arg) for arg in node.args]
+        function, operand = self.operand(node.atom, "l")
+        return self.record(ast.Call(function, args, []), token, "call", len(node.args), operand)
+
+
+def transpile(statements):
+    # Python ast.Module of the statements of a parse without errors.
+    # Raises CompilerPanic for statements that cannot be run
+    for node in walk(statements):
+        if node.__class__ is ErrorNode:
+            raise ValueError("Parse trees with errors cannot be compiled")
+
+    transpiler = Transpiler()
+    body = []
+    for statement in statements:
+        # The transpiler recurses into nested blocks and expressions
+        try:
+            body.extend(transpiler.block([statement], None))
+        except RecursionError:
+            token = first_token(statement)
+            raise CompilerPanic(CompileError(token.start_pos, token.end_pos, "Statement is nested too deep to compile")) from None
+
+    # The operands table is a constant of the code, so it is cached with it.
+    # Compressed, loading the code does not build its tuples
+    operands = ast.Constant(zlib.compress(marshal.dumps(transpiler.operands)))
+    body.insert(0, ast.Assign([ast.Name(OPERANDS_NAME, ast.Store())], operands))
+    return ast.fix_missing_locations(ast.Module(body, []))
+
+
+def compile_python(statements, file_name):
+    # Code object of the statements, file_name names the source in it
+    module = transpile(statements)
+
+    try:
+        return compile(module, file_name, "exec", dont_inherit=True)
+    except (SyntaxError, RecursionError, MemoryError) as exception:
+        # e.g. more nested loops than Python allows
+        token = first_token(statements)
+        source = token.source
+        if isinstance(exception, SyntaxError) and exception.lineno is not None:
+            position = source.position(source.offset(exception.lineno - 1, max((exception.offset or 1) - 1, 0)))
+        else:
+            position = token.start_pos
+
+        message = exception.msg if isinstance(exception, SyntaxError) else "program is nested too deep to compile"
+        raise CompilerPanic(CompileError(position, position, message[0].upper() + message[1:])) from None
+
+
+def load_program(source, file_name, cache=None):
+    # (code object, parse errors) of a program's source text. The code is
+    # None if there are errors. With a CodeCache, an unchanged source is
+    # loaded from it instead of being lexed, parsed and compiled. Raises
+    # CompilerPanic as compile_python does
+    if cache is not None:
+        key = cache.key(source.encode("utf-8"), file_name)
+        code = cache.get(key)
+        if isinstance(code, CodeType):
+            return code, []
+
+    parser = Parser(Lexer(file_name, source).tokenize())
+    statements = parser.otto_progstmt()
+    if parser.errors:
+        return None, parser.errors
+
+    code = compile_python(fold_constants(statements), file_name)
+    if cache is not None:
+        cache.put(key, code)
+    return code, []
+
+
+def value_text(value):
+    # display() text of a value of a transpiled program, whose functions
+    # are Python ones: shown as the VM shows its own
+    if value.__class__ is FunctionType:
+        return f"<function {otto_name(value.__name__)}>"
+    return str(value)
+
+
+def frame_depth():
+    # Python frames on the stack of the caller
+    frame = sys._getframe(1)
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+def run_python(code, source, output=print, input=input):
+    # Runs the code object of a program whose source text is source,
+    # raises VMPanic if it fails. output and input are as for VM
+    def utter(value):
+        output(display(value, value_text))
+
+    def read_line(prompt):
+        return input(display(prompt, value_text))
+
+    # Otto names never reach Python's builtins, and "utter" and "input"
+    # are keywords in Otto, so no program variable hides them
+    namespace = {"__builtins__": {"utter": utter, "input": read_line, ITER_NAME: iter, TOO_DEEP_NAME: CallsTooDeep}}
+
+    # Functions count their calls themselves (see DEPTH_NAME), Python's
+    # recursion limit only has to leave room for them. Calls between
+    # Python functions do not use the C stack, so this is safe
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursion_limit, frame_depth() + MAX_CALL_DEPTH + PYTHON_FRAMES))
+    try:
+        exec(code, namespace)
+    except RUNTIME_EXCEPTIONS as exception:
+        raise VMPanic(runtime_error(exception, code.co_filename, source)) from None
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+
+
+def runtime_error(exception, file_name, source):
+    # ExecutionError of an exception raised running a program, at the
+    # token the innermost frame of the program was running (its caller's
+    # for CallsTooDeep, raised by the function called)
+    last = caller = None
+    traceback = exception.__traceback__
+    while traceback is not None:
+        if traceback.tb_frame.f_code.co_filename == file_name:
+            last, caller = traceback, last
+        traceback = traceback.tb_next
+    if isinstance(exception, CallsTooDeep):
+        last = caller
+
+    # (line, end line, column, end column) of the failing instruction
+    position = None
+    if last is not None:
+        position = list(last.tb_frame.f_code.co_positions())[last.tb_lasti // 2]
+        if position[0] is None:
+            position = None
+
+    if isinstance(exception, NameError):
+        name = exception.name
+        if name is None:
+            match = UNBOUND_LOCAL.search(str(exception))
+            name = match.group(1) if match else "?"
+        message = f"'{otto_name(name)}' is not defined"
+    elif isinstance(exception, ZeroDivisionError):
+        message = "Division by zero"
+    elif isinstance(exception, OverflowError):
+        message = "Number too large"
+    elif isinstance(exception, (RecursionError, CallsTooDeep)):
+        message = f"Calls nested deeper than {MAX_CALL_DEPTH} levels"
+    elif isinstance(exception, EOFError):
+        message = "No input left to read"
+    elif isinstance(exception, TypeError):
+        message = None
+        if position is not None:
+            operands = marshal.loads(zlib.decompress(last.tb_frame.f_globals[OPERANDS_NAME]))
+            entry = operands.get(position)
+            if entry is not None:
+                message = describe_type_error(entry, last.tb_frame)
+        if message is None:
+            message = type_error_message(str(exception))
+    else:
+        message = str(exception)
+
+    index = LineIndex(file_name, source)
+    start = end = index.position(0)
+    if position is not None:
+        line, end_line, col, end_col = position
+        start = index.position(index.offset(line - 1, col or 0))
+        end = index.position(index.offset((end_line or line) - 1, end_col or 0))
+
+    return ExecutionError(start, end, message)
+
+
+def describe_type_error(entry, frame):
+    # The VM's message (see VM.describe) for a TypeError of the instruction
+    # of an operands table entry, from the values its operands had in frame
+    def value(operand):
+        kind, value = operand
+        if kind == "value":
+            return value
+        if value in frame.f_locals:
+            return frame.f_locals[value]
+        return frame.f_globals[value]
+
+    try:
+        kind, detail, *operands = entry
+        values = [value(operand) for operand in operands]
+    except KeyError:
+        return None
+
+    if kind == "call":
+        function = values[0]
+        if function.__class__ is not FunctionType:
+            return f"Value of type {type_name(function)} is not a function"
+        # Less the hidden depth argument
+        name = otto_name(function.__name__)
+        return f"{name}() takes {function.__code__.co_argcount - 1} arguments, {detail} given"
+    if kind == "unary":
+        return f"Operator '{detail}' cannot be applied to {type_name(values[0])}"
+    return f"Operator '{detail}' cannot be applied to {type_name(values[0])} and {type_name(values[1])}"
+
+
+def type_error_message(message):
+    # The VM's wording of a CPython TypeError message, when it has one
+    for pattern, template in TYPE_ERRORS:
+        match = pattern.fullmatch(message)
+        if match is not None:
+            return template.format(*(TYPE_NAMES.get(group, otto_name(group)) for group in match.groups()))
+    return message
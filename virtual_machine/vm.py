@@ -0,0 +1,303 @@
+from utils.error import ExecutionError
+from virtual_machine.bytecode import *
+
+# Runs the bytecode of compiler.py. The dispatch loop is one function
+# whose state (instructions, stack, slots) lives in local variables: the
+# most common opcodes are tested first, and calls and returns switch
+# frames in the loop instead of recursing, so programs recurse as deep as
+# MAX_CALL_DEPTH whatever Python's recursion limit is
+
+# Calls deeper than this stop the program
+MAX_CALL_DEPTH = 10000
+
+# Where the operands of an instruction are when it fails: slot operands
+# as (left, right) positions in its argument, None for the left or right
+# variable of the dispatch loop
+OPERANDS = {
+    SLOT_BINARY: (0, 2),
+    SLOT_COMPARE_JUMP: (0, 2),
+    UPDATE_SLOT: (0, 2),
+    BINARY_SLOT: (None, 1),
+    COMPARE_SLOT_JUMP: (None, 1),
+    UPDATE_SLOT_TOP: (None, None),
+    BINARY_ADD: (None, None),
+    BINARY_OP: (None, None),
+    COMPARE_JUMP: (None, None),
+}
+UNARY_LEXEMES = {UNARY_NEG: "-", UNARY_POS: "+", UNARY_NOT: "not"}
+
+
+class VMPanic(Exception):
+    # Raised by VM.run (and transpiler.run_python) with the ExecutionError
+    # that stopped the program
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+
+
+def type_name(value):
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, Function):
+        return "function"
+    return value.__class__.__name__
+
+
+def display(value, text=str):
+    # Text utter() prints for value. Numbers, strings and functions, in
+    # lists too, are shown with text(value)
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, list):
+        return "[" + ", ".join(f'"{item}"' if isinstance(item, str) else display(item, text) for item in value) + "]"
+    return text(value)
+
+
+class VM:
+    # output(text) is called for each utter, input(prompt) for each input
+    # and returns the line read
+    def __init__(self, output=print, input=input):
+        self.output = output
+        self.input = input
+
+    def error(self, code, idx, message, token=None):
+        token = token or code.positions[idx]
+        return VMPanic(ExecutionError(token.start_pos, token.end_pos, message))
+
+    def run(self, code):
+        # Runs the Code of a program, raises VMPanic if it fails
+        output = self.output
+        read_line = self.input
+        binary = BINARY_FUNCTIONS
+        unbound = UNBOUND
+
+        # The program's locals are the globals
+        slots = globals_ = code.slot_tail[:]
+        instructions = code.instructions
+        stack = []
+        push = stack.append
+        pop = stack.pop
+
+        # (code, pc, slots, stack) of the callers
+        frames = []
+        pc = 0
+        left = right = None
+
+        try:
+            while True:
+                op, arg = instructions[pc]
+                pc += 1
+
+                if op == LOAD_SLOT:
+                    value = slots[arg]
+                    if value is unbound:
+                        raise self.error(code, pc - 1, f"'{code.local_names[arg]}' is not defined")
+                    push(value)
+
+                elif op == SLOT_BINARY:
+                    push(binary[arg[1]](slots[arg[0]], slots[arg[2]]))
+
+                elif op == SLOT_COMPARE_JUMP:
+                    if not binary[arg[1]](slots[arg[0]], slots[arg[2]]):
+                        pc = arg[3]
+
+                elif op == STORE_SLOT:
+                    slots[arg] = pop()
+
+                elif op == UPDATE_SLOT:
+                    slot = arg[0]
+                    slots[slot] = binary[arg[1]](slots[slot], slots[arg[2]])
+
+                elif op == JUMP:
+                    pc = arg
+
+                elif op == BINARY_SLOT:
+                    stack[-1] = binary[arg[0]](stack[-1], slots[arg[1]])
+
+                elif op == COMPARE_SLOT_JUMP:
+                    left = pop()
+                    if not binary[arg[0]](left, slots[arg[1]]):
+                        pc = arg[2]
+
+                elif op == UPDATE_SLOT_TOP:
+                    right = pop()
+                    left = pop()
+                    slots[arg[0]] = binary[arg[1]](left, right)
+
+                elif op == FOR_ITER:
+                    value = next(stack[-1], unbound)
+                    if value is unbound:
+                        pop()
+                        pc = arg[1]
+                    else:
+                        slots[arg[0]] = value
+
+                elif op == LOAD_GLOBAL:
+                    value = globals_[arg]
+                    if value is unbound:
+                        raise self.error(code, pc - 1, f"'{code.global_names[arg]}' is not defined")
+                    push(value)
+
+                elif op == CALL:
+                    function = stack[-arg - 1]
+                    if function.__class__ is not Function:
+                        raise self.error(code, pc - 1, f"Value of type {type_name(function)} is not a function")
+
+                    callee = function.code
+                    if arg != callee.param_count:
+                        raise self.error(code, pc - 1, f"{callee.name}() takes {callee.param_count} arguments, {arg} given")
+                    if len(frames) == MAX_CALL_DEPTH:
+                        raise self.error(code, pc - 1, f"Calls nested deeper than {MAX_CALL_DEPTH} levels")
+
+                    # Arguments are the first slots of the callee
+                    callee_slots = stack[len(stack) - arg:]
+                    callee_slots += callee.slot_tail
+                    del stack[-arg - 1:]
+
+                    frames.append((code, pc, slots, stack))
+                    code = callee
+                    instructions = code.instructions
+                    slots = callee_slots
+                    stack = []
+                    push = stack.append
+                    pop = stack.pop
+                    pc = 0
+
+                elif op == RETURN:
+                    value = pop()
+                    if not frames:
+                        return value
+
+                    code, pc, slots, stack = frames.pop()
+                    instructions = code.instructions
+                    push = stack.append
+                    pop = stack.pop
+                    push(value)
+
+                elif op == BINARY_ADD:
+                    right = pop()
+                    left = stack[-1]
+                    stack[-1] = left + right
+
+                elif op == BINARY_OP:
+                    right = pop()
+                    left = stack[-1]
+                    stack[-1] = binary[arg](left, right)
+
+                elif op == COMPARE_JUMP:
+                    right = pop()
+                    left = pop()
+                    if not binary[arg[0]](left, right):
+                        pc = arg[1]
+
+                elif op == JUMP_IF_FALSE:
+                    if not pop():
+                        pc = arg
+
+                elif op == JUMP_IF_FALSE_OR_POP:
+                    if stack[-1]:
+                        pop()
+                    else:
+                        pc = arg
+
+                elif op == JUMP_IF_TRUE_OR_POP:
+                    if stack[-1]:
+                        pc = arg
+                    else:
+                        pop()
+
+                elif op == UNARY_NEG:
+                    right = stack[-1]
+                    stack[-1] = -right
+
+                elif op == UNARY_POS:
+                    right = stack[-1]
+                    stack[-1] = +right
+
+                elif op == UNARY_NOT:
+                    stack[-1] = not stack[-1]
+
+                elif op == POP:
+                    pop()
+
+                elif op == GET_ITER:
+                    right = stack[-1]
+                    stack[-1] = iter(right)
+
+                elif op == BUILD_LIST:
+                    if arg:
+                        items = stack[-arg:]
+                        del stack[-arg:]
+                        push(items)
+                    else:
+                        push([])
+
+                elif op == MAKE_FUNCTION:
+                    push(Function(slots[arg]))
+
+                elif op == OUTPUT:
+                    output(display(pop()))
+
+                elif op == INPUT:
+                    try:
+                        push(read_line(display(pop())))
+                    except EOFError:
+                        raise self.error(code, pc - 1, "No input left to read") from None
+
+                else:
+                    raise self.error(code, pc - 1, f"Unknown opcode {op}")
+
+        # Errors of Python operations, reported at the instruction that failed
+        except (TypeError, ArithmeticError, ValueError) as exception:
+            op, arg = instructions[pc - 1]
+
+            # Slot operands are still in their slots, the others in left
+            # and right. An unassigned variable fails any operator
+            operands = OPERANDS.get(op)
+            if operands is not None:
+                left_at, right_at = operands
+                if left_at is None and op == BINARY_SLOT:
+                    left = stack[-1]
+                for at in operands:
+                    if at is not None and slots[arg[at]] is unbound:
+                        raise self.error(code, pc - 1, f"'{code.local_names[arg[at]]}' is not defined",
+                                         code.operand_positions[pc - 1][at]) from None
+                if left_at is not None:
+                    left = slots[arg[left_at]]
+                if right_at is not None:
+                    right = slots[arg[right_at]]
+
+            raise self.error(code, pc - 1, self.describe(op, arg, exception, left, right)) from None
+
+    def describe(self, op, arg, exception, left, right):
+        # Message for an exception raised running an instruction
+        if isinstance(exception, ZeroDivisionError):
+            return "Division by zero"
+        if isinstance(exception, OverflowError):
+            return "Number too large"
+
+        if isinstance(exception, TypeError):
+            if op in OPERANDS:
+                if op == BINARY_ADD:
+                    lexeme = "+"
+                elif op == BINARY_OP:
+                    lexeme = BINARY_OPS[arg][0]
+                elif op in (SLOT_BINARY, SLOT_COMPARE_JUMP, UPDATE_SLOT, UPDATE_SLOT_TOP):
+                    lexeme = BINARY_OPS[arg[1]][0]
+                else:
+                    lexeme = BINARY_OPS[arg[0]][0]
+                return f"Operator '{lexeme}' cannot be applied to {type_name(left)} and {type_name(right)}"
+            if op in UNARY_LEXEMES:
+                return f"Operator '{UNARY_LEXEMES[op]}' cannot be applied to {type_name(right)}"
+            if op == GET_ITER:
+                return f"Cannot loop over a value of type {type_name(right)}"
+
+        return str(exception)